@@ -0,0 +1,458 @@
+"""Local stand-in for the Synapse REST API.  Only the calls made by
+synapseformation are implemented and everything is kept in memory.
+
+Latency, server errors, throttling and lost 409 races can be injected
+so the retry, rate limiting and conflict paths are exercised."""
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import random
+import re
+from socketserver import ThreadingMixIn
+import threading
+import time
+from urllib.parse import parse_qs, unquote, urlparse
+import uuid
+
+REPO_PREFIX = "/repo/v1"
+PROJECT_TYPE = "org.sagebionetworks.repo.model.Project"
+ROOT_ENTITY = "syn4489"
+PAGE_SIZE = 50
+
+
+class HTTPError(Exception):
+    """Error response of the mock server"""
+    def __init__(self, status_code: int, reason: str, headers: dict = None):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers or {}
+
+
+class MockSynapse:
+    """In memory entities, ACLs, teams, invitations, challenges and
+    evaluation queues"""
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, throttle_rate: float = 0.0,
+                 retry_after: float = None, conflict_rate: float = 0.0,
+                 seed: int = None):
+        """
+        Args:
+            latency: Seconds added to every request
+            jitter: Maximum random seconds added to the latency
+            error_rate: Fraction of requests answered with a 503
+            throttle_rate: Fraction of requests answered with a 429
+            retry_after: Retry-After seconds of 429 and 503 responses
+            conflict_rate: Fraction of entity creations that store the
+                           entity but answer with a 409, as if another
+                           client created it first
+            seed: Seed of the injected failures
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.conflict_rate = conflict_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._next_id = 10000
+        self._changes = 0
+        self.entities = {}
+        self.children = {}
+        self.acls = {}
+        self.teams = {}
+        self.users = {}
+        self.invitations = {}
+        self.challenges = {}
+        self.evaluations = {}
+        self.calls = Counter()
+        self.injected = Counter()
+
+    def _new_id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    def _modified_on(self) -> str:
+        """Timestamp of a change, unique across changes"""
+        self._changes += 1
+        return f"2020-01-01T00:00:00.{self._changes:06d}Z"
+
+    def _maybe_fail(self):
+        roll = self._random.random()
+        headers = ({'Retry-After': str(self.retry_after)}
+                   if self.retry_after is not None else {})
+        if roll < self.throttle_rate:
+            self.injected['429'] += 1
+            raise HTTPError(429, "Too many requests", headers)
+        if roll < self.throttle_rate + self.error_rate:
+            self.injected['503'] += 1
+            raise HTTPError(503, "Service unavailable", headers)
+
+    def handle(self, method: str, path: str, query: dict, body: dict):
+        """Answers a request
+
+        Args:
+            method: HTTP method
+            path: Path without the repo prefix
+            query: Parsed query string
+            body: Parsed JSON body
+
+        Returns:
+            JSON response body
+        """
+        delay = self.latency + self._random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+        for route_method, pattern, name in ROUTES:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                with self._lock:
+                    self.calls[f"{method} {name}"] += 1
+                    self._maybe_fail()
+                    return getattr(self, name)(*match.groups(),
+                                               query=query, body=body)
+        raise HTTPError(404, f"No route for {method} {path}")
+
+    def _entity(self, entityid: str) -> dict:
+        entity = self.entities.get(entityid)
+        if entity is None:
+            raise HTTPError(404, f"Entity {entityid} not found")
+        return entity
+
+    def _existing(self, body: dict) -> dict:
+        """Entity with the name and parent of a new entity, if any"""
+        siblings = self.children.get(body.get('parentId') or ROOT_ENTITY,
+                                     {})
+        entityid = siblings.get(body['name'])
+        return self.entities[entityid] if entityid is not None else None
+
+    def _store(self, body: dict) -> dict:
+        parentid = body.get('parentId') or ROOT_ENTITY
+        siblings = self.children.setdefault(parentid, {})
+        entity = dict(body, id=f"syn{self._new_id()}", parentId=parentid,
+                      etag=str(uuid.uuid4()), versionNumber=1,
+                      modifiedOn=self._modified_on())
+        self.entities[entity['id']] = entity
+        siblings[entity['name']] = entity['id']
+        if entity['concreteType'] == PROJECT_TYPE:
+            # Projects are the benefactor of their children
+            self.acls[entity['id']] = {
+                'id': entity['id'], 'etag': str(uuid.uuid4()),
+                'resourceAccess': [{'principalId': 1,
+                                    'accessType': ['READ', 'UPDATE']}]
+            }
+        return entity
+
+    def create_entity(self, query, body):
+        if self._existing(body) is not None:
+            raise HTTPError(409, f"An entity with the name: {body['name']} "
+                                 "already exists")
+        entity = self._store(body)
+        if self._random.random() < self.conflict_rate:
+            self.injected['409'] += 1
+            raise HTTPError(409, f"An entity with the name: {body['name']} "
+                                 "already exists")
+        return entity
+
+    def create_batch(self, query, body):
+        """Transactional batch creation, which Synapse doesn't have.
+        Existing entities are returned with getExisting and otherwise
+        fail the whole batch."""
+        existing = [self._existing(entity) for entity in body['list']]
+        if not body.get('getExisting'):
+            for entity, found in zip(body['list'], existing):
+                if found is not None:
+                    raise HTTPError(409, "An entity with the name: "
+                                         f"{entity['name']} already exists")
+        return {'list': [
+            {'entity': found, 'created': False} if found is not None
+            else {'entity': self._store(entity), 'created': True}
+            for entity, found in zip(body['list'], existing)
+        ]}
+
+    def get_entity(self, entityid, query, body):
+        return self._entity(entityid)
+
+    def get_bundle(self, entityid, query, body):
+        entity = self._entity(entityid)
+        return {'entity': entity,
+                'annotations': {'id': entityid, 'etag': entity['etag'],
+                                'annotations': {}},
+                'fileHandles': [],
+                'restrictionInformation': {
+                    'hasUnmetAccessRequirement': False
+                }}
+
+    def put_annotations(self, entityid, query, body):
+        entity = self._entity(entityid)
+        entity['etag'] = str(uuid.uuid4())
+        entity['modifiedOn'] = self._modified_on()
+        return {'id': entityid, 'etag': entity['etag'],
+                'annotations': body.get('annotations', {})}
+
+    def entity_headers(self, query, body):
+        """Headers of the entities by id, leaving out missing ones"""
+        return {'results': [
+            {'id': entity['id'], 'name': entity['name'],
+             'type': entity['concreteType'],
+             'modifiedOn': entity['modifiedOn']}
+            for entity in (self.entities.get(reference['targetId'])
+                           for reference in body['references'])
+            if entity is not None
+        ]}
+
+    def find_child(self, query, body):
+        parentid = body.get('parentId') or ROOT_ENTITY
+        entityid = self.children.get(parentid, {}).get(body['entityName'])
+        if entityid is None:
+            raise HTTPError(404, "Entity not found")
+        return {'id': entityid}
+
+    def list_children(self, query, body):
+        self._entity(body['parentId'])
+        names = sorted(self.children.get(body['parentId'], {}))
+        offset = int(body.get('nextPageToken') or 0)
+        page = [self.entities[self.children[body['parentId']][name]]
+                for name in names[offset:offset + PAGE_SIZE]]
+        next_token = (str(offset + PAGE_SIZE)
+                      if offset + PAGE_SIZE < len(names) else None)
+        return {'page': [{'id': child['id'], 'name': child['name'],
+                          'type': child['concreteType'],
+                          'versionNumber': child['versionNumber'],
+                          'benefactorId': self._benefactor(child['id'])}
+                         for child in page],
+                'nextPageToken': next_token}
+
+    def _benefactor(self, entityid: str) -> str:
+        while entityid not in self.acls:
+            entityid = self._entity(entityid)['parentId']
+        return entityid
+
+    def get_benefactor(self, entityid, query, body):
+        self._entity(entityid)
+        return {'id': self._benefactor(entityid)}
+
+    def get_acl(self, entityid, query, body):
+        self._entity(entityid)
+        acl = self.acls.get(entityid)
+        if acl is None:
+            raise HTTPError(404, "The entity inherits its ACL")
+        return acl
+
+    def create_acl(self, entityid, query, body):
+        self._entity(entityid)
+        if entityid in self.acls:
+            raise HTTPError(409, "The entity already has an ACL")
+        self.acls[entityid] = dict(body, id=entityid, etag=str(uuid.uuid4()))
+        return self.acls[entityid]
+
+    def update_acl(self, entityid, query, body):
+        self.get_acl(entityid, query, body)
+        self.acls[entityid] = dict(body, id=entityid, etag=str(uuid.uuid4()))
+        return self.acls[entityid]
+
+    def create_team(self, query, body):
+        if any(team['name'] == body['name'] for team in self.teams.values()):
+            raise HTTPError(409, f"Team {body['name']} already exists")
+        team = dict(body, id=str(self._new_id()), etag=str(uuid.uuid4()))
+        self.teams[team['id']] = team
+        return team
+
+    def get_team(self, teamid, query, body):
+        team = self.teams.get(teamid)
+        if team is None:
+            raise HTTPError(404, f"Team {teamid} not found")
+        return team
+
+    def team_list(self, query, body):
+        return {'list': [self.teams[str(teamid)] for teamid in body['list']
+                         if str(teamid) in self.teams]}
+
+    @staticmethod
+    def _page(results: list, query: dict) -> dict:
+        limit = int(query.get('limit', ['20'])[0])
+        offset = int(query.get('offset', ['0'])[0])
+        return {'results': results[offset:offset + limit],
+                'totalNumberOfResults': len(results)}
+
+    def find_teams(self, query, body):
+        fragment = query.get('fragment', [''])[0].lower()
+        return self._page([team for team in self.teams.values()
+                           if team['name'].lower().startswith(fragment)],
+                          query)
+
+    def resolve_aliases(self, query, body):
+        """Headers of the teams named by aliases.  Other aliases are
+        answered as users, so templates can name any user."""
+        teams = {team['name'].lower(): team for team in self.teams.values()}
+        headers = []
+        for alias in body['list']:
+            team = teams.get(alias.lower())
+            if team is not None:
+                headers.append({'ownerId': team['id'], 'userName': alias,
+                                'isIndividual': False})
+                continue
+            userid = self.users.setdefault(alias.lower(),
+                                           str(self._new_id()))
+            headers.append({'ownerId': userid, 'userName': alias,
+                            'isIndividual': True})
+        return {'list': headers}
+
+    def team_members(self, teamid, query, body):
+        self.get_team(teamid, query, body)
+        return self._page([], query)
+
+    def open_invitations(self, teamid, query, body):
+        self.get_team(teamid, query, body)
+        return self._page([invitation
+                           for invitation in self.invitations.values()
+                           if invitation['teamId'] == teamid], query)
+
+    def create_invitation(self, query, body):
+        self.get_team(body['teamId'], query, body)
+        invitation = dict(body, id=str(self._new_id()))
+        self.invitations[invitation['id']] = invitation
+        return invitation
+
+    def create_challenge(self, query, body):
+        self._entity(body['projectId'])
+        if body['projectId'] in self.challenges:
+            raise HTTPError(400, "The project already has a challenge")
+        challenge = dict(body, id=str(self._new_id()),
+                         etag=str(uuid.uuid4()))
+        self.challenges[body['projectId']] = challenge
+        return challenge
+
+    def get_challenge(self, entityid, query, body):
+        challenge = self.challenges.get(entityid)
+        if challenge is None:
+            raise HTTPError(404, "No challenge")
+        return challenge
+
+    def create_evaluation(self, query, body):
+        self._entity(body['contentSource'])
+        if any(evaluation['name'] == body['name']
+               for evaluation in self.evaluations.values()):
+            raise HTTPError(409, f"Evaluation {body['name']} already exists")
+        evaluation = dict(body, id=str(self._new_id()),
+                          etag=str(uuid.uuid4()))
+        self.evaluations[evaluation['id']] = evaluation
+        return evaluation
+
+    def get_evaluation_by_name(self, name, query, body):
+        for evaluation in self.evaluations.values():
+            if evaluation['name'] == name:
+                return evaluation
+        raise HTTPError(404, f"Evaluation {name} not found")
+
+    def project_evaluations(self, entityid, query, body):
+        self._entity(entityid)
+        return self._page([evaluation
+                           for evaluation in self.evaluations.values()
+                           if evaluation['contentSource'] == entityid],
+                          query)
+
+    def stats(self, query, body):
+        """Counts of the calls answered and the failures injected"""
+        return {'calls': dict(self.calls), 'injected': dict(self.injected),
+                'total': sum(self.calls.values())}
+
+
+ENTITY_ID = r"(syn\d+)"
+TEAM_ID = r"(\d+)"
+ROUTES = [
+    ("POST", "/entity", "create_entity"),
+    ("POST", "/entity/batch", "create_batch"),
+    ("POST", "/entity/child", "find_child"),
+    ("POST", "/entity/header", "entity_headers"),
+    ("POST", "/entity/children", "list_children"),
+    ("GET", f"/entity/{ENTITY_ID}", "get_entity"),
+    ("POST", f"/entity/{ENTITY_ID}/bundle2", "get_bundle"),
+    ("PUT", f"/entity/{ENTITY_ID}/annotations2", "put_annotations"),
+    ("GET", f"/entity/{ENTITY_ID}/benefactor", "get_benefactor"),
+    ("GET", f"/entity/{ENTITY_ID}/acl", "get_acl"),
+    ("POST", f"/entity/{ENTITY_ID}/acl", "create_acl"),
+    ("PUT", f"/entity/{ENTITY_ID}/acl", "update_acl"),
+    ("GET", f"/entity/{ENTITY_ID}/challenge", "get_challenge"),
+    ("GET", f"/entity/{ENTITY_ID}/evaluation", "project_evaluations"),
+    ("POST", "/evaluation", "create_evaluation"),
+    ("GET", "/evaluation/name/(.+)", "get_evaluation_by_name"),
+    ("POST", "/team", "create_team"),
+    ("GET", f"/team/{TEAM_ID}", "get_team"),
+    ("GET", "/teams", "find_teams"),
+    ("POST", "/teamList", "team_list"),
+    ("POST", "/userGroupHeaders/aliases", "resolve_aliases"),
+    ("GET", f"/teamMembers/{TEAM_ID}", "team_members"),
+    ("GET", f"/team/{TEAM_ID}/openInvitation", "open_invitations"),
+    ("POST", "/membershipInvitation", "create_invitation"),
+    ("POST", "/challenge", "create_challenge"),
+]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _respond(self, status_code: int, content: dict, headers: dict = None):
+        data = json.dumps(content).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if url.path == "/__stats":
+            self._respond(200, self.server.synapse.stats({}, body))
+            return
+        if not url.path.startswith(REPO_PREFIX):
+            self._respond(404, {'reason': "Unknown endpoint"})
+            return
+        path = unquote(url.path[len(REPO_PREFIX):])
+        try:
+            content = self.server.synapse.handle(self.command, path,
+                                                 parse_qs(url.query), body)
+        except HTTPError as err:
+            self._respond(err.status_code, {'reason': err.reason},
+                          err.headers)
+            return
+        self._respond(200, content)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _dispatch
+
+    def log_message(self, *args):
+        pass
+
+
+class MockSynapseServer(ThreadingMixIn, HTTPServer):
+    """Threaded HTTP server answering with a MockSynapse"""
+    daemon_threads = True
+
+    def __init__(self, synapse: MockSynapse, host: str = "127.0.0.1",
+                 port: int = 0):
+        super().__init__((host, port), _Handler)
+        self.synapse = synapse
+
+    @property
+    def url(self) -> str:
+        return "http://{}:{}".format(*self.server_address)
+
+
+def serve(urls=None, port: int = 0, **kwargs):
+    """Serves a MockSynapse until the process is stopped
+
+    Args:
+        urls: multiprocessing Queue the url of the server is put on
+              once it listens
+        port: Port to listen on. Default is any free port.
+        **kwargs: Arguments of MockSynapse
+    """
+    server = MockSynapseServer(MockSynapse(**kwargs), port=port)
+    if urls is not None:
+        urls.put(server.url)
+    server.serve_forever()
@@ -0,0 +1,263 @@
+"""Benchmarks create_synapse_resources against a local mock Synapse
+
+    python benchmarks/run.py --sizes 10,100,1000 --workers 8 \\
+        --output results.json
+    python benchmarks/run.py --baseline results.json
+
+Every template is created on a fresh mock server, then created again
+(every store conflicts) and created again with existing_first.  All runs
+use only_get so that injected conflicts are resolved.  Each run is made
+in its own process so its peak memory can be measured."""
+from contextlib import redirect_stdout
+import io
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import click
+import synapseclient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synapseformation import client, expand, planner, utils  # noqa: E402
+from mock_synapse import serve  # noqa: E402
+
+TREAT_AD = os.path.join(ROOT, "templates", "treat_ad_long.yaml")
+# Runs of every template: name and create_synapse_resources arguments
+RUNS = [("fresh", {'only_get': True}),
+        ("rerun", {'only_get': True}),
+        ("rerun_existing_first", {'only_get': True,
+                                  'existing_first': True})]
+
+
+def synthetic_template(folders: int, width: int = 10) -> list:
+    """Template of a project with a tree of folders
+
+    Args:
+        folders: Number of folders
+        width: Number of children of every folder
+
+    Returns:
+        Template with a single project
+    """
+    project = {'name': f"Benchmark {folders}", 'type': "Project",
+               'children': []}
+    containers = [project]
+    created = 0
+    while created < folders:
+        parent = containers.pop(0)
+        for _ in range(min(width, folders - created)):
+            created += 1
+            folder = {'name': f"folder_{created}", 'type': "Folder",
+                      'children': []}
+            parent['children'].append(folder)
+            containers.append(folder)
+    return [project]
+
+
+def _connect(url: str, workers: int) -> synapseclient.Synapse:
+    syn = synapseclient.Synapse(repoEndpoint=f"{url}/repo/v1",
+                                authEndpoint=f"{url}/auth/v1",
+                                fileHandleEndpoint=f"{url}/file/v1",
+                                portalEndpoint=url, skip_checks=True,
+                                configPath=os.devnull, silent=True)
+    utils.mount_pool(syn, pool_size=max(workers, utils.DEFAULT_POOL_SIZE))
+    return syn
+
+
+def _server_calls(syn: synapseclient.Synapse, url: str) -> int:
+    return syn._requests_session.get(f"{url}/__stats").json()['total']
+
+
+def _peak_memory() -> int:
+    """Peak resident memory of the process in bytes"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes and macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _run(url, template_path, workers, rate_limit, create_kwargs, results):
+    # Keep throttling warnings out of the results table
+    logging.disable(logging.WARNING)
+    syn = _connect(url, workers)
+    calls = _server_calls(syn, url)
+    start = time.perf_counter()
+    error = None
+    try:
+        with redirect_stdout(io.StringIO()):
+            client.create_synapse_resources(
+                syn=syn, template_path=template_path, workers=workers,
+                rate_limit=rate_limit, **create_kwargs
+            )
+    except Exception as err:
+        error = f"{type(err).__name__}: {str(err).splitlines()[0]}"
+    wall_time = time.perf_counter() - start
+    results.put({'wall_time': wall_time,
+                 'requests': _server_calls(syn, url) - calls,
+                 'peak_memory': _peak_memory(),
+                 'connections': utils.connection_stats(syn),
+                 'error': error})
+
+
+def benchmark_template(name: str, template_path: str, workers: int,
+                       rate_limit: float = None, bulk_folders: str = None,
+                       **server_kwargs) -> dict:
+    """Runs every benchmark run of a template on a fresh mock server
+
+    Args:
+        name: Name of the template in the results
+        template_path: Path to the template
+        workers: Workers of create_synapse_resources
+        rate_limit: Initial rate of the rate limiter. Default is no limit.
+        bulk_folders: Folder backend. Default is one folder at a time.
+        **server_kwargs: Arguments of MockSynapse
+
+    Returns:
+        Results of every run by name
+    """
+    config = list(expand.expand_config(utils.read_config(template_path)))
+    operations = len(planner.compile_plan(config))
+    context = multiprocessing.get_context("spawn")
+    urls = context.Queue()
+    server = context.Process(target=serve, args=(urls,),
+                             kwargs=server_kwargs, daemon=True)
+    server.start()
+    results = {}
+    try:
+        url = urls.get(timeout=30)
+        for run, create_kwargs in RUNS:
+            queue = context.Queue()
+            process = context.Process(
+                target=_run, args=(url, template_path, workers, rate_limit,
+                                   dict(create_kwargs,
+                                        bulk_folders=bulk_folders),
+                                   queue)
+            )
+            process.start()
+            result = queue.get()
+            process.join()
+            result['operations'] = operations
+            result['throughput'] = operations / result['wall_time']
+            results[f"{name}:{run}"] = result
+            click.echo(_format_row(f"{name}:{run}", result))
+    finally:
+        server.terminate()
+        server.join()
+    return results
+
+
+def _format_row(key: str, result: dict) -> str:
+    if result['error'] is not None:
+        return f"{key:<36} FAILED {result['error']}"
+    return (f"{key:<36}{result['operations']:>8}{result['requests']:>10}"
+            f"{result['wall_time']:>10.2f}{result['throughput']:>10.1f}"
+            f"{result['peak_memory'] / 2 ** 20:>10.1f}")
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Finds runs that regressed against a baseline
+
+    Args:
+        results: Results of this benchmark
+        baseline: Results of an earlier benchmark
+        tolerance: Fraction the wall time can grow by
+
+    Returns:
+        Descriptions of the regressions
+    """
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if result['error'] is not None and base['error'] is None:
+            regressions.append(f"{key} failed: {result['error']}")
+            continue
+        if result['wall_time'] > base['wall_time'] * (1 + tolerance):
+            regressions.append(
+                f"{key} wall time {result['wall_time']:.2f}s is more than "
+                f"{tolerance:.0%} above {base['wall_time']:.2f}s"
+            )
+        if result['requests'] > base['requests']:
+            regressions.append(f"{key} made {result['requests']} requests "
+                               f"instead of {base['requests']}")
+    return regressions
+
+
+@click.command()
+@click.option('--sizes', default="10,100,1000,10000", show_default=True,
+              help='Folder counts of the synthetic templates')
+@click.option('--template', 'templates', multiple=True, type=click.Path(),
+              default=[TREAT_AD], show_default=True,
+              help='Templates to benchmark besides the synthetic ones')
+@click.option('-w', '--workers', type=click.IntRange(min=1), default=8,
+              show_default=True)
+@click.option('--rate_limit', type=float,
+              help='Initial requests per second of the rate limiter')
+@click.option('--bulk_folders', type=click.Choice(['batch', 'store']),
+              help='Create the folders of each level at once')
+@click.option('--latency', type=float, default=0.0, show_default=True,
+              help='Seconds added to every request')
+@click.option('--jitter', type=float, default=0.0, show_default=True,
+              help='Maximum random seconds added to the latency')
+@click.option('--error_rate', type=float, default=0.0, show_default=True,
+              help='Fraction of requests answered with a 503')
+@click.option('--throttle_rate', type=float, default=0.0,
+              show_default=True,
+              help='Fraction of requests answered with a 429')
+@click.option('--retry_after', type=float,
+              help='Retry-After seconds of 429 and 503 responses')
+@click.option('--conflict_rate', type=float, default=0.0,
+              show_default=True, help='Fraction of entity creations '
+              'answered with a 409 after the entity is stored')
+@click.option('--seed', type=int, default=0, show_default=True)
+@click.option('--output', type=click.Path(), help='Path to write the '
+              'results to as JSON')
+@click.option('--baseline', type=click.Path(exists=True), help='Results '
+              'of an earlier benchmark to compare with')
+@click.option('--tolerance', type=float, default=0.2, show_default=True,
+              help='Fraction the wall time can grow by before it is a '
+              'regression')
+def main(sizes, templates, workers, rate_limit, bulk_folders, output,
+         baseline, tolerance, **server_kwargs):
+    """Benchmarks creating templates on a local mock Synapse"""
+    click.echo(f"{'Run':<36}{'Ops':>8}{'Requests':>10}{'Seconds':>10}"
+               f"{'Ops/s':>10}{'Peak MB':>10}")
+    results = {}
+    with tempfile.TemporaryDirectory() as tempdir:
+        for size in [int(size) for size in sizes.split(",") if size]:
+            template_path = os.path.join(tempdir, f"folders_{size}.json")
+            with open(template_path, "w") as template_f:
+                json.dump(synthetic_template(size), template_f)
+            results.update(benchmark_template(
+                f"folders_{size}", template_path, workers,
+                rate_limit=rate_limit, bulk_folders=bulk_folders,
+                **server_kwargs
+            ))
+    for template_path in templates:
+        name = os.path.splitext(os.path.basename(template_path))[0]
+        results.update(benchmark_template(name, template_path, workers,
+                                          rate_limit=rate_limit,
+                                          bulk_folders=bulk_folders,
+                                          **server_kwargs))
+    if output is not None:
+        with open(output, "w") as output_f:
+            json.dump(results, output_f, indent=2, sort_keys=True)
+    if baseline is not None:
+        with open(baseline) as baseline_f:
+            regressions = compare(results, json.load(baseline_f), tolerance)
+        for regression in regressions:
+            click.echo(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,2 +1,2 @@
 """Initialize synapseformation"""
-from .create import SynapseCreation
+from .create import AsyncSynapseCreation, SynapseCreation
@@ -1,10 +1,20 @@
 """synapseformation command line client"""
+from collections import Counter
+import sys
+
 import click
 
 import synapseclient
 
-from .client import create_synapse_resources
-from .utils import synapse_login
+from . import (diff as differ, expand, generate as generator, planner,
+               validate as validator)
+from .bulk import FOLDER_BACKENDS
+from .client import (create_many_synapse_resources,
+                     create_synapse_resources, iter_template, load_template)
+from .create import SynapseCreation
+from .principals import PrincipalResolver
+from .utils import (DEFAULT_POOL_SIZE, find_templates, read_config,
+                    synapse_login)
 from .__version__ import __version__
 
 
@@ -38,14 +48,208 @@ def cli():
 
 
 @cli.command()
-@click.option('--template_path', help='Template path', type=click.Path())
+@click.option('--template_path', help='Template path, directory of '
+              'templates or glob pattern. Can be given several times',
+              type=click.Path(), multiple=True, required=True)
 @click.option('-c', '--config_path', help='Synapse configuration file',
               type=click.Path(), show_default=True,
               default=synapseclient.client.CONFIG_FILE)
-def create(template_path, config_path):
+@click.option('-w', '--workers', help='Number of resources to create '
+              'concurrently', type=click.IntRange(min=1), show_default=True,
+              default=1)
+@click.option('-p', '--processes', help='Number of templates to create '
+              'at once. Defaults to the number of templates, at most 4',
+              type=click.IntRange(min=1))
+@click.option('--only_get', is_flag=True,
+              help='Use existing resources instead of failing')
+@click.option('--existing_first', is_flag=True,
+              help='Look up entities before attempting to create them')
+@click.option('--state_file', help='State file used to skip resources '
+              'that are unchanged since the last apply', type=click.Path())
+@click.option('--stream', is_flag=True, help='Create each top level '
+              'resource as soon as it is parsed')
+@click.option('--rate_limit', help='Initial Synapse requests per second, '
+              'shared by all processes. Adapts to throttling',
+              type=click.FloatRange(min=0.1))
+@click.option('--pool_size', help='Maximum connections to Synapse. '
+              'Defaults to the number of workers, at least 10',
+              type=click.IntRange(min=1))
+@click.option('--keep_alive/--no_keep_alive', default=True,
+              show_default=True, help='Reuse connections to Synapse')
+@click.option('--report', help='Path to write a JSON report of the '
+              'Synapse calls to', type=click.Path())
+@click.option('--journal', help='Journal of the completed resources, '
+              'written as they are created', type=click.Path())
+@click.option('--resume', is_flag=True, help='Skip the resources '
+              'completed in the journal by a failed run and use the '
+              'resources it created without journaling them')
+@click.option('-o', '--output', help='Manifest of the Synapse ids of the '
+              'resources, written as they are created. YAML for .yaml '
+              'paths and JSON lines otherwise', type=click.Path())
+@click.option('--bulk_folders', help='Create the folders of each level '
+              'at once. batch sends them in batches, falling back to '
+              'store, which stores them concurrently',
+              type=click.Choice(FOLDER_BACKENDS))
+@click.option('--principal_cache', help='Cache of the user and team '
+              'names resolved to ids, used for a week without checking '
+              'them. Default is no cache', type=click.Path())
+def create(template_path, config_path, workers, processes, only_get,
+           existing_first, state_file, stream, rate_limit, pool_size,
+           keep_alive, report, journal, resume, output, bulk_folders,
+           principal_cache):
     """Creates Synapse Resources given a yaml or json"""
-    syn = synapse_login(synapse_config=config_path)
-    create_synapse_resources(syn=syn, template_path=template_path)
+    if resume and journal is None:
+        raise click.UsageError("--resume requires --journal")
+    try:
+        template_paths = find_templates(template_path)
+    except ValueError as err:
+        raise click.BadParameter(str(err), param_hint="--template_path")
+    # Every template is validated before logging in
+    for path in template_paths:
+        if stream:
+            for _ in iter_template(path):
+                pass
+        else:
+            load_template(path)
+    if pool_size is None:
+        pool_size = max(workers, DEFAULT_POOL_SIZE)
+    if len(template_paths) > 1:
+        results = create_many_synapse_resources(
+            synapse_config=config_path, template_paths=template_paths,
+            processes=processes or min(len(template_paths), 4),
+            rate_limit=rate_limit, pool_size=pool_size,
+            keep_alive=keep_alive, report_path=report,
+            state_path=state_file, journal_path=journal, output_path=output,
+            workers=workers, only_get=only_get,
+            existing_first=existing_first, stream=stream, resume=resume,
+            bulk_folders=bulk_folders, principal_cache_path=principal_cache
+        )
+        if any(result['error'] is not None for result in results):
+            sys.exit(1)
+        return
+    template_path = template_paths[0]
+    syn = synapse_login(synapse_config=config_path, pool_size=pool_size,
+                        keep_alive=keep_alive)
+    create_synapse_resources(syn=syn, template_path=template_path,
+                             workers=workers, only_get=only_get,
+                             existing_first=existing_first,
+                             state_path=state_file, stream=stream,
+                             rate_limit=rate_limit, report_path=report,
+                             journal_path=journal, resume=resume,
+                             output_path=output, bulk_folders=bulk_folders,
+                             principal_cache_path=principal_cache)
+
+
+@cli.command()
+@click.option('--template_path', help='Template path', type=click.Path(),
+              required=True)
+@click.option('--latency', help='Seconds per REST call',
+              type=click.FloatRange(min=0), show_default=True, default=0.2)
+@click.option('-w', '--workers', help='Number of resources to create '
+              'concurrently', type=click.IntRange(min=1), show_default=True,
+              default=1)
+@click.option('--existing', is_flag=True,
+              help='Estimate a re-apply where all resources already exist')
+@click.option('--bulk_folders', is_flag=True, help='Estimate creating '
+              'the folders of each level in batches')
+def plan(template_path, latency, workers, existing, bulk_folders):
+    """Estimates the Synapse calls of a template without creating it"""
+    config = load_template(template_path)
+    execution_plan = planner.compile_plan(config_list=config)
+    estimate = planner.estimate_plan(execution_plan, latency=latency,
+                                     workers=workers, existing=existing,
+                                     bulk_folders=bulk_folders)
+    click.echo(execution_plan.summary())
+    click.echo("REST calls:")
+    for call_type, count in sorted(estimate['calls'].items()):
+        click.echo(f"  {call_type}: {count}")
+    click.echo(f"  total: {estimate['total']}")
+    click.echo(f"Estimated wall time: {estimate['wall_time']:.1f}s "
+               f"at {latency}s latency and {workers} workers")
+
+
+@cli.command()
+@click.option('--template_path', help='Template path', type=click.Path(),
+              required=True)
+def validate(template_path):
+    """Validates a template without any Synapse call.  Exits with 1 if
+    it is invalid."""
+    config = list(expand.expand_config(read_config(template_path)))
+    errors = validator.validate_template(config)
+    for error in errors:
+        click.echo(error)
+    if errors:
+        click.echo(f"{len(errors)} errors")
+        sys.exit(1)
+    click.echo(f"{template_path} is valid")
+
+
+@cli.command()
+@click.option('--template_path', help='Template path', type=click.Path(),
+              required=True)
+@click.option('-c', '--config_path', help='Synapse configuration file',
+              type=click.Path(), show_default=True,
+              default=synapseclient.client.CONFIG_FILE)
+@click.option('-w', '--workers', help='Number of concurrent lookups',
+              type=click.IntRange(min=1), show_default=True, default=8)
+@click.option('--principal_cache', help='Cache of the user and team '
+              'names resolved to ids, used for a week without checking '
+              'them. Default is no cache', type=click.Path())
+def diff(template_path, config_path, workers, principal_cache):
+    """Compares a template with the resources in Synapse.  Exits with 1
+    if they differ."""
+    config = load_template(template_path)
+    syn = synapse_login(synapse_config=config_path,
+                        pool_size=max(workers, DEFAULT_POOL_SIZE))
+    creation_cls = SynapseCreation(syn)
+    PrincipalResolver(creation_cls,
+                      cache_path=principal_cache).resolve_template(config)
+    differences = differ.diff_template(creation_cls, config,
+                                       workers=workers)
+    for difference in differences:
+        click.echo(differ.format_difference(difference))
+    if not differences:
+        click.echo("No differences")
+        return
+    counts = Counter(difference['change'] for difference in differences)
+    click.echo(", ".join(f"{count} {change}"
+                         for change, count in sorted(counts.items())))
+    sys.exit(1)
+
+
+@cli.command()
+@click.option('-o', '--output', help='Template path. Defaults to stdout',
+              type=click.File('w'), default='-')
+@click.option('--format', 'template_format', help='Template format. '
+              'Defaults to json for .json output and yaml otherwise',
+              type=click.Choice(['yaml', 'json']))
+@click.option('--projects', help='Number of projects',
+              type=click.IntRange(min=0), show_default=True, default=1)
+@click.option('--breadth', help='Folders in every project and folder',
+              type=click.IntRange(min=1), show_default=True, default=10)
+@click.option('--depth', help='Levels of folders in every project',
+              type=click.IntRange(min=0), show_default=True, default=2)
+@click.option('--acl_density', help='Fraction of projects and folders '
+              'with an ACL', type=click.FloatRange(min=0, max=1),
+              show_default=True, default=0.0)
+@click.option('--teams', help='Number of teams',
+              type=click.IntRange(min=0), show_default=True, default=0)
+@click.option('--invitations', help='Members invited to every team',
+              type=click.IntRange(min=0), show_default=True, default=0)
+@click.option('--seed', help='Seed of the ACL placement', type=int)
+def generate(output, template_format, projects, breadth, depth,
+             acl_density, teams, invitations, seed):
+    """Generates a large template for scale testing"""
+    if template_format is None:
+        template_format = ("json" if output.name.endswith(".json")
+                           else "yaml")
+    resources = generator.generate_template(
+        projects=projects, breadth=breadth, depth=depth,
+        acl_density=acl_density, teams=teams, invitations=invitations,
+        seed=seed
+    )
+    generator.write_template(output, resources,
+                             template_format=template_format)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,150 @@
+"""Backends that create many folders at once"""
+from concurrent.futures import ThreadPoolExecutor
+import json
+from typing import TYPE_CHECKING, List
+
+from synapseclient import Entity, Folder
+from synapseclient.core.exceptions import SynapseHTTPError
+
+if TYPE_CHECKING:
+    # create imports the backends, so it is only imported for type
+    # checking
+    from .create import SynapseCreation
+
+# Batch endpoint of the local stand-in of Synapse.  Synapse itself has
+# no batch entity creation, so the store backend is used instead.
+BATCH_ENDPOINT = "/entity/batch"
+DEFAULT_BATCH_SIZE = 100
+FOLDER_BACKENDS = ("batch", "store")
+
+
+class StoreFolderBackend:
+    """Creates every folder with its own store.  The folders are
+    created concurrently."""
+    def __init__(self, workers: int = 8):
+        """
+        Args:
+            workers: Number of folders created concurrently
+        """
+        self.workers = workers
+
+    def create_folders(self, creation_cls: 'SynapseCreation',
+                       folders: List[dict]) -> List[Folder]:
+        """Gets or creates folders that don't depend on each other
+
+        Args:
+            creation_cls: SynapseCreation the folders are created with
+            folders: Name and parentId of every folder
+
+        Returns:
+            Folders in the same order
+        """
+        # Calls made by the pool are attributed like the caller's
+        kind = creation_cls.recorder.kind
+
+        def _create(folder):
+            with creation_cls.recorder.resource(kind):
+                return creation_cls.get_or_create_folder(**folder)
+
+        if self.workers <= 1 or len(folders) <= 1:
+            return [_create(folder) for folder in folders]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(_create, folders))
+
+
+class BatchFolderBackend:
+    """Creates folders with one request per batch.  A batch is
+    transactional: if a folder exists and only_get is False, no folder
+    of the batch is created.  Servers without the batch endpoint fall
+    back to the store backend."""
+    def __init__(self, endpoint: str = BATCH_ENDPOINT,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 fallback: StoreFolderBackend = None):
+        """
+        Args:
+            endpoint: Batch endpoint of the repository service
+            batch_size: Maximum folders per request
+            fallback: Backend used when the server has no batch
+                      endpoint. Default is a StoreFolderBackend.
+        """
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.fallback = fallback or StoreFolderBackend()
+        # Unknown until the first batch is sent
+        self.supported = None
+
+    def _create_batch(self, creation_cls: 'SynapseCreation',
+                      folders: List[dict]) -> List[Folder]:
+        body = {'list': [dict(folder,
+                              concreteType=Folder._synapse_entity_type)
+                         for folder in folders],
+                'getExisting': creation_cls.only_get}
+        try:
+            response = creation_cls._call("restPOST", self.endpoint,
+                                          body=json.dumps(body))
+        except SynapseHTTPError as err:
+            if err.response.status_code != 409:
+                raise err
+            raise ValueError(f"{str(err)}. To use existing entities, "
+                             "set only_get to True.")
+        results = []
+        for item in response['list']:
+            folder = Entity.create(item['entity'])
+            if item['created']:
+                creation_cls._cache_entity(folder)
+            results.append(folder)
+        creation_cls.logger.info(
+            f"{creation_cls._update_str} {len(results)} Folders in a batch"
+        )
+        return results
+
+    def create_folders(self, creation_cls: 'SynapseCreation',
+                       folders: List[dict]) -> List[Folder]:
+        """Gets or creates folders that don't depend on each other
+
+        Args:
+            creation_cls: SynapseCreation the folders are created with
+            folders: Name and parentId of every folder
+
+        Returns:
+            Folders in the same order
+        """
+        results = []
+        start = 0
+        while start < len(folders):
+            if self.supported is False:
+                return results + self.fallback.create_folders(
+                    creation_cls, folders[start:]
+                )
+            batch = folders[start:start + self.batch_size]
+            try:
+                results.extend(self._create_batch(creation_cls, batch))
+            except SynapseHTTPError as err:
+                if err.response.status_code not in (404, 405):
+                    raise err
+                creation_cls.logger.info("No batch endpoint, creating "
+                                         "folders one at a time")
+                # The batch is created by the fallback
+                self.supported = False
+                continue
+            self.supported = True
+            start += len(batch)
+        return results
+
+
+def folder_backend(name: str, workers: int = 8):
+    """Builds a folder backend by name
+
+    Args:
+        name: batch or store
+        workers: Number of folders the store backend creates
+                 concurrently
+
+    Returns:
+        A BatchFolderBackend or StoreFolderBackend
+    """
+    if name == "batch":
+        return BatchFolderBackend(fallback=StoreFolderBackend(workers))
+    if name == "store":
+        return StoreFolderBackend(workers)
+    raise ValueError(f"Unknown folder backend '{name}'")
@@ -1,108 +1,402 @@
 """Synapse Formation client"""
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+import io
+import os
+import tempfile
+import time
+from typing import Iterator, List
 
 import synapseclient
 from synapseclient import Synapse
 
-from .create import SynapseCreation
-from . import create, utils
-
-
-# def expand_config(config: dict) -> dict:
-#     """Expands shortened configuration to the official json format"""
-#     # TODO: Once all resources are either under a key mapping or lists
-#     # this will have to chance
-#     if isinstance(config, dict) and config.get('type') == "Project":
-#         # TODO: figure out how to clean this up.
-#         # Remove yaml anchor objects as they are expanded
-#         to_remove = [key for key in config
-#                      if key not in ["type", "name", "children"]]
-#         for key in to_remove:
-#             config.pop(key)
-#         # Get children if exists
-#         children = config.get('children')
-#         if children is not None:
-#             expand_config(children)
-#     else:
-#         # Loop through folders and create them
-#         for index, folder in enumerate(config):
-#             # The folder configuration can be lists or dicts
-#             # Must pull out children if it exists
-#             if isinstance(folder, dict):
-#                 children = folder.get('children')
-#             else:
-#                 config[index] = {"name": folder,
-#                                  "type": "Folder"}
-#                 children = None
-
-#             # Create nested folders
-#             if children is not None:
-#                 expand_config(children)
-#     return config
+from .create import AsyncSynapseCreation, SynapseCreation
+from . import bulk, expand, planner, utils, validate
+from .principals import PrincipalResolver
+from .instrument import CallRecorder
+from .ratelimit import RateLimiter, SharedRateLimiter
+from .journal import Journal
+from .manifest import Manifest
+from .state import ApplyState
 
 
 def _create_synapse_resources(config_list: List[dict],
                               creation_cls: SynapseCreation,
-                              parentid: str = None):
-    """Recursively steps through template and creates synapse resources
+                              parentid: str = None, workers: int = 1):
+    """Compiles the template into an execution plan and creates the
+    synapse resources
 
     Args:
         config_list: List of Synapse resources
         creation_cls: SynapseCreation class that can create resources
         parentid: Synapse folder or project id to store entities
+        workers: Number of operations to run concurrently
     """
-    # Specify entity or there will be an issue when the recursive
-    # function is called from within the for loop
-    # Error: entity not specified
-    entity = None
-    # Must iterate through list to avoid recursion limit issue
-    # This works because every layer in the json is a list
-    for config in config_list:
-        if isinstance(config, dict) and config.get('type') == "Project":
-            entity = creation_cls.get_or_create_project(name=config['name'])
-        elif isinstance(config, dict) and config.get('type') == "Folder":
-            entity = creation_cls.get_or_create_folder(
-                name=config['name'], parentId=parentid
-            )
-        elif isinstance(config, dict) and config.get('type') == "Team":
-            team = creation_cls.get_or_create_team(
-                name=config['name'], description=config['description'],
-                canPublicJoin=config['can_public_join']
-            )
-            config['id'] = team.id
-            if config.get("invitations") is not None:
-                for invite in config['invitations']:
-                    for member in invite['members']:
-                        user = member.get("principal_id")
-                        email = member.get("email")
-                        creation_cls.syn.invite_to_team(
-                            team=team, user=user, inviteeEmail=email,
-                            message=invite['message']
-                        )
-        # only entities can have children and ACLs
-        if entity is not None:
-            parent_id = entity.id
-            config['id'] = parent_id
-            # Get ACL if exists
-            create._set_acl(syn=creation_cls.syn, entity=entity,
-                            acl_config=config.get('acl', []))
-            children = config.get('children', None)
-            # implement this to not run into recursion limit
-            if children is not None:
-                _create_synapse_resources(config_list=children,
-                                          creation_cls=creation_cls,
-                                          parentid=parent_id)
-
-
-def create_synapse_resources(syn: synapseclient.Synapse, template_path: str):
-    """Creates synapse resources from template"""
-    # Function will attempt to read template as yaml then try to read in json
+    plan = planner.compile_plan(config_list=config_list, parentid=parentid)
+    planner.execute_plan(plan=plan, creation_cls=creation_cls,
+                         workers=workers)
+
+
+def load_template(template_path: str) -> List[dict]:
+    """Reads, expands and validates a template without any Synapse call
+
+    Args:
+        template_path: Path to yaml or json template
+
+    Returns:
+        Expanded template
+    """
+    # Function will attempt to read template as yaml then try to
+    # read in json
     config = utils.read_config(template_path)
-    # Expands shortended configuration into full configuration.  This should
-    # work if full configuration is passed in
-    # TODO: Ignore expansion of configuration for now
-    # full_config = expand_config(config)
-    # Recursive function to create resources
-    creation_cls = SynapseCreation(syn)
-    _create_synapse_resources(config_list=config, creation_cls=creation_cls)
+    # Expands shortended configuration into full configuration.
+    # This should work if full configuration is passed in.  The whole
+    # expanded template is held in memory to plan it.
+    config = list(expand.expand_config(config))
+    # Invalid templates fail before any Synapse call
+    validate.check_template(config)
+    return config
+
+
+def iter_template(template_path: str) -> Iterator[dict]:
+    """Reads, expands and validates the top level resources of a
+    template one at a time.  Names are checked across all resources
+    and challenges can only use the teams before them.  Each resource
+    is yielded with all of its children expanded.
+
+    Args:
+        template_path: Path to yaml or json template
+
+    Yields:
+        Expanded resources
+    """
+    seen_names = {}
+    for resource in expand.expand_config(utils.iter_config(template_path)):
+        validate.check_template([resource], seen_names=seen_names)
+        yield resource
+
+
+def _load_resolved(template_path: str,
+                   resolver: PrincipalResolver) -> List[dict]:
+    """Loads a template and resolves the names of its principals.
+    See load_template
+
+    Args:
+        template_path: Path to yaml or json template
+        resolver: Resolves user and team names to principal ids
+
+    Returns:
+        Expanded template
+    """
+    config = load_template(template_path)
+    # Names of principals are resolved together before the apply
+    resolver.resolve_template(config)
+    return config
+
+
+def _report_run(creation_cls: SynapseCreation, wall_time: float,
+                report_path: str = None):
+    """Reports the Synapse calls, caching, lookups by name, connection
+    reuse and rate limiting of a run
+
+    Args:
+        creation_cls: SynapseCreation class the run used
+        wall_time: Seconds the run took
+        report_path: Path to write a JSON report of the run to
+    """
+    logger = creation_cls.logger
+    cache = creation_cls.cache_stats
+    logger.info("Children cache: {hits} hits, {misses} misses".format(
+        **cache
+    ))
+    lookups = creation_cls.lookup_stats
+    logger.info("Lookups by name: {hits} hits, {negative_hits} negative "
+                "hits, {coalesced} coalesced, {misses} misses".format(
+                    **lookups
+                ))
+    connections = utils.connection_stats(creation_cls.syn)
+    if connections is not None:
+        logger.info("Connections: {requests} requests, {connections} "
+                    "opened, {reused} reused".format(**connections))
+    rate_limiter = creation_cls.rate_limiter
+    rate = None
+    if rate_limiter is not None:
+        rate = {'rate': rate_limiter.rate,
+                'throttles': rate_limiter.throttles,
+                'retries': rate_limiter.retries}
+        logger.info("Rate limiter: {rate:.2f} requests per second, "
+                    "{throttles} throttles, {retries} retries".format(**rate))
+    recorder = creation_cls.recorder
+    report = recorder.report()
+    print(recorder.table(report))
+    if report_path is not None:
+        recorder.write(report_path, report, wall_time=wall_time,
+                       children_cache=cache, lookups=lookups,
+                       connections=connections,
+                       rate_limiter=rate)
+
+
+def create_synapse_resources(syn: synapseclient.Synapse, template_path: str,
+                             workers: int = 1, only_get: bool = False,
+                             existing_first: bool = False,
+                             state_path: str = None, stream: bool = False,
+                             rate_limit: float = None,
+                             report_path: str = None,
+                             journal_path: str = None, resume: bool = False,
+                             output_path: str = None,
+                             bulk_folders: str = None,
+                             rate_limit_path: str = None,
+                             recorder: CallRecorder = None,
+                             principal_cache_path: str = None):
+    """Creates synapse resources from template.  A table of the time
+    spent in Synapse calls is printed at the end.
+
+    Args:
+        syn: Synapse connection
+        template_path: Path to yaml or json template
+        workers: Number of operations to run concurrently.  Operations
+                 that don't depend on each other are run in parallel
+                 when this is greater than 1.
+        only_get: Use existing resources instead of failing.
+                  See SynapseCreation.
+        existing_first: Look up entities before attempting to create
+                        them. See SynapseCreation.
+        state_path: Path to a JSON state file.  Resources that haven't
+                    changed since they were last applied are skipped.
+        stream: Create each top level resource as soon as it is parsed
+                instead of reading the whole template first.  Challenges
+                can only refer to teams earlier in the template.
+        rate_limit: Initial Synapse requests per second.  The rate
+                    adapts to throttling by Synapse and throttled calls
+                    are retried.  Default is no limit.
+        report_path: Path to write a JSON report of the run to
+        journal_path: Path to a journal of the completed operations,
+                      which is written as the run progresses
+        resume: Skip the operations completed by an earlier run in the
+                journal and continue from where it stopped.  Resources
+                the earlier run created but didn't journal, because it
+                died before the response or the flush, already exist,
+                so a resumed run uses existing resources as only_get.
+        output_path: Path to stream a manifest of the Synapse ids of the
+                     resources to as they are completed, as YAML for
+                     .yaml and .yml paths and JSON lines otherwise.
+                     The template is printed instead by default.
+        bulk_folders: Create the folders of each level of the template
+                      at once with the batch or store folder backend.
+                      Default is to create folders one at a time.
+        rate_limit_path: SQLite database of a rate limit shared with
+                         other processes. rate_limit is the initial rate
+                         of all of them.
+        recorder: Records the timing of every Synapse call. Default
+                  is a new CallRecorder.
+        principal_cache_path: Path to a JSON cache of the user and team
+                              names of the template resolved to ids.
+                              Default is to resolve them every run.
+    """
+    if resume and journal_path is None:
+        raise ValueError("A journal is required to resume")
+    rate_limiter = None
+    if rate_limit_path is not None:
+        rate_limiter = SharedRateLimiter(rate_limit_path, rate=rate_limit)
+        rate_limiter.observe(syn)
+    elif rate_limit is not None:
+        rate_limiter = RateLimiter(rate=rate_limit)
+        rate_limiter.observe(syn)
+    backend = (bulk.folder_backend(bulk_folders, workers=workers)
+               if bulk_folders is not None else None)
+    creation_cls = SynapseCreation(syn, only_get=only_get or resume,
+                                   existing_first=existing_first,
+                                   rate_limiter=rate_limiter,
+                                   recorder=recorder,
+                                   folder_backend=backend)
+    state = (ApplyState(state_path, template_path=template_path)
+             if state_path is not None else None)
+    journal = (Journal(journal_path, template_path=template_path,
+                       resume=resume)
+               if journal_path is not None else None)
+    manifest = Manifest(output_path) if output_path is not None else None
+    resolver = PrincipalResolver(creation_cls,
+                                 cache_path=principal_cache_path)
+    start = time.perf_counter()
+    try:
+        if stream:
+            teams = {}
+            # The next resource is parsed while the current one is created
+            resources = utils.iter_prefetched(iter_template(template_path))
+            for resource in resources:
+                resolver.resolve_template([resource])
+                plan = planner.compile_plan(config_list=[resource],
+                                            teams=teams)
+                print(plan.summary())
+                planner.execute_plan(plan=plan, creation_cls=creation_cls,
+                                     workers=workers, state=state,
+                                     journal=journal, manifest=manifest)
+                if manifest is None:
+                    print(resource)
+        else:
+            config = _load_resolved(template_path, resolver)
+            plan = planner.compile_plan(config_list=config)
+            print(plan.summary())
+            planner.execute_plan(plan=plan, creation_cls=creation_cls,
+                                 workers=workers, state=state,
+                                 journal=journal, manifest=manifest)
+            if manifest is None:
+                print(config)
+    finally:
+        # Completed resources are kept even if the apply fails
+        if state is not None:
+            state.save()
+        if manifest is not None:
+            manifest.close()
+        if journal is not None:
+            journal.close()
+            if journal.resumed:
+                creation_cls.logger.info(
+                    f"Resumed: skipped {journal.resumed} operations "
+                    "completed by an earlier run"
+                )
+        if resolver.lookups:
+            creation_cls.logger.info(
+                f"Principals: {resolver.lookups} names resolved with "
+                f"{resolver.requests} requests"
+            )
+        _report_run(creation_cls, wall_time=time.perf_counter() - start,
+                    report_path=report_path)
+
+
+def _per_template_path(path: str, template_path: str) -> str:
+    """Path of a file of one of many templates, named after it"""
+    if path is None:
+        return None
+    root, ext = os.path.splitext(path)
+    name = os.path.splitext(os.path.basename(template_path))[0]
+    return f"{root}.{name}{ext}"
+
+
+def _create_in_process(synapse_config: str, template_path: str,
+                       login_kwargs: dict, create_kwargs: dict) -> dict:
+    """Creates the resources of a template in a worker process.  The
+    output of the run is discarded and its error is returned rather
+    than raised, so the other templates carry on."""
+    recorder = CallRecorder()
+    start = time.perf_counter()
+    error = None
+    try:
+        syn = utils.synapse_login(synapse_config, **login_kwargs)
+        with redirect_stdout(io.StringIO()):
+            create_synapse_resources(syn=syn, template_path=template_path,
+                                     recorder=recorder, **create_kwargs)
+    except Exception as err:
+        error = f"{type(err).__name__}: {err}"
+    return {'template_path': template_path, 'error': error,
+            'wall_time': time.perf_counter() - start, 'recorder': recorder}
+
+
+def create_many_synapse_resources(synapse_config: str,
+                                  template_paths: List[str],
+                                  processes: int = 4,
+                                  rate_limit: float = None,
+                                  pool_size: int = None,
+                                  keep_alive: bool = True,
+                                  report_path: str = None,
+                                  state_path: str = None,
+                                  journal_path: str = None,
+                                  output_path: str = None,
+                                  **kwargs) -> List[dict]:
+    """Creates the resources of many templates on a pool of processes.
+    Every process logs in to Synapse and the processes share one rate
+    limit.  A summary of every template and a table of the Synapse calls
+    of all of them are printed at the end.
+
+    Args:
+        synapse_config: Synapse configuration file
+        template_paths: Paths to yaml or json templates
+        processes: Number of templates created at once
+        rate_limit: Initial Synapse requests per second of all processes
+                    together. Default is no limit.
+        pool_size: Maximum connections to Synapse of each process
+        keep_alive: Reuse connections to Synapse
+        report_path: Path to write a JSON report of all runs to
+        state_path, journal_path, output_path: Paths of the state file,
+            journal and manifest. Each template gets its own file, named
+            after the template.
+        **kwargs: Arguments of create_synapse_resources
+
+    Returns:
+        Template path, error or None and wall time of every template
+    """
+    names = [os.path.splitext(os.path.basename(template_path))[0]
+             for template_path in template_paths]
+    if any(path is not None for path in (state_path, journal_path,
+                                         output_path)) and \
+            len(set(names)) != len(names):
+        raise ValueError("Templates need distinct file names to have "
+                         "their own state files, journals and manifests")
+    login_kwargs = {'pool_size': pool_size, 'keep_alive': keep_alive}
+    start = time.perf_counter()
+    recorder = CallRecorder()
+    results = []
+    with tempfile.TemporaryDirectory() as tempdir:
+        if rate_limit is not None:
+            kwargs['rate_limit'] = rate_limit
+            kwargs['rate_limit_path'] = os.path.join(tempdir, "rate.db")
+            # The bucket is created before the processes share it
+            SharedRateLimiter(kwargs['rate_limit_path'],
+                              rate=rate_limit).close()
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [executor.submit(
+                _create_in_process, synapse_config, template_path,
+                login_kwargs, dict(
+                    kwargs,
+                    state_path=_per_template_path(state_path, template_path),
+                    journal_path=_per_template_path(journal_path,
+                                                    template_path),
+                    output_path=_per_template_path(output_path,
+                                                   template_path)
+                )
+            ) for template_path in template_paths]
+            for future in futures:
+                result = future.result()
+                recorder.merge(result.pop('recorder'))
+                results.append(result)
+    wall_time = time.perf_counter() - start
+    for result in results:
+        status = result['error'] or "ok"
+        print(f"{result['template_path']}: {status} "
+              f"in {result['wall_time']:.1f}s")
+    failed = sum(result['error'] is not None for result in results)
+    print(f"{len(results) - failed} of {len(results)} templates created "
+          f"in {wall_time:.1f}s")
+    report = recorder.report()
+    print(recorder.table(report))
+    if report_path is not None:
+        recorder.write(report_path, report, wall_time=wall_time,
+                       templates=results)
+    return results
+
+
+async def create_synapse_resources_async(
+        syn: synapseclient.Synapse, template_path: str,
+        concurrency: int = 100, principal_cache_path: str = None):
+    """Creates synapse resources from template with asyncio
+
+    Args:
+        syn: Synapse connection
+        template_path: Path to yaml or json template
+        concurrency: Maximum number of Synapse calls in flight
+        principal_cache_path: Path to a JSON cache of the user and team
+                              names of the template resolved to ids.
+                              Default is to resolve them every run.
+    """
+    creation_cls = AsyncSynapseCreation(syn, concurrency=concurrency)
+    try:
+        resolver = PrincipalResolver(creation_cls.creation_cls,
+                                     cache_path=principal_cache_path)
+        config = _load_resolved(template_path, resolver)
+        plan = planner.compile_plan(config_list=config)
+        print(plan.summary())
+        await planner.execute_plan_async(plan=plan,
+                                         creation_cls=creation_cls)
+    finally:
+        creation_cls.close()
     print(config)
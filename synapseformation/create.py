@@ -1,22 +1,54 @@
 """Convenience functions to create Synapse entities"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
 import json
 import logging
 from logging import Logger
-from typing import Union
+import threading
+import time
+from typing import Callable, Dict, List, Union
 from urllib.parse import quote
 
-from synapseclient import (Project, Team, Evaluation, File, Folder, Wiki,
-                           EntityViewSchema, Schema, Synapse)
+from synapseclient import (Entity, Project, Team, Evaluation, File, Folder,
+                           Wiki, EntityViewSchema, Schema, Synapse)
 from synapseclient.core.exceptions import SynapseHTTPError
+from synapseclient.core.utils import id_of
+
+from .bulk import BatchFolderBackend, StoreFolderBackend
+from .instrument import (RETRY_STATUS_CODES, CallRecorder, count_retries,
+                         retryable_responses)
+from .ratelimit import RateLimiter
 
 SynapseCls = Union[Project, Team, Evaluation, File, Folder, Wiki,
                    EntityViewSchema, Schema]
+FolderBackend = Union[BatchFolderBackend, StoreFolderBackend]
+# Entities that are looked up by name and parent
+ENTITY_CLASSES = (Project, File, Folder, EntityViewSchema, Schema)
+# Types of the entities that are built from their header when found
+HEADER_TYPES = (Project._synapse_entity_type, Folder._synapse_entity_type)
+# Calls returning a generator that fetches pages lazily
+PAGINATED_METHODS = ('getChildren', 'getTeamMembers',
+                     'get_team_open_invitations',
+                     'getEvaluationByContentSource')
+
+
+class _Flight:
+    """Lookup in progress that other threads wait for"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
 
 
 class SynapseCreation:
     """Creates Synapse Features"""
     def __init__(self, syn: Synapse, only_get: bool = False,
-                 logger: Logger = None):
+                 logger: Logger = None, existing_first: bool = False,
+                 rate_limiter: RateLimiter = None,
+                 recorder: CallRecorder = None,
+                 folder_backend: FolderBackend = None,
+                 negative_ttl: float = 5.0):
         """
         Args:
             syn: Synapse connection
@@ -24,11 +56,290 @@ class SynapseCreation:
                       means by default, an attempt will be made at
                       creating an entity.  The creation will fail if
                       resource already exists.
+            existing_first: Look up entities before attempting to
+                            create them. Default is False, which means
+                            entities are only looked up when their
+                            creation fails.  This saves a failing
+                            store call per entity when re-running a
+                            template that was already applied.
+            rate_limiter: Limits the rate of Synapse calls and retries
+                          throttled calls. It can be shared by several
+                          instances. Default is no limit.
+            recorder: Records the timing of every Synapse call.
+                      Default is a new CallRecorder.
+            folder_backend: Backend that creates the folders of a level
+                            of the template at once, such as a
+                            BatchFolderBackend. Default is None, which
+                            creates folders one at a time.
+            negative_ttl: Seconds a lookup of a team, queue or project
+                          by name that found nothing is cached for.
+                          Found objects are cached for the run.
         """
         self.syn = syn
+        self.rate_limiter = rate_limiter
+        self.recorder = recorder or CallRecorder()
+        count_retries(syn)
+        self.folder_backend = folder_backend
         self.only_get = only_get
+        self.existing_first = existing_first
         self.logger = logger or logging.getLogger(__name__)
         self._update_str = "Created" if only_get else "Fetched existing"
+        # Children of each container by name
+        self._children_cache = {}
+        self._cache_lock = threading.Lock()
+        self._parent_locks = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Results of lookups by name, with the time they expire at or
+        # None, and the lookups in flight
+        self.negative_ttl = negative_ttl
+        self._clock = time.monotonic
+        self._lookups = {}
+        self._flights = {}
+        self._lookup_lock = threading.Lock()
+        self.lookup_hits = 0
+        self.lookup_negative_hits = 0
+        self.lookup_coalesced = 0
+        self.lookup_misses = 0
+
+    @property
+    def cache_stats(self) -> dict:
+        """Hits and misses of the children cache"""
+        return {'hits': self.cache_hits, 'misses': self.cache_misses}
+
+    @property
+    def lookup_stats(self) -> dict:
+        """Hits, hits of lookups that found nothing, lookups that waited
+        for one in flight and misses of the lookups by name"""
+        return {'hits': self.lookup_hits,
+                'negative_hits': self.lookup_negative_hits,
+                'coalesced': self.lookup_coalesced,
+                'misses': self.lookup_misses}
+
+    def _call(self, method: str, *args, **kwargs):
+        """Makes a Synapse call through the rate limiter and records
+        its timing.  Every call to Synapse goes through here.
+
+        Args:
+            method: Name of the synapseclient.Synapse method
+            *args, **kwargs: Arguments passed to the method
+
+        Returns:
+            Return value of the method.  Paginated results are read
+            into a list, so the call covers the requests of every page.
+        """
+        func = getattr(self.syn, method)
+        if method in PAGINATED_METHODS:
+            paginated = func
+
+            def func(*args, **kwargs):
+                return list(paginated(*args, **kwargs))
+        attempts = 0
+
+        def attempt(*args, **kwargs):
+            nonlocal attempts
+            attempts += 1
+            return func(*args, **kwargs)
+
+        status = "ok"
+        retryable = retryable_responses()
+        start = time.perf_counter()
+        try:
+            if self.rate_limiter is None:
+                return attempt(*args, **kwargs)
+            return self.rate_limiter.call(attempt, *args, **kwargs)
+        except SynapseHTTPError as err:
+            status = getattr(err.response, 'status_code', type(err).__name__)
+            raise err
+        except Exception as err:
+            status = type(err).__name__
+            raise err
+        finally:
+            # synapseclient retries throttled and failed requests itself,
+            # except for the response a failed call ends with
+            retried = retryable_responses() - retryable
+            if status in RETRY_STATUS_CODES:
+                retried -= 1
+            self.recorder.record(method, time.perf_counter() - start,
+                                 status=status,
+                                 retries=max(attempts - 1, retried, 0))
+
+    def _lookup(self, key: tuple, fetch: Callable):
+        """Looks up an object by name once for every thread.  Threads
+        looking up a key that is in flight wait for its result instead
+        of making the same call.  Found objects are cached for the run
+        and None, for objects that weren't found, for negative_ttl
+        seconds.  Errors aren't cached.
+
+        Args:
+            key: Kind and name of the object
+            fetch: Function making the lookup, returning None if the
+                   object doesn't exist
+
+        Returns:
+            Return value of fetch
+        """
+        with self._lookup_lock:
+            cached = self._lookups.get(key)
+            if cached is not None:
+                result, expires = cached
+                if expires is None:
+                    self.lookup_hits += 1
+                    return result
+                if self._clock() < expires:
+                    self.lookup_negative_hits += 1
+                    return result
+                del self._lookups[key]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.lookup_misses += 1
+            else:
+                self.lookup_coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = fetch()
+        except Exception as err:
+            flight.error = err
+            raise err
+        finally:
+            with self._lookup_lock:
+                del self._flights[key]
+                if flight.error is None:
+                    self._lookups[key] = (
+                        flight.result,
+                        None if flight.result is not None
+                        else self._clock() + self.negative_ttl
+                    )
+            flight.done.set()
+        return flight.result
+
+    def _forget(self, key: tuple):
+        """Removes the cached lookup of an object that was created or
+        found to exist
+
+        Args:
+            key: Kind and name of the object
+        """
+        with self._lookup_lock:
+            self._lookups.pop(key, None)
+
+    def _get_team(self, name: str) -> Team:
+        """Team by name or None if it doesn't exist"""
+        try:
+            return self._call("getTeam", name)
+        except ValueError:
+            # synapseclient raises a ValueError for unknown names
+            return None
+
+    def _get_evaluation(self, name: str) -> Evaluation:
+        """Evaluation queue by name or None if it doesn't exist"""
+        try:
+            return self._call("getEvaluationByName", name)
+        except SynapseHTTPError as err:
+            if err.response.status_code != 404:
+                raise err
+            return None
+
+    @staticmethod
+    def _lookup_key(obj: SynapseCls) -> tuple:
+        """Key of the lookup of an object by name or None if it isn't
+        looked up by name"""
+        if isinstance(obj, Team):
+            return ("team", obj.name)
+        if isinstance(obj, Evaluation):
+            return ("evaluation", obj.name)
+        if isinstance(obj, Project):
+            return ("project", obj.name)
+        return None
+
+    def _get_children(self, parentid: str) -> Dict[str, dict]:
+        """Gets the children of a container.  The container is listed
+        the first time it is touched and cached for later lookups.
+
+        Args:
+            parentid: Synapse id of a container
+
+        Returns:
+            Entity headers of the children by name
+        """
+        with self._cache_lock:
+            children = self._children_cache.get(parentid)
+            if children is not None:
+                self.cache_hits += 1
+                return children
+            parent_lock = self._parent_locks.setdefault(parentid,
+                                                        threading.Lock())
+        # Only one thread lists a container
+        with parent_lock:
+            with self._cache_lock:
+                children = self._children_cache.get(parentid)
+                if children is not None:
+                    self.cache_hits += 1
+                    return children
+            children = {child['name']: child
+                        for child in self._call("getChildren", parentid)}
+            with self._cache_lock:
+                self._children_cache[parentid] = children
+                self.cache_misses += 1
+        return children
+
+    def _cache_entity(self, entity: SynapseCls):
+        """Adds a stored entity to the children of its parent.  A new
+        container has no children, so its listing is cached as empty.
+
+        Args:
+            entity: Stored synapseclient Entity
+        """
+        header = {'id': entity.id, 'name': entity.name,
+                  'type': entity.properties.concreteType}
+        with self._cache_lock:
+            children = self._children_cache.get(
+                entity.properties.get("parentId", None)
+            )
+            if children is not None:
+                children[entity.name] = header
+            if isinstance(entity, (Project, Folder)):
+                self._children_cache.setdefault(entity.id, {})
+
+    def _invalidate_children(self, parentid: str):
+        """Removes the cached children of a container
+
+        Args:
+            parentid: Synapse id of a container
+        """
+        with self._cache_lock:
+            self._children_cache.pop(parentid, None)
+
+    def _find_child(self, entity_name: str, parentid: str) -> dict:
+        """Find the header of an Entity by its name and parent.
+        Children of a container are found in the cached listing
+        of the container and projects with a single lookup by name.
+
+        Args:
+            entity_name: Name of Entity
+            parentid: Synapse parentid. None for projects.
+
+        Returns:
+            Entity header with id, name and type or None if the
+            entity doesn't exist
+        """
+        if parentid is None:
+            entityid = self._lookup(
+                ("project", entity_name),
+                functools.partial(self._call, "findEntityId", entity_name)
+            )
+            if entityid is None:
+                return None
+            # Only projects can be stored without a parent
+            return {'id': entityid, 'name': entity_name,
+                    'type': Project._synapse_entity_type}
+        return self._get_children(parentid).get(entity_name)
 
     def _find_entity_by_name(self, entity_name: str, parentid: str,
                              concrete_type: str) -> SynapseCls:
@@ -40,20 +351,28 @@ class SynapseCreation:
             concrete_type: Type of Entity
 
         Returns:
-            Entity
+            Entity or None if the entity doesn't exist.  Projects and
+            folders are built from their header.
         """
         # This does not recursively look through containers of containers.
         # You must always specify the parentid of the entity you are
         # trying to find
-        entity_obj = self.syn.findEntityId(entity_name, parent=parentid)
-        # TODO: when entity doesn't exist, don't do this get
-        new_obj = self.syn.get(entity_obj['id'], downloadFile=False)
-        assert concrete_type == new_obj.properties.concreteType, (
+        header = self._find_child(entity_name, parentid)
+        if header is None:
+            return None
+        assert concrete_type == header['type'], (
             f"Retrieved '{entity_name}' had type "
-            f"'{new_obj.properties.concreteType}' "
+            f"'{header['type']}' "
             f"rather than the expected type '{concrete_type}'."
         )
-        return new_obj
+        if concrete_type in HEADER_TYPES:
+            # The header has everything needed to use a container as a
+            # parent or to set its ACL, so it isn't fetched
+            return Entity.create({'id': header['id'], 'name': entity_name,
+                                  'parentId': parentid,
+                                  'concreteType': header['type']})
+        # Files, views and schemas are returned with all of their fields
+        return self._call("get", header['id'], downloadFile=False)
 
     def _get_obj(self, obj: SynapseCls) -> SynapseCls:
         """Gets the object from Synapse based on object constructor
@@ -65,7 +384,7 @@ class SynapseCreation:
             obj: synapseclient Object
 
         """
-        if isinstance(obj, (Project, File, Folder, EntityViewSchema, Schema)):
+        if isinstance(obj, ENTITY_CLASSES):
             # Can't syn.get a File constructor that hasn't been stored
             # So must run these rest calls to obtain the entity
             obj = self._find_entity_by_name(
@@ -74,12 +393,15 @@ class SynapseCreation:
                 concrete_type=obj.properties.concreteType
             )
         elif isinstance(obj, Team):
-            obj = self.syn.getTeam(obj.name)
+            obj = self._lookup(("team", obj.name),
+                               functools.partial(self._get_team, obj.name))
         elif isinstance(obj, Wiki):
             # Only gets the root wiki page
-            obj = self.syn.getWiki(obj.ownerId)
+            obj = self._call("getWiki", obj.ownerId)
         elif isinstance(obj, Evaluation):
-            obj = self.syn.getEvaluationByName(obj.name)
+            obj = self._lookup(("evaluation", obj.name),
+                               functools.partial(self._get_evaluation,
+                                                 obj.name))
         else:
             raise ValueError(f"{obj} not recognized")
         return obj
@@ -93,8 +415,16 @@ class SynapseCreation:
         Returns:
             A synapseclient Object
         """
+        if self.existing_first and isinstance(obj, ENTITY_CLASSES):
+            existing = self._get_obj(obj)
+            if existing is not None:
+                if not self.only_get:
+                    raise ValueError(f"{obj.name} already exists. To use "
+                                     "existing entities, set only_get "
+                                     "to True.")
+                return existing
         try:
-            obj = self.syn.store(obj, createOrUpdate=False)
+            obj = self._call("store", obj, createOrUpdate=False)
         except SynapseHTTPError as err:
             # 409 is the NameConflictError that occurs when trying to
             # upload an entity that has the same name
@@ -103,7 +433,26 @@ class SynapseCreation:
             if not self.only_get:
                 raise ValueError(f"{str(err)}. To use existing entities, "
                                  "set only_get to True.")
+            if isinstance(obj, ENTITY_CLASSES):
+                # A cached listing of the parent may predate the
+                # conflicting entity
+                self._invalidate_children(
+                    obj.properties.get("parentId", None)
+                )
+            # So may a lookup that found nothing
+            key = self._lookup_key(obj)
+            if key is not None:
+                self._forget(key)
             obj = self._get_obj(obj)
+            if obj is None:
+                raise ValueError(f"{str(err)}. The conflicting entity "
+                                 "could not be found.")
+        else:
+            if isinstance(obj, ENTITY_CLASSES):
+                self._cache_entity(obj)
+            key = self._lookup_key(obj)
+            if key is not None:
+                self._forget(key)
         return obj
 
     def get_or_create_project(self, **kwargs) -> Project:
@@ -159,6 +508,21 @@ class SynapseCreation:
                                                     folder_ent.id))
         return folder_ent
 
+    def create_folders(self, folders: List[dict]) -> List[Folder]:
+        """Gets or creates folders that don't depend on each other with
+        the folder backend
+
+        Args:
+            folders: Name and parentId of every folder
+
+        Returns:
+            A synapseclient.Folder for every folder, in the same order
+        """
+        if self.folder_backend is None:
+            return [self.get_or_create_folder(**folder)
+                    for folder in folders]
+        return self.folder_backend.create_folders(self, folders)
+
     def get_or_create_view(self, **kwargs) -> EntityViewSchema:
         """Gets an existing view schema by name and parent or
         creates a new one.
@@ -234,10 +598,31 @@ class SynapseCreation:
                                              wiki.title))
         return wiki
 
-    def get_or_create_queue(self, **kwargs) -> Evaluation:
+    def get_project_queues(self, project: Union[Project, str]) -> dict:
+        """Gets the evaluation queues of a project with one listing.
+        The queues are cached for later lookups by name.
+
+        Args:
+            project: A synapseclient.Project or project id
+
+        Returns:
+            Evaluation queues of the project by name
+        """
+        queues = {queue.name: queue for queue in
+                  self._call("getEvaluationByContentSource", project)}
+        with self._lookup_lock:
+            for name, queue in queues.items():
+                self._lookups[("evaluation", name)] = (queue, None)
+        return queues
+
+    def get_or_create_queue(self, existing: Dict[str, Evaluation] = None,
+                            **kwargs) -> Evaluation:
         """Gets an existing evaluation queue by name or creates a new one.
 
         Args:
+            existing: Queues of the project by name from
+                      get_project_queues. Queues that aren't in it are
+                      created without being looked up first.
             Same arguments as synapseclient.Evaluation
 
         Returns:
@@ -245,11 +630,120 @@ class SynapseCreation:
 
         """
         queue = Evaluation(**kwargs)
-        queue = self._find_by_obj_or_create(queue)
+        found = existing.get(queue.name) if existing is not None else None
+        if found is None:
+            queue = self._find_by_obj_or_create(queue)
+        elif not self.only_get:
+            raise ValueError(f"{queue.name} already exists. To use "
+                             "existing entities, set only_get to True.")
+        else:
+            queue = found
         self.logger.info('{} Queue {}({})'.format(self._update_str,
                                                   queue.name, queue.id))
         return queue
 
+    def get_team_invitees(self, team: Union[Team, str]) -> dict:
+        """Gets everyone who is a member of a team or has an open
+        invitation to it, with one listing of each.
+
+        Args:
+            team: A synapseclient.Team or team id
+
+        Returns:
+            dict with the principal ids of members, and the principal
+            ids and emails with open invitations
+        """
+        members = {str(member['member']['ownerId'])
+                   for member in self._call("getTeamMembers", team)}
+        invited_ids = set()
+        invited_emails = set()
+        for invitation in self._call("get_team_open_invitations", team):
+            if invitation.get('inviteeId') is not None:
+                invited_ids.add(str(invitation['inviteeId']))
+            if invitation.get('inviteeEmail') is not None:
+                invited_emails.add(invitation['inviteeEmail'])
+        return {'members': members, 'invited_ids': invited_ids,
+                'invited_emails': invited_emails}
+
+    def invite_to_team(self, team: Union[Team, str], invitees: dict,
+                       principalId: str = None, inviteeEmail: str = None,
+                       message: str = None) -> dict:
+        """Invites a user to a team unless they are already a member or
+        have an open invitation
+
+        Args:
+            team: A synapseclient.Team or team id
+            invitees: Members and open invitations of the team from
+                      get_team_invitees
+            principalId: Synapse user id
+            inviteeEmail: Email of user
+            message: Message for the user getting invited
+
+        Returns:
+            MembershipInvitation or None if no invitation was sent
+        """
+        if principalId is not None:
+            principalId = str(principalId)
+            if principalId in invitees['members'] or \
+                    principalId in invitees['invited_ids']:
+                self.logger.info("Skipped invitation of {}".format(
+                    principalId
+                ))
+                return None
+        elif inviteeEmail in invitees['invited_emails']:
+            self.logger.info("Skipped invitation of {}".format(
+                inviteeEmail
+            ))
+            return None
+        invitation = self._call(
+            "send_membership_invitation", id_of(team),
+            inviteeId=principalId, inviteeEmail=inviteeEmail,
+            message=message
+        )
+        self.logger.info("Invited {} to Team {}".format(
+            principalId or inviteeEmail, id_of(team)
+        ))
+        return invitation
+
+    def set_acl(self, entity: Union[File, Folder, Project],
+                acl_config: dict) -> dict:
+        """Sets ACLs to Synapse entity.  All entries are merged into the
+        ACL of the entity which is written with a single call, and
+        nothing is written when the ACL already has the entries.
+
+        Args:
+            entity: Synapse Folder or Project
+            acl_config: ACL template json configuration
+
+        Returns:
+            The AccessControlList of the entity
+
+        """
+        if not acl_config:
+            return None
+        entityid = id_of(entity)
+        uri = f"/entity/{entityid}/acl"
+        try:
+            acl = self._call("restGET", uri)
+            has_acl = True
+        except SynapseHTTPError as err:
+            # 404 is returned when the entity inherits its ACL
+            if err.response.status_code != 404:
+                raise err
+            has_acl = False
+            benefactor = self._call("restGET",
+                                    f"/entity/{entityid}/benefactor")
+            benefactor_acl = self._call("restGET",
+                                        f"/entity/{benefactor['id']}/acl")
+            # Start from the inherited permissions like setPermissions does
+            acl = {'id': entityid,
+                   'resourceAccess': benefactor_acl['resourceAccess']}
+        if not _merge_acl(acl, acl_config) and has_acl:
+            return acl
+        if has_acl:
+            return self._call("restPUT", uri, json.dumps(acl))
+        return self._call("restPOST", uri, json.dumps(acl))
+
     def _get_challenge(self, projectId: str) -> dict:
         """Gets the Challenge associated with a Project.
 
@@ -264,7 +758,7 @@ class SynapseCreation:
             https://docs.synapse.org/rest/org/sagebionetworks/repo/model/Challenge.html
 
         """
-        challenge = self.syn.restGET(f"/entity/{projectId}/challenge")
+        challenge = self._call("restGET", f"/entity/{projectId}/challenge")
         return challenge
 
     def _create_challenge(self, projectId: str,
@@ -285,8 +779,8 @@ class SynapseCreation:
         """
         challenge_object = {'participantTeamId': participantTeamId,
                             'projectId': projectId}
-        challenge = self.syn.restPOST('/challenge',
-                                      json.dumps(challenge_object))
+        challenge = self._call("restPOST", '/challenge',
+                               json.dumps(challenge_object))
         return challenge
 
     def get_or_create_challenge(self, **kwargs) -> dict:
@@ -316,16 +810,140 @@ class SynapseCreation:
         return challenge
 
 
+class AsyncSynapseCreation:
+    """Creates Synapse Features with asyncio.  synapseclient calls are
+    blocking, so every call is run in a thread pool and a semaphore
+    bounds the number of calls in flight."""
+    def __init__(self, syn: Synapse, only_get: bool = False,
+                 logger: Logger = None, concurrency: int = 100,
+                 rate_limiter: RateLimiter = None):
+        """
+        Args:
+            syn: Synapse connection
+            only_get: Only get entities. See SynapseCreation.
+            concurrency: Maximum number of Synapse calls in flight.
+                         Default is 100.
+            rate_limiter: Limits the rate of Synapse calls.
+                          See SynapseCreation.
+        """
+        self.creation_cls = SynapseCreation(syn, only_get=only_get,
+                                            logger=logger,
+                                            rate_limiter=rate_limiter)
+        self.syn = syn
+        self.concurrency = concurrency
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        # The semaphore is created in the running event loop
+        self._semaphore = None
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """Runs a blocking function in the thread pool once a slot is
+        available
+
+        Args:
+            func: Blocking function
+            *args, **kwargs: Arguments passed to the function
+
+        Returns:
+            Return value of the function
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(
+                self._executor, functools.partial(func, *args, **kwargs)
+            )
+
+    def close(self):
+        """Shuts down the thread pool"""
+        self._executor.shutdown(wait=True)
+
+    async def get_or_create_project(self, **kwargs) -> Project:
+        """See SynapseCreation.get_or_create_project"""
+        return await self.run(self.creation_cls.get_or_create_project,
+                              **kwargs)
+
+    async def get_or_create_file(self, **kwargs) -> File:
+        """See SynapseCreation.get_or_create_file"""
+        return await self.run(self.creation_cls.get_or_create_file,
+                              **kwargs)
+
+    async def get_or_create_folder(self, **kwargs) -> Folder:
+        """See SynapseCreation.get_or_create_folder"""
+        return await self.run(self.creation_cls.get_or_create_folder,
+                              **kwargs)
+
+    async def get_or_create_view(self, **kwargs) -> EntityViewSchema:
+        """See SynapseCreation.get_or_create_view"""
+        return await self.run(self.creation_cls.get_or_create_view,
+                              **kwargs)
+
+    async def get_or_create_schema(self, **kwargs) -> Schema:
+        """See SynapseCreation.get_or_create_schema"""
+        return await self.run(self.creation_cls.get_or_create_schema,
+                              **kwargs)
+
+    async def get_or_create_team(self, **kwargs) -> Team:
+        """See SynapseCreation.get_or_create_team"""
+        return await self.run(self.creation_cls.get_or_create_team,
+                              **kwargs)
+
+    async def get_or_create_wiki(self, **kwargs) -> Wiki:
+        """See SynapseCreation.get_or_create_wiki"""
+        return await self.run(self.creation_cls.get_or_create_wiki,
+                              **kwargs)
+
+    async def get_or_create_queue(self, **kwargs) -> Evaluation:
+        """See SynapseCreation.get_or_create_queue"""
+        return await self.run(self.creation_cls.get_or_create_queue,
+                              **kwargs)
+
+    async def get_or_create_challenge(self, **kwargs) -> dict:
+        """See SynapseCreation.get_or_create_challenge"""
+        return await self.run(self.creation_cls.get_or_create_challenge,
+                              **kwargs)
+
+
+def _merge_acl(acl: dict, acl_config: list) -> bool:
+    """Merges ACL template entries into an AccessControlList.  The
+    access types of a principal are replaced by the configured ones.
+
+    Args:
+        acl: AccessControlList dict, modified in place
+        acl_config: ACL template json configuration
+
+    Returns:
+        True if the ACL was changed
+    """
+    changed = False
+    resource_access = {int(access['principalId']): access
+                       for access in acl.setdefault('resourceAccess', [])}
+    for config in acl_config:
+        principalid = int(config['principal_id'])
+        access_type = list(config['access_type'])
+        access = resource_access.get(principalid)
+        if access is None:
+            access = {'principalId': principalid, 'accessType': access_type}
+            acl['resourceAccess'].append(access)
+            resource_access[principalid] = access
+            changed = True
+        elif set(access['accessType']) != set(access_type):
+            access['accessType'] = access_type
+            changed = True
+    return changed
+
+
 def _set_acl(syn: Synapse, entity: Union[File, Folder, Project],
-             acl_config: dict):
-    """Sets ACLs to Synapse entity
+             acl_config: dict) -> dict:
+    """Sets ACLs to Synapse entity.  See SynapseCreation.set_acl
 
     Args:
         syn: Synapse connection
         entity: Synapse Folder or Project
         acl_config: ACL template json configuration
 
+    Returns:
+        The AccessControlList of the entity
+
     """
-    for acl in acl_config:
-        syn.setPermissions(entity=entity, principalId=acl['principal_id'],
-                           accessType=acl['access_type'])
+    return SynapseCreation(syn).set_acl(entity=entity, acl_config=acl_config)
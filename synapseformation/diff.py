@@ -0,0 +1,220 @@
+"""Compares a template with the resources that exist in Synapse"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from synapseclient import Folder, Project, Team
+from synapseclient.core.exceptions import SynapseHTTPError
+
+from . import planner
+from .create import SynapseCreation
+from .planner import ExecutionPlan, Operation
+
+MISSING = "missing"
+EXTRA = "extra"
+DRIFTED = "drifted"
+ENTITY_TYPES = {planner.PROJECT: Project._synapse_entity_type,
+                planner.FOLDER: Folder._synapse_entity_type}
+
+
+def _difference(change: str, resource: str, path: str,
+                detail: str = None) -> dict:
+    return {'change': change, 'resource': resource, 'path': path,
+            'detail': detail}
+
+
+def _acl_differences(acl: dict, acl_config: list) -> List[str]:
+    """Describes the ACL entries of a template that an ACL lacks.
+    Principals that aren't in the template are kept by applies, so
+    they aren't differences."""
+    access = {int(entry['principalId']): set(entry['accessType'])
+              for entry in acl.get('resourceAccess', [])}
+    details = []
+    for config in acl_config:
+        principalid = int(config['principal_id'])
+        expected = set(config['access_type'])
+        actual = access.get(principalid)
+        if actual is None:
+            details.append(f"principal {principalid} has no access")
+        elif actual != expected:
+            details.append(f"principal {principalid} has "
+                           f"{sorted(actual)}, not {sorted(expected)}")
+    return details
+
+
+class TemplateDiff:
+    """Finds the resources of a template that are missing or drifted in
+    Synapse, and the folders in Synapse that the template lacks.  Each
+    container with children in the template is listed once and the
+    operations of a plan wave are compared concurrently, so entities
+    aren't looked up one by one."""
+    def __init__(self, creation_cls: SynapseCreation, workers: int = 8):
+        """
+        Args:
+            creation_cls: SynapseCreation whose calls and children cache
+                          are used
+            workers: Number of concurrent lookups
+        """
+        self.creation_cls = creation_cls
+        self.workers = workers
+        # Entity headers of the template entities by plan key
+        self._headers = {}
+        # Evaluation queues of the template projects by plan key
+        self._queues = {}
+
+    def _diff_entity(self, operation: Operation) -> List[dict]:
+        config = operation.config
+        if operation.parent is None:
+            parentid = operation.parentid
+        else:
+            parent = self._headers.get(operation.parent.key)
+            # The children of a missing container are missing as well
+            if parent is None:
+                return []
+            parentid = parent['id']
+        header = self.creation_cls._find_child(config['name'], parentid)
+        if header is None:
+            return [_difference(MISSING, "entity", operation.key)]
+        expected = ENTITY_TYPES[operation.kind]
+        if header['type'] != expected:
+            return [_difference(DRIFTED, "entity", operation.key,
+                                f"is a {header['type']}, not a {expected}")]
+        self._headers[operation.key] = header
+        differences = []
+        benefactorid = header.get('benefactorId')
+        if operation.kind == planner.FOLDER and 'acl' not in config and \
+                benefactorid == header['id']:
+            differences.append(_difference(EXTRA, "acl", operation.key))
+        names = {child['name'] for child in config.get('children', [])}
+        # Folders without children in the template hold data, so they
+        # aren't listed
+        if not names:
+            return differences
+        # Listing the children here fetches them for the next wave
+        for name, child in sorted(
+                self.creation_cls._get_children(header['id']).items()):
+            if name not in names and \
+                    child['type'] in ENTITY_TYPES.values():
+                differences.append(_difference(
+                    EXTRA, "entity", f"{operation.key}/{name}",
+                    child['type']
+                ))
+        return differences
+
+    def _diff_acl(self, operation: Operation) -> List[dict]:
+        header = self._headers.get(operation.parent.key)
+        if header is None:
+            return []
+        benefactorid = header.get('benefactorId')
+        if benefactorid is not None and benefactorid != header['id']:
+            return [_difference(MISSING, "acl", operation.key,
+                                f"inherits the ACL of {benefactorid}")]
+        try:
+            acl = self.creation_cls._call("restGET",
+                                          f"/entity/{header['id']}/acl")
+        except SynapseHTTPError as err:
+            # 404 is returned when the entity inherits its ACL
+            if err.response.status_code != 404:
+                raise err
+            return [_difference(MISSING, "acl", operation.key,
+                                "inherits its ACL")]
+        return [_difference(DRIFTED, "acl", operation.key, detail)
+                for detail in _acl_differences(acl,
+                                               operation.config['acl'])]
+
+    def _diff_team(self, operation: Operation) -> List[dict]:
+        config = operation.config
+        team = self.creation_cls._get_obj(Team(name=config['name']))
+        if team is None:
+            return [_difference(MISSING, "team", operation.key)]
+        differences = []
+        if team.get('description') != config['description']:
+            differences.append(_difference(DRIFTED, "team", operation.key,
+                                           "description differs"))
+        if bool(team.get('canPublicJoin')) != config['can_public_join']:
+            differences.append(_difference(
+                DRIFTED, "team", operation.key,
+                f"canPublicJoin is {bool(team.get('canPublicJoin'))}"
+            ))
+        return differences
+
+    def _diff_queues(self, operation: Operation) -> List[dict]:
+        header = self._headers.get(operation.parent.key)
+        if header is not None:
+            # Listed once for all queues of the project
+            self._queues[operation.parent.key] = \
+                self.creation_cls.get_project_queues(header['id'])
+        return []
+
+    def _diff_queue(self, operation: Operation) -> List[dict]:
+        queues = self._queues.get(operation.parent.key)
+        if queues is None:
+            return []
+        config = operation.config
+        queue = queues.get(config['name'])
+        if queue is None:
+            return [_difference(MISSING, "queue", operation.key)]
+        return [_difference(DRIFTED, "queue", operation.key,
+                            f"{key} differs")
+                for key, field in planner.QUEUE_FIELDS.items()
+                if key in config and queue.get(field) != config[key]]
+
+    def _diff_operation(self, operation: Operation) -> List[dict]:
+        with self.creation_cls.recorder.resource(operation.kind):
+            if operation.kind in ENTITY_TYPES:
+                return self._diff_entity(operation)
+            if operation.kind == planner.ACL:
+                return self._diff_acl(operation)
+            if operation.kind == planner.TEAM:
+                return self._diff_team(operation)
+            if operation.kind == planner.EVALUATIONS:
+                return self._diff_queues(operation)
+            if operation.kind == planner.EVALUATION:
+                return self._diff_queue(operation)
+        # Invitations and challenges aren't compared
+        return []
+
+    def diff(self, plan: ExecutionPlan) -> List[dict]:
+        """Compares the resources of a plan with Synapse
+
+        Args:
+            plan: Execution plan of a template
+
+        Returns:
+            Differences sorted by path, each with the change (missing,
+            extra or drifted), the resource type (entity, acl, team or
+            queue), the path in the template and a detail or None
+        """
+        differences = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for wave in plan.waves():
+                for found in executor.map(self._diff_operation, wave):
+                    differences.extend(found)
+        return sorted(differences, key=lambda difference: (
+            difference['path'], difference['resource']
+        ))
+
+
+def diff_template(creation_cls: SynapseCreation, config_list: List[dict],
+                  workers: int = 8) -> List[dict]:
+    """Compares an expanded template with Synapse.  Missing containers
+    are reported without their children.
+
+    Args:
+        creation_cls: SynapseCreation whose calls are used
+        config_list: Expanded template
+        workers: Number of concurrent lookups
+
+    Returns:
+        Differences. See TemplateDiff.diff
+    """
+    plan = planner.compile_plan(config_list=config_list)
+    return TemplateDiff(creation_cls, workers=workers).diff(plan)
+
+
+def format_difference(difference: dict) -> str:
+    """Formats a difference as a line of a report"""
+    line = (f"{difference['change']:<8} {difference['resource']:<7} "
+            f"{difference['path']}")
+    if difference['detail'] is not None:
+        line += f": {difference['detail']}"
+    return line
@@ -0,0 +1,92 @@
+"""Expands shortened templates to the full template format"""
+import itertools
+from string import Template
+from typing import Iterable, Iterator, Union
+
+# Key of the list of resources in templates that also hold anchors
+RESOURCES_KEY = "Resources"
+
+
+def _substitute(value, params: dict):
+    """Copies a configuration, substituting ${param} in every string"""
+    if isinstance(value, str):
+        return Template(value).safe_substitute(params) if params else value
+    if isinstance(value, dict):
+        return {key: _substitute(item, params) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_substitute(item, params) for item in value]
+    return value
+
+
+def _iter_params(config: dict, params: dict) -> Iterator[dict]:
+    """Yields the parameters of every repetition of a resource.
+    for_each maps parameter names to lists of values and a resource is
+    repeated for every combination of values."""
+    for_each = config.get('for_each')
+    if not for_each:
+        yield params
+        return
+    names = list(for_each)
+    for values in itertools.product(*(for_each[name] for name in names)):
+        yield {**params, **dict(zip(names, values))}
+
+
+def _expand_resource(config: Union[str, dict],
+                     params: dict) -> Iterator[dict]:
+    """Expands a single resource of a template
+
+    Args:
+        config: Resource configuration or the name of a folder
+        params: Parameters substituted into the configuration
+
+    Yields:
+        Expanded resources
+    """
+    # Folders can be listed by name
+    if isinstance(config, str):
+        yield {'name': _substitute(config, params), 'type': "Folder"}
+        return
+    for resource_params in _iter_params(config, params):
+        # Copy every resource so a subtree used through a yaml alias
+        # gets its own ids
+        resource = {key: _substitute(value, resource_params)
+                    for key, value in config.items()
+                    if key not in ('children', 'for_each')}
+        resource.setdefault('type', "Folder")
+        children = config.get('children')
+        if children is not None:
+            resource['children'] = list(expand_config(children,
+                                                      resource_params))
+        yield resource
+
+
+def expand_config(config: Union[Iterable, dict],
+                  params: dict = None) -> Iterator[dict]:
+    """Expands shortened configuration to the full template format.
+    The full format is left unchanged.
+
+    * Folders can be listed by name or without a type
+    * Resources with for_each are repeated for every combination of
+      its parameters, which are substituted as ${param} anywhere in
+      the resource and its children
+    * Templates can be a mapping of yaml anchors with the resources
+      listed under the Resources key
+
+    Only top level resources are expanded lazily, one at a time.  The
+    children of a resource are expanded in full, so every top level
+    resource is held in memory with all of its children.
+
+    Args:
+        config: List of resources or mapping with a Resources key
+        params: Parameters substituted into the configuration
+
+    Yields:
+        Expanded top level resources
+    """
+    if isinstance(config, dict):
+        if RESOURCES_KEY not in config:
+            raise ValueError(f"Template must be a list of resources or "
+                             f"have a '{RESOURCES_KEY}' key")
+        config = config[RESOURCES_KEY]
+    for resource in config:
+        yield from _expand_resource(resource, params or {})
@@ -0,0 +1,164 @@
+"""Generates large templates for scale testing"""
+import itertools
+import json
+import random
+from typing import Iterable, Iterator, TextIO
+
+# Principals of the generated ACLs
+AUTHENTICATED_USERS = 273948
+PUBLIC = 273949
+_EMPTY = object()
+
+
+def _acl(rand: random.Random, acl_density: float) -> dict:
+    """ACL entries of a resource, or nothing for most resources when
+    the density is low"""
+    if acl_density <= 0 or rand.random() >= acl_density:
+        return {}
+    return {'acl': [{'principal_id': AUTHENTICATED_USERS,
+                     'access_type': ['READ', 'DOWNLOAD']},
+                    {'principal_id': PUBLIC, 'access_type': ['READ']}]}
+
+
+def _folders(rand: random.Random, path: str, breadth: int, depth: int,
+             acl_density: float) -> Iterator[dict]:
+    """Yields the folders of one level.  Children are generators so
+    only the folders being written are held in memory."""
+    for index in range(1, breadth + 1):
+        folder_path = f"{path}_{index}" if path else str(index)
+        folder = {'name': f"folder_{folder_path}", 'type': "Folder"}
+        folder.update(_acl(rand, acl_density))
+        if depth > 1:
+            folder['children'] = _folders(rand, folder_path, breadth,
+                                          depth - 1, acl_density)
+        yield folder
+
+
+def generate_template(projects: int = 1, breadth: int = 10, depth: int = 2,
+                      acl_density: float = 0.0, teams: int = 0,
+                      invitations: int = 0,
+                      seed: int = None) -> Iterator[dict]:
+    """Lazily generates the top level resources of a template
+
+    Args:
+        projects: Number of projects
+        breadth: Number of folders in every project and folder
+        depth: Levels of folders in every project
+        acl_density: Fraction of projects and folders with an ACL
+        teams: Number of teams
+        invitations: Number of members invited to every team
+        seed: Seed of the ACL placement
+
+    Yields:
+        Top level resources.  Children are generators.
+    """
+    rand = random.Random(seed)
+    for team in range(1, teams + 1):
+        resource = {'name': f"Team {team}", 'type': "Team",
+                    'can_public_join': False,
+                    'description': f"Generated team {team}"}
+        if invitations:
+            resource['invitations'] = [{
+                'message': "Generated invitation",
+                'members': [
+                    {'email': f"team{team}.member{member}@example.org"}
+                    for member in range(1, invitations + 1)
+                ]
+            }]
+        yield resource
+    for project in range(1, projects + 1):
+        resource = {'name': f"Project {project}", 'type': "Project"}
+        resource.update(_acl(rand, acl_density))
+        if depth > 0:
+            resource['children'] = _folders(rand, "", breadth, depth,
+                                            acl_density)
+        yield resource
+
+
+def _peek(items: Iterable):
+    """Splits the first item off an iterable without consuming more"""
+    items = iter(items)
+    first = next(items, _EMPTY)
+    if first is _EMPTY:
+        return None
+    return itertools.chain([first], items)
+
+
+def _write_yaml_items(out: TextIO, items: Iterable, indent: int):
+    for item in items:
+        prefix = " " * indent + "- "
+        if isinstance(item, dict):
+            _write_yaml_mapping(out, item, indent + 2, prefix)
+        else:
+            out.write(f"{prefix}{json.dumps(item)}\n")
+
+
+def _write_yaml_mapping(out: TextIO, mapping: dict, indent: int,
+                        first_prefix: str):
+    prefix = first_prefix
+    for key, value in mapping.items():
+        if isinstance(value, dict):
+            if value:
+                out.write(f"{prefix}{key}:\n")
+                _write_yaml_mapping(out, value, indent + 2,
+                                    " " * (indent + 2))
+            else:
+                out.write(f"{prefix}{key}: {{}}\n")
+        elif isinstance(value, (list, Iterator)):
+            items = _peek(value)
+            if items is None:
+                out.write(f"{prefix}{key}: []\n")
+            else:
+                out.write(f"{prefix}{key}:\n")
+                _write_yaml_items(out, items, indent)
+        else:
+            # JSON scalars are valid YAML
+            out.write(f"{prefix}{key}: {json.dumps(value)}\n")
+        prefix = " " * indent
+
+
+def _write_json_value(out: TextIO, value):
+    if isinstance(value, dict):
+        out.write("{")
+        for index, (key, item) in enumerate(value.items()):
+            if index:
+                out.write(", ")
+            out.write(f"{json.dumps(key)}: ")
+            _write_json_value(out, item)
+        out.write("}")
+    elif isinstance(value, (list, Iterator)):
+        out.write("[")
+        for index, item in enumerate(value):
+            if index:
+                out.write(", ")
+            _write_json_value(out, item)
+        out.write("]")
+    else:
+        out.write(json.dumps(value))
+
+
+def write_template(out: TextIO, resources: Iterable[dict],
+                   template_format: str = "yaml"):
+    """Streams a template to a file.  Resources and their children
+    can be generators, which are consumed as they are written.
+
+    Args:
+        out: Writable text file
+        resources: Top level resources
+        template_format: yaml or json
+    """
+    if template_format == "json":
+        out.write("[\n")
+        for index, resource in enumerate(resources):
+            if index:
+                out.write(",\n")
+            _write_json_value(out, resource)
+        out.write("\n]\n")
+    elif template_format == "yaml":
+        items = _peek(resources)
+        if items is None:
+            out.write("[]\n")
+        else:
+            _write_yaml_items(out, items, 0)
+    else:
+        raise ValueError(f"Unknown template format '{template_format}'")
@@ -0,0 +1,225 @@
+"""Timing of Synapse calls"""
+from collections import Counter
+from contextlib import contextmanager
+import json
+import math
+import threading
+from typing import Dict, List
+import weakref
+
+import requests
+from synapseclient import Synapse
+from synapseclient.client import DEFAULT_RETRY_STATUS_CODES
+
+# Resource type of calls made outside of a plan operation
+OTHER_RESOURCE = "other"
+PERCENTILES = (50, 95, 99)
+# Status codes of the responses synapseclient retries requests on
+RETRY_STATUS_CODES = tuple(DEFAULT_RETRY_STATUS_CODES)
+# Requests sessions whose retryable responses are counted
+_COUNTED_SESSIONS = weakref.WeakSet()
+_responses = threading.local()
+
+
+def _count_response(response, *args, **kwargs):
+    if response.status_code in RETRY_STATUS_CODES:
+        _responses.retryable = retryable_responses() + 1
+
+
+def retryable_responses() -> int:
+    """Number of responses the current thread received that
+    synapseclient retries, such as throttles"""
+    return getattr(_responses, 'retryable', 0)
+
+
+def count_retries(syn: Synapse):
+    """Counts the retryable responses of a Synapse connection.
+    synapseclient retries them within a call, so they are only seen by
+    the requests session.  Connections are only counted once.
+
+    Args:
+        syn: Synapse connection
+    """
+    session = getattr(syn, "_requests_session", None)
+    if not isinstance(session, requests.Session) or \
+            session in _COUNTED_SESSIONS:
+        return
+    _COUNTED_SESSIONS.add(session)
+    session.hooks['response'].append(_count_response)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile
+
+    Args:
+        values: Sorted values
+        pct: Percentile between 0 and 100
+
+    Returns:
+        The percentile or None if there are no values
+    """
+    if not values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+class _CallStats:
+    """Latencies, statuses and retries of one kind of call"""
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.retries = 0
+
+    def merge(self, other: '_CallStats'):
+        self.latencies.extend(other.latencies)
+        self.statuses.update(other.statuses)
+        self.retries += other.retries
+
+    def summary(self) -> dict:
+        latencies = sorted(self.latencies)
+        summary = {
+            'count': len(latencies),
+            'errors': sum(count for status, count in self.statuses.items()
+                          if status != "ok"),
+            'statuses': dict(self.statuses),
+            'retries': self.retries,
+            'total': sum(latencies),
+            'max': latencies[-1] if latencies else None
+        }
+        for pct in PERCENTILES:
+            summary[f'p{pct}'] = percentile(latencies, pct)
+        return summary
+
+
+class CallRecorder:
+    """Records the latency, status and retries of every Synapse call
+    by method and by the type of resource being created.  Calls are
+    recorded by SynapseCreation and can come from many threads."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {}
+
+    def __getstate__(self):
+        # Recorders of worker processes are sent back to be merged
+        with self._lock:
+            return {'stats': self._stats}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self._stats = state['stats']
+
+    def merge(self, other: 'CallRecorder'):
+        """Adds the calls recorded by another recorder
+
+        Args:
+            other: Recorder such as the one of another process
+        """
+        with other._lock:
+            stats = list(other._stats.items())
+        with self._lock:
+            for key, other_stats in stats:
+                self._stats.setdefault(key, _CallStats()).merge(other_stats)
+
+    @property
+    def kind(self) -> str:
+        """Resource type the calls of the current thread are attributed
+        to, or None"""
+        return getattr(self._local, 'kind', None)
+
+    @contextmanager
+    def resource(self, kind: str):
+        """Attributes the calls of the current thread to a resource type
+
+        Args:
+            kind: Resource type such as an operation kind of a plan
+        """
+        previous = self.kind
+        self._local.kind = kind
+        try:
+            yield
+        finally:
+            self._local.kind = previous
+
+    def record(self, method: str, latency: float, status: str = "ok",
+               retries: int = 0):
+        """Records a Synapse call
+
+        Args:
+            method: Name of the synapseclient.Synapse method
+            latency: Seconds the call took, including retries
+            status: "ok" or the status code or error of a failed call
+            retries: Number of times the call was retried
+        """
+        kind = self.kind or OTHER_RESOURCE
+        with self._lock:
+            stats = self._stats.get((method, kind))
+            if stats is None:
+                stats = self._stats[(method, kind)] = _CallStats()
+            stats.latencies.append(latency)
+            stats.statuses[str(status)] += 1
+            stats.retries += retries
+
+    def _group(self, index: int) -> Dict[str, _CallStats]:
+        groups = {}
+        with self._lock:
+            for key, stats in self._stats.items():
+                groups.setdefault(key[index], _CallStats()).merge(stats)
+        return groups
+
+    def report(self) -> dict:
+        """Aggregates the recorded calls
+
+        Returns:
+            dict with the number of calls and the statistics of the calls
+            by method and by resource type.  Latencies are in seconds.
+        """
+        methods = {method: stats.summary()
+                   for method, stats in sorted(self._group(0).items())}
+        resources = {kind: stats.summary()
+                     for kind, stats in sorted(self._group(1).items())}
+        return {'calls': sum(stats['count'] for stats in methods.values()),
+                'methods': methods, 'resources': resources}
+
+    def table(self, report: dict = None) -> str:
+        """Formats a report as a table of calls by method and by
+        resource type
+
+        Args:
+            report: Report from report(). Defaults to the current report.
+
+        Returns:
+            Table with latencies in milliseconds
+        """
+        report = report or self.report()
+        lines = []
+        for title, key in (("Method", 'methods'), ("Resource", 'resources')):
+            lines.append(f"{title:<28}{'Calls':>7}{'Errors':>8}"
+                         f"{'Retries':>9}{'p50 ms':>9}{'p95 ms':>9}"
+                         f"{'p99 ms':>9}")
+            for name, stats in report[key].items():
+                lines.append(
+                    f"{name:<28}{stats['count']:>7}{stats['errors']:>8}"
+                    f"{stats['retries']:>9}"
+                    + "".join(f"{stats[f'p{pct}'] * 1000:>9.1f}"
+                              for pct in PERCENTILES)
+                )
+            lines.append("")
+        return "\n".join(lines).rstrip()
+
+    def write(self, path: str, report: dict = None, **extra) -> dict:
+        """Writes a report as JSON
+
+        Args:
+            path: Path to the JSON report
+            report: Report from report(). Defaults to the current report.
+            **extra: Additional entries of the report
+
+        Returns:
+            The report
+        """
+        report = dict(report or self.report(), **extra)
+        with open(path, "w") as report_f:
+            json.dump(report, report_f, indent=2, sort_keys=True)
+        return report
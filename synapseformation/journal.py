@@ -0,0 +1,133 @@
+"""Journal of completed operations for resuming failed applies"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable
+
+from . import planner
+from .create import SynapseCreation
+from .planner import ExecutionPlan, Operation
+from .state import TRACKED_KINDS, _restore_result
+
+
+class Journal:
+    """Append-only log of the operations completed by an apply.  Every
+    completed operation is written as a JSON line and the file is
+    flushed periodically, so a run that dies only loses the last few
+    operations.  When resuming, journaled operations are skipped
+    without any Synapse call and the run continues from the frontier of
+    the plan."""
+    def __init__(self, path: str, template_path: str, resume: bool = False,
+                 flush_interval: float = 1.0,
+                 clock: Callable = time.monotonic, logger=None):
+        """
+        Args:
+            path: Path to the journal file
+            template_path: Path of the template being applied
+            resume: Skip the operations in an existing journal. Default
+                    is False, which starts a new journal.
+            flush_interval: Seconds between writes to disk
+        """
+        self.path = path
+        self.template_key = os.path.abspath(template_path)
+        self.flush_interval = flush_interval
+        self.logger = logger or logging.getLogger(__name__)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.completed = {}
+        self.resumed = 0
+        if resume and os.path.exists(path):
+            self._load()
+            self._file = open(path, "a")
+        else:
+            self._file = open(path, "w")
+            self._write({'template': self.template_key})
+        self._flushed = clock()
+
+    def _load(self):
+        with open(self.path, "r") as journal_f:
+            lines = journal_f.read().splitlines()
+        if not lines:
+            return
+        header = json.loads(lines[0])
+        if header.get('template') != self.template_key:
+            raise ValueError(f"Journal {self.path} is for template "
+                             f"{header.get('template')}, not "
+                             f"{self.template_key}")
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # The last line is cut off if the run died writing it
+                continue
+            self.completed[entry['key']] = entry
+
+    def _write(self, entry: dict):
+        self._file.write(json.dumps(entry) + "\n")
+
+    def flush(self):
+        """Writes journaled operations to disk"""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._flushed = self._clock()
+
+    def close(self):
+        """Writes journaled operations to disk and closes the journal"""
+        with self._lock:
+            if self._file.closed:
+                return
+            self._flush()
+            self._file.close()
+
+    def restore(self, creation_cls: SynapseCreation, plan: ExecutionPlan,
+                operation: Operation) -> bool:
+        """Skips an operation completed by an earlier run
+
+        Args:
+            creation_cls: SynapseCreation the plan is run with
+            plan: Execution plan the operation belongs to
+            operation: Operation about to run
+
+        Returns:
+            True if the operation was skipped
+        """
+        # Invitees and queues are listed again since the invitations
+        # and queues that are still to be created depend on them
+        if operation.kind in (planner.INVITEES, planner.EVALUATIONS):
+            return False
+        entry = self.completed.get(operation.key)
+        if entry is None:
+            return False
+        if operation.kind in TRACKED_KINDS:
+            operation.result = _restore_result(operation, entry['id'])
+        elif operation.kind in (planner.CHALLENGE, planner.EVALUATION):
+            operation.config['id'] = entry['id']
+            operation.result = {'id': entry['id']}
+        operation.skipped = True
+        with self._lock:
+            self.resumed += 1
+        return True
+
+    def record(self, creation_cls: SynapseCreation, operation: Operation):
+        """Journals a completed operation
+
+        Args:
+            creation_cls: SynapseCreation the operation was run with
+            operation: Completed operation
+        """
+        entry = {'key': operation.key, 'kind': operation.kind}
+        if operation.kind in TRACKED_KINDS:
+            entry['id'] = operation.result.id
+        elif operation.kind in (planner.CHALLENGE, planner.EVALUATION):
+            entry['id'] = operation.result['id']
+        with self._lock:
+            self.completed[operation.key] = entry
+            self._write(entry)
+            if self._clock() - self._flushed >= self.flush_interval:
+                self._flush()
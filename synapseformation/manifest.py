@@ -0,0 +1,78 @@
+"""Manifest of the Synapse ids of the resources in a template"""
+import json
+import threading
+
+from . import planner
+from .create import SynapseCreation
+from .planner import Operation
+from .state import TRACKED_KINDS
+
+MANIFEST_FORMATS = ("jsonl", "yaml")
+
+
+class Manifest:
+    """Streams the template path, Synapse id and etag of every resource
+    as soon as it is completed or restored, so downstream jobs can read
+    the ids while the template is still being created.  The etag is
+    only written when Synapse returned it, since entities that already
+    existed are looked up by their headers."""
+    def __init__(self, path: str, manifest_format: str = None):
+        """
+        Args:
+            path: Path to the manifest
+            manifest_format: jsonl or yaml. Defaults to yaml for .yaml
+                             and .yml paths and jsonl otherwise.
+        """
+        if manifest_format is None:
+            manifest_format = ("yaml" if path.endswith((".yaml", ".yml"))
+                               else "jsonl")
+        if manifest_format not in MANIFEST_FORMATS:
+            raise ValueError(
+                f"Unknown manifest format '{manifest_format}'"
+            )
+        self.path = path
+        self.manifest_format = manifest_format
+        self.written = 0
+        self._lock = threading.Lock()
+        self._file = open(path, "w")
+
+    def _format(self, entry: dict) -> str:
+        if self.manifest_format == "jsonl":
+            return json.dumps(entry) + "\n"
+        # JSON scalars are valid YAML
+        lines = [f"{key}: {json.dumps(value)}"
+                 for key, value in entry.items()]
+        return "- " + "\n  ".join(lines) + "\n"
+
+    def record(self, creation_cls: SynapseCreation, operation: Operation):
+        """Writes the id of a completed or restored operation
+
+        Args:
+            creation_cls: SynapseCreation the operation was run with
+            operation: Completed operation
+        """
+        result = operation.result
+        if result is None:
+            return
+        if operation.kind in TRACKED_KINDS:
+            entry = {'path': operation.key, 'kind': operation.kind,
+                     'id': result.id}
+            etag = result.get('etag') if hasattr(result, 'get') else None
+            if etag is not None:
+                entry['etag'] = etag
+        elif operation.kind in (planner.CHALLENGE, planner.EVALUATION):
+            entry = {'path': operation.key, 'kind': operation.kind,
+                     'id': result['id']}
+        else:
+            return
+        content = self._format(entry)
+        with self._lock:
+            self._file.write(content)
+            # Flushed so that readers see every resource as it completes
+            self._file.flush()
+            self.written += 1
+
+    def close(self):
+        """Closes the manifest"""
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,545 @@
+"""Compiles templates into an execution plan of Synapse operations"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, Iterator, List
+
+from .bulk import DEFAULT_BATCH_SIZE
+from .create import AsyncSynapseCreation, SynapseCreation
+from .principals import ALIAS_KEYS, MAX_ALIASES
+
+if TYPE_CHECKING:
+    # Checkpoints import the planner, so they are only imported for
+    # type checking
+    from .journal import Journal
+    from .manifest import Manifest
+    from .state import ApplyState
+
+PROJECT = "project"
+FOLDER = "folder"
+TEAM = "team"
+ACL = "acl"
+INVITEES = "invitees"
+INVITE = "invite"
+CHALLENGE = "challenge"
+EVALUATIONS = "evaluations"
+EVALUATION = "evaluation"
+# Template keys of evaluation queues and the Evaluation fields they set
+QUEUE_FIELDS = {'description': 'description',
+                'submission_instructions': 'submissionInstructionsMessage',
+                'submission_receipt': 'submissionReceiptMessage'}
+
+
+class Operation:
+    """A single Synapse operation in an execution plan"""
+    def __init__(self, key: str, kind: str, config: dict,
+                 parent: 'Operation' = None, parentid: str = None,
+                 depends_on: List['Operation'] = None):
+        """
+        Args:
+            key: Unique path of the operation within the template
+            kind: Type of operation. One of project, folder, team,
+                  acl, invitees, invite, challenge, evaluations or
+                  evaluation.
+            config: Template configuration the operation is built from
+            parent: Operation that creates the resource this operation
+                    needs the id of (e.g. the container of a folder)
+            parentid: Synapse id of the container when it is not
+                      created by the plan
+            depends_on: Other operations that must complete first
+        """
+        self.key = key
+        self.kind = kind
+        self.config = config
+        self.parent = parent
+        self.parentid = parentid
+        self.depends_on = list(depends_on or [])
+        if parent is not None and parent not in self.depends_on:
+            self.depends_on.insert(0, parent)
+        self.result = None
+        # Set when the operation doesn't need to run
+        self.skipped = False
+
+    def __repr__(self):
+        return f"Operation({self.kind!r}, {self.key!r})"
+
+
+class ExecutionPlan:
+    """Directed acyclic graph of Synapse operations.  Operations are
+    stored in insertion order, and an operation is always added after
+    the operations it depends on.  Operations may also depend on
+    operations that were completed by an earlier plan."""
+    def __init__(self):
+        self.operations = []
+        self._keys = {}
+
+    def __len__(self):
+        return len(self.operations)
+
+    def __iter__(self) -> Iterator[Operation]:
+        return iter(self.operations)
+
+    def add(self, operation: Operation) -> Operation:
+        """Adds an operation to the plan
+
+        Args:
+            operation: Operation whose dependencies are already planned
+
+        Returns:
+            The added operation
+        """
+        if operation.key in self._keys:
+            raise ValueError(f"Duplicate resource '{operation.key}' "
+                             "in template")
+        for dependency in operation.depends_on:
+            planned = self._keys.get(dependency.key) is dependency
+            if not planned and dependency.result is None:
+                raise ValueError(f"{operation} depends on {dependency} "
+                                 "which is not in the plan")
+        self._keys[operation.key] = operation
+        self.operations.append(operation)
+        return operation
+
+    def get(self, key: str) -> Operation:
+        """Gets an operation by its key"""
+        return self._keys[key]
+
+    def waves(self) -> List[List[Operation]]:
+        """Groups operations into waves.  Every operation only depends
+        on operations in earlier waves, so all operations of a wave
+        can run concurrently.
+
+        Returns:
+            List of waves of operations
+        """
+        levels = {}
+        waves = []
+        for operation in self.operations:
+            level = max((levels[dependency.key] + 1
+                         for dependency in operation.depends_on
+                         if dependency.key in levels),
+                        default=0)
+            levels[operation.key] = level
+            if level == len(waves):
+                waves.append([])
+            waves[level].append(operation)
+        return waves
+
+    @property
+    def depth(self) -> int:
+        """Number of operations on the critical path"""
+        return len(self.waves())
+
+    def counts(self) -> Dict[str, int]:
+        """Number of operations of each kind"""
+        counts = {}
+        for operation in self.operations:
+            counts[operation.kind] = counts.get(operation.kind, 0) + 1
+        return counts
+
+    def summary(self) -> str:
+        """Human readable summary of the plan"""
+        counts = ", ".join(f"{kind}: {count}"
+                           for kind, count in self.counts().items())
+        return (f"Plan: {len(self)} operations ({counts}), "
+                f"critical path depth {self.depth}")
+
+
+def _compile_entity(plan: ExecutionPlan, config: dict, key: str,
+                    kind: str, parent: Operation,
+                    parentid: str) -> Operation:
+    """Adds the operations for a project or folder to the plan"""
+    operation = plan.add(Operation(key=key, kind=kind, config=config,
+                                   parent=parent, parentid=parentid))
+    if config.get('acl'):
+        plan.add(Operation(key=f"{key}#acl", kind=ACL, config=config,
+                           parent=operation))
+    return operation
+
+
+def _compile_queues(plan: ExecutionPlan, config: dict,
+                    project: Operation):
+    """Adds the operations for the evaluation queues of a project to
+    the plan.  The queues of the project are listed once, and the
+    queues that don't exist are then created concurrently."""
+    queues = plan.add(Operation(key=f"{project.key}#evaluations",
+                                kind=EVALUATIONS, config=config,
+                                parent=project))
+    for queue in config['evaluations']:
+        plan.add(Operation(key=f"{project.key}#evaluation:{queue['name']}",
+                           kind=EVALUATION, config=queue, parent=project,
+                           depends_on=[queues]))
+
+
+def _compile_team(plan: ExecutionPlan, config: dict) -> Operation:
+    """Adds the operations for a team and its invitations to the plan.
+    Members and open invitations of the team are fetched once, and
+    every invitee is only invited once."""
+    key = f"team:{config['name']}"
+    operation = plan.add(Operation(key=key, kind=TEAM, config=config))
+    if not config.get("invitations"):
+        return operation
+    invitees = plan.add(Operation(key=f"{key}#invitees", kind=INVITEES,
+                                  config=config, parent=operation))
+    invited = set()
+    for invite in config['invitations']:
+        for member in invite['members']:
+            # Named members are resolved to ids before the apply, but
+            # not by plan
+            invitee = member.get("principal_id") or \
+                member.get("user_name") or member.get("email")
+            if invitee in invited:
+                continue
+            invited.add(invitee)
+            plan.add(Operation(key=f"{key}#invite:{invitee}", kind=INVITE,
+                               config={'message': invite['message'],
+                                       **member},
+                               parent=operation, depends_on=[invitees]))
+    return operation
+
+
+def compile_plan(config_list: List[dict], parentid: str = None,
+                 teams: Dict[str, Operation] = None) -> ExecutionPlan:
+    """Compiles a template into an execution plan
+
+    Args:
+        config_list: List of Synapse resources
+        parentid: Synapse folder or project id to store entities
+        teams: Team operations by name that challenges can refer to.
+               Teams of the template are added to it, so it can be
+               shared by plans of different parts of a template.
+
+    Returns:
+        ExecutionPlan
+    """
+    plan = ExecutionPlan()
+    if teams is None:
+        teams = {}
+    challenges = []
+    # Use a stack rather than recursion to avoid the recursion limit
+    stack = [(config, None, parentid, "")
+             for config in reversed(config_list)]
+    while stack:
+        config, parent, config_parentid, prefix = stack.pop()
+        if not isinstance(config, dict):
+            continue
+        if config.get('type') == "Team":
+            teams[config['name']] = _compile_team(plan, config)
+            continue
+        if config.get('type') == "Project":
+            kind = PROJECT
+        elif config.get('type') == "Folder":
+            kind = FOLDER
+        else:
+            continue
+        key = f"{prefix}{config['name']}"
+        operation = _compile_entity(plan, config, key=key, kind=kind,
+                                    parent=parent, parentid=config_parentid)
+        if kind == PROJECT and config.get('challenge') is not None:
+            challenges.append(operation)
+        if kind == PROJECT and config.get('evaluations'):
+            _compile_queues(plan, config, operation)
+        stack.extend((child, operation, None, f"{key}/")
+                     for child in reversed(config.get('children') or []))
+    # Challenges are planned last because participant teams may be
+    # defined anywhere in the template
+    for project in challenges:
+        team_name = project.config['challenge']['participant_team']
+        if team_name not in teams:
+            raise ValueError(f"Participant team '{team_name}' of project "
+                             f"'{project.key}' is not in the template")
+        plan.add(Operation(key=f"{project.key}#challenge", kind=CHALLENGE,
+                           config=project.config['challenge'],
+                           parent=project, depends_on=[teams[team_name]]))
+    return plan
+
+
+def _operation_calls(operation: Operation, listed: set,
+                     existing: bool = False) -> Dict[str, int]:
+    """Estimates the REST calls an operation makes
+
+    Args:
+        operation: Planned operation
+        listed: Containers whose children were already listed.
+                Updated in place.
+        existing: Estimate for resources that already exist, which are
+                  looked up rather than created
+
+    Returns:
+        Number of calls by type
+    """
+    if operation.kind in (PROJECT, FOLDER, TEAM):
+        if not existing:
+            return {'store': 1}
+        if operation.kind != FOLDER:
+            return {'lookup': 1}
+        # Children of a container are looked up with one cached listing
+        parent = operation.parent.key if operation.parent is not None \
+            else operation.parentid
+        if parent in listed:
+            return {}
+        listed.add(parent)
+        return {'lookup': 1}
+    if operation.kind == ACL:
+        if existing:
+            return {'acl_read': 1}
+        if operation.parent.kind == PROJECT:
+            return {'acl_read': 1, 'acl_write': 1}
+        # New folders inherit their ACL from the benefactor
+        return {'acl_read': 3, 'acl_write': 1}
+    if operation.kind == INVITEES:
+        # One listing of members and one of open invitations
+        return {'lookup': 2}
+    if operation.kind == INVITE:
+        # Existing invitees were already invited
+        return {} if existing else {'invitation': 1}
+    if operation.kind == CHALLENGE:
+        # An existing challenge is fetched after its creation fails
+        return {'store': 1, 'lookup': 1} if existing else {'store': 1}
+    if operation.kind == EVALUATIONS:
+        # One listing of the queues of the project
+        return {'lookup': 1}
+    if operation.kind == EVALUATION:
+        # Existing queues are found in the listing
+        return {} if existing else {'store': 1}
+    raise ValueError(f"{operation} not recognized")
+
+
+def estimate_plan(plan: ExecutionPlan, latency: float = 0.2,
+                  workers: int = 1, existing: bool = False,
+                  bulk_folders: bool = False,
+                  batch_size: int = DEFAULT_BATCH_SIZE) -> dict:
+    """Estimates the REST calls and wall time of applying a plan
+    without making any calls
+
+    Args:
+        plan: Execution plan
+        latency: Seconds per REST call
+        workers: Number of operations run concurrently
+        existing: Estimate a re-apply where all resources exist
+        bulk_folders: Estimate creating the folders of every wave in
+                      batches
+        batch_size: Maximum folders per batch
+
+    Returns:
+        dict with the number of calls by type, the total number of
+        calls and the estimated wall time in seconds
+    """
+    listed = set()
+    calls = {}
+    # Named principals are resolved in batches before the first wave
+    names = set()
+    for operation in plan:
+        entries = (operation.config['acl'] if operation.kind == ACL
+                   else [operation.config] if operation.kind == INVITE
+                   else [])
+        names.update(entry[key] for entry in entries
+                     for key in ALIAS_KEYS if key in entry)
+    lookups = -(-len(names) // MAX_ALIASES)
+    if lookups:
+        calls['principals'] = lookups
+    wall_time = lookups * latency
+    for wave in plan.waves():
+        batches = 0
+        if bulk_folders:
+            folders = sum(operation.kind == FOLDER for operation in wave)
+            wave = [operation for operation in wave
+                    if operation.kind != FOLDER]
+            # Batches are sent one after the other
+            batches = -(-folders // batch_size)
+            if batches:
+                calls['batch'] = calls.get('batch', 0) + batches
+        wave_calls = [_operation_calls(operation, listed, existing)
+                      for operation in wave]
+        for operation_calls in wave_calls:
+            for call_type, count in operation_calls.items():
+                calls[call_type] = calls.get(call_type, 0) + count
+        sequential = [sum(operation_calls.values())
+                      for operation_calls in wave_calls]
+        # A wave takes at least as long as its slowest operation
+        rounds = max(max(sequential, default=0),
+                     -(-sum(sequential) // workers))
+        wall_time += (rounds + batches) * latency
+    return {'calls': calls, 'total': sum(calls.values()),
+            'wall_time': wall_time}
+
+
+def _parent_id(operation: Operation) -> str:
+    """Synapse id of the parent of an operation, which has completed"""
+    if operation.parent is not None:
+        return operation.parent.result.id
+    return operation.parentid
+
+
+def _run_operation(operation: Operation, creation_cls: SynapseCreation):
+    """Runs a single operation
+
+    Args:
+        operation: Operation whose dependencies have completed
+        creation_cls: SynapseCreation class that can create resources
+
+    Returns:
+        Result of the operation
+    """
+    config = operation.config
+    parentid = _parent_id(operation)
+    if operation.kind == PROJECT:
+        result = creation_cls.get_or_create_project(name=config['name'])
+        config['id'] = result.id
+    elif operation.kind == FOLDER:
+        result = creation_cls.get_or_create_folder(name=config['name'],
+                                                   parentId=parentid)
+        config['id'] = result.id
+    elif operation.kind == TEAM:
+        result = creation_cls.get_or_create_team(
+            name=config['name'], description=config['description'],
+            canPublicJoin=config['can_public_join']
+        )
+        config['id'] = result.id
+    elif operation.kind == ACL:
+        result = creation_cls.set_acl(entity=operation.parent.result,
+                                      acl_config=config['acl'])
+    elif operation.kind == INVITEES:
+        result = creation_cls.get_team_invitees(operation.parent.result)
+    elif operation.kind == INVITE:
+        # The invitees of the team are planned right after the team
+        result = creation_cls.invite_to_team(
+            team=operation.parent.result,
+            invitees=operation.depends_on[1].result,
+            principalId=config.get("principal_id"),
+            inviteeEmail=config.get("email"), message=config['message']
+        )
+    elif operation.kind == CHALLENGE:
+        # The participant team is planned right after the project
+        team = operation.depends_on[1].result
+        result = creation_cls.get_or_create_challenge(
+            projectId=parentid, participantTeamId=team.id
+        )
+        config['id'] = result['id']
+    elif operation.kind == EVALUATIONS:
+        result = creation_cls.get_project_queues(parentid)
+    elif operation.kind == EVALUATION:
+        # The queues of the project are listed right after it
+        result = creation_cls.get_or_create_queue(
+            existing=operation.depends_on[1].result, name=config['name'],
+            contentSource=parentid,
+            **{field: config[key] for key, field in QUEUE_FIELDS.items()
+               if key in config}
+        )
+        config['id'] = result.id
+    else:
+        raise ValueError(f"{operation} not recognized")
+    operation.result = result
+    return result
+
+
+def _run_recorded(operation: Operation, creation_cls: SynapseCreation):
+    """Runs a single operation, attributing its Synapse calls to the
+    kind of the operation"""
+    with creation_cls.recorder.resource(operation.kind):
+        return _run_operation(operation, creation_cls)
+
+
+def execute_plan(plan: ExecutionPlan, creation_cls: SynapseCreation,
+                 workers: int = 1, state: 'ApplyState' = None,
+                 journal: 'Journal' = None, manifest: 'Manifest' = None):
+    """Executes a plan one wave at a time.  Operations within a wave
+    are run concurrently when workers is greater than 1.  With a folder
+    backend, the folders of a wave are created at once.
+
+    Args:
+        plan: Execution plan
+        creation_cls: SynapseCreation class that can create resources
+        workers: Maximum number of concurrent Synapse calls
+        state: State of earlier applies of the template.  Unchanged
+               resources are skipped and completed ones are recorded.
+        journal: Journal of completed operations.  Operations completed
+                 by an earlier run are skipped and completed ones are
+                 journaled.
+        manifest: Manifest the ids of completed and skipped resources
+                  are written to
+    """
+    def _restore(operation):
+        with creation_cls.recorder.resource(operation.kind):
+            return any(checkpoint.restore(creation_cls, plan, operation)
+                       for checkpoint in (journal, state)
+                       if checkpoint is not None)
+
+    def _record(operation):
+        with creation_cls.recorder.resource(operation.kind):
+            for checkpoint in (state, journal):
+                if checkpoint is not None:
+                    checkpoint.record(creation_cls, operation)
+
+    def _pending(operation):
+        # Children of a restored subtree are already skipped
+        return not operation.skipped and not _restore(operation)
+
+    def _execute(operation):
+        if _pending(operation):
+            _run_recorded(operation, creation_cls)
+            _record(operation)
+        if manifest is not None:
+            manifest.record(creation_cls, operation)
+
+    def _execute_folders(folders, map_func):
+        pending = [operation for operation, todo in
+                   zip(folders, map_func(_pending, folders)) if todo]
+        with creation_cls.recorder.resource(FOLDER):
+            results = creation_cls.create_folders([
+                {'name': operation.config['name'],
+                 'parentId': _parent_id(operation)}
+                for operation in pending
+            ])
+        for operation, result in zip(pending, results):
+            operation.config['id'] = result.id
+            operation.result = result
+        list(map_func(_record, pending))
+        if manifest is not None:
+            for operation in folders:
+                manifest.record(creation_cls, operation)
+
+    def _execute_wave(wave, map_func):
+        folders = []
+        if creation_cls.folder_backend is not None:
+            # The folders of a wave are created at once by the backend
+            folders = [operation for operation in wave
+                       if operation.kind == FOLDER]
+            wave = [operation for operation in wave
+                    if operation.kind != FOLDER]
+        # Consume the iterator so errors are raised
+        list(map_func(_execute, wave))
+        if folders:
+            _execute_folders(folders, map_func)
+
+    if workers <= 1:
+        for wave in plan.waves():
+            _execute_wave(wave, map)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for wave in plan.waves():
+            _execute_wave(wave, executor.map)
+
+
+async def execute_plan_async(plan: ExecutionPlan,
+                             creation_cls: AsyncSynapseCreation):
+    """Executes a plan with asyncio.  Rather than waiting for a whole
+    wave, every operation starts as soon as its own dependencies have
+    completed.  The number of calls in flight is bounded by the
+    concurrency of creation_cls.
+
+    Args:
+        plan: Execution plan
+        creation_cls: AsyncSynapseCreation class that can create resources
+    """
+    tasks = {}
+
+    async def _run(operation):
+        await asyncio.gather(*(tasks[dependency.key]
+                               for dependency in operation.depends_on
+                               if dependency.key in tasks))
+        return await creation_cls.run(_run_recorded, operation,
+                                      creation_cls.creation_cls)
+
+    for operation in plan:
+        tasks[operation.key] = asyncio.ensure_future(_run(operation))
+    await asyncio.gather(*tasks.values())
@@ -0,0 +1,119 @@
+"""Resolves the user and team names of templates to principal ids"""
+import json
+import os
+import time
+from typing import Callable, Iterator, List
+
+from .create import SynapseCreation
+
+ALIASES_URI = "/userGroupHeaders/aliases"
+# Aliases Synapse resolves per request
+MAX_ALIASES = 100
+# Keys of ACL entries and invited members that name a principal, and
+# whether the principal is a user
+ALIAS_KEYS = {'user_name': True, 'team_name': False}
+
+
+def _principal_entries(config_list: List[dict]) -> Iterator[dict]:
+    """Yields the ACL entries and invited members of a template"""
+    stack = list(config_list)
+    while stack:
+        config = stack.pop()
+        if not isinstance(config, dict):
+            continue
+        yield from config.get('acl') or []
+        for invitation in config.get('invitations') or []:
+            yield from invitation.get('members') or []
+        stack.extend(config.get('children') or [])
+
+
+class PrincipalResolver:
+    """Resolves user and team names to principal ids.  All names of a
+    template are resolved at once with batched lookups, so every
+    principal is only looked up once however often it is used.
+    Resolved names can be kept in an on-disk cache between runs.
+    Cached ids aren't checked, so a name reused for another principal
+    resolves to the old one until it expires."""
+    def __init__(self, creation_cls: SynapseCreation,
+                 cache_path: str = None, max_age: float = 7 * 24 * 3600,
+                 clock: Callable = time.time):
+        """
+        Args:
+            creation_cls: SynapseCreation whose calls are used
+            cache_path: Path to the JSON cache of resolved names.
+                        Default is no cache on disk.
+            max_age: Seconds a cached name is used for
+        """
+        self.creation_cls = creation_cls
+        self.cache_path = cache_path
+        self.max_age = max_age
+        self._clock = clock
+        self._principals = {}
+        if cache_path is not None and os.path.exists(cache_path):
+            with open(cache_path, "r") as cache_f:
+                self._principals = json.load(cache_f)
+        self.lookups = 0
+        self.requests = 0
+
+    def _fresh(self, alias: str) -> bool:
+        principal = self._principals.get(alias.lower())
+        return principal is not None and \
+            self._clock() - principal['resolved'] < self.max_age
+
+    def _lookup(self, aliases: List[str]):
+        """Resolves names with one request per batch of names"""
+        now = self._clock()
+        for start in range(0, len(aliases), MAX_ALIASES):
+            batch = aliases[start:start + MAX_ALIASES]
+            response = self.creation_cls._call(
+                "restPOST", ALIASES_URI, body=json.dumps({'list': batch})
+            )
+            self.requests += 1
+            # Unknown names are left out of the response
+            for header in response.get('list', []):
+                self._principals[header['userName'].lower()] = {
+                    'id': int(header['ownerId']),
+                    'individual': header['isIndividual'],
+                    'resolved': now
+                }
+        self.lookups += len(aliases)
+
+    def _save(self):
+        directory = os.path.dirname(self.cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Processes sharing the cache each write their own file
+        temp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as cache_f:
+            json.dump(self._principals, cache_f, sort_keys=True)
+        os.replace(temp_path, self.cache_path)
+
+    def resolve_template(self, config_list: List[dict]):
+        """Sets the principal_id of every ACL entry and invited member
+        that names a user or team.  Names that aren't cached are looked
+        up before any of them is set.
+
+        Args:
+            config_list: Expanded template, modified in place
+        """
+        named = [(entry, key) for entry in _principal_entries(config_list)
+                 for key in ALIAS_KEYS if key in entry]
+        aliases = list(dict.fromkeys(entry[key] for entry, key in named))
+        missing = [alias for alias in aliases if not self._fresh(alias)]
+        if missing:
+            self._lookup(sorted(missing))
+            if self.cache_path is not None:
+                self._save()
+        errors = []
+        for entry, key in named:
+            principal = self._principals.get(entry[key].lower())
+            if principal is None:
+                errors.append(f"Unknown {key} '{entry[key]}'")
+            elif principal['individual'] != ALIAS_KEYS[key]:
+                errors.append(f"'{entry[key]}' is not a "
+                              f"{key.split('_')[0]}")
+            else:
+                entry['principal_id'] = principal['id']
+        if errors:
+            raise ValueError("Principals could not be resolved: " +
+                             ", ".join(dict.fromkeys(errors)))
@@ -0,0 +1,246 @@
+"""Adaptive rate limiting of Synapse calls"""
+from contextlib import contextmanager
+import logging
+import sqlite3
+import threading
+import time
+from typing import Callable
+import weakref
+
+from synapseclient import Synapse
+from synapseclient.core.exceptions import SynapseHTTPError
+
+# Status codes Synapse uses when it is overloaded
+THROTTLE_STATUS_CODES = (429, 503)
+# Limiter of every observed requests session
+_OBSERVERS = weakref.WeakKeyDictionary()
+
+
+def _retry_after(response) -> float:
+    """Seconds to wait from the Retry-After header of a response"""
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """Token bucket shared by every thread making Synapse calls.  The
+    rate is adapted with additive increase and multiplicative decrease
+    (AIMD): it grows a little after every successful call and is cut
+    when Synapse throttles, so it converges to the highest rate the
+    server tolerates."""
+    def __init__(self, rate: float = 10.0, min_rate: float = 0.5,
+                 max_rate: float = 100.0, increase: float = 0.1,
+                 decrease: float = 0.5, max_retries: int = 5,
+                 backoff: float = 1.0, clock: Callable = time.monotonic,
+                 sleep: Callable = time.sleep, logger=None):
+        """
+        Args:
+            rate: Initial calls per second
+            min_rate: Lowest calls per second
+            max_rate: Highest calls per second
+            increase: Calls per second added after a successful call
+            decrease: Factor the rate is multiplied by when throttled
+            max_retries: Retries of a throttled call before failing
+            backoff: Seconds to wait before the first retry when
+                     Synapse doesn't send Retry-After. Doubles with
+                     every retry.
+        """
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.logger = logger or logging.getLogger(__name__)
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._state = {'rate': rate, 'tokens': 1.0, 'updated': clock(),
+                       'blocked_until': 0.0}
+        self.throttles = 0
+        self.retries = 0
+        # Tokens are acquired per request once a connection is observed
+        self._observing = False
+
+    @contextmanager
+    def _bucket(self):
+        """Locks the token bucket and yields its rate, tokens, update
+        time and blocked_until time.  Changes are kept when the block
+        exits."""
+        with self._lock:
+            yield self._state
+            self.rate = self._state['rate']
+
+    def acquire(self):
+        """Blocks until a call can be made"""
+        while True:
+            with self._bucket() as bucket:
+                now = self._clock()
+                rate = bucket['rate']
+                bucket['tokens'] = min(
+                    max(rate, 1.0),
+                    bucket['tokens'] + (now - bucket['updated']) * rate
+                )
+                bucket['updated'] = now
+                if now >= bucket['blocked_until'] and bucket['tokens'] >= 1:
+                    bucket['tokens'] -= 1
+                    return
+                wait = max(bucket['blocked_until'] - now,
+                           (1 - bucket['tokens']) / rate)
+            self._sleep(wait)
+
+    def on_success(self):
+        """Additively increases the rate"""
+        with self._bucket() as bucket:
+            bucket['rate'] = min(self.max_rate,
+                                 bucket['rate'] + self.increase)
+
+    def on_throttle(self, retry_after: float = None):
+        """Multiplicatively decreases the rate and pauses every call
+        for retry_after seconds
+
+        Args:
+            retry_after: Seconds from the Retry-After header
+        """
+        with self._bucket() as bucket:
+            self.throttles += 1
+            bucket['rate'] = max(self.min_rate,
+                                 bucket['rate'] * self.decrease)
+            if retry_after is not None:
+                bucket['blocked_until'] = max(bucket['blocked_until'],
+                                              self._clock() + retry_after)
+        self.logger.warning("Throttled by Synapse, rate lowered to "
+                            "{:.2f} calls per second".format(self.rate))
+
+    def call(self, func: Callable, *args, **kwargs):
+        """Calls a function once the rate allows, retrying when
+        Synapse throttles it.  When the limiter observes the connection,
+        its requests take the tokens and lower the rate when throttled,
+        and synapseclient retries them, so the call is made once.
+
+        Args:
+            func: Function making a Synapse call
+            *args, **kwargs: Arguments passed to the function
+
+        Returns:
+            Return value of the function
+        """
+        if self._observing:
+            result = func(*args, **kwargs)
+            self.on_success()
+            return result
+        attempt = 0
+        while True:
+            self.acquire()
+            try:
+                result = func(*args, **kwargs)
+            except SynapseHTTPError as err:
+                status_code = getattr(err.response, 'status_code', None)
+                if status_code not in THROTTLE_STATUS_CODES or \
+                        attempt >= self.max_retries:
+                    raise err
+                retry_after = _retry_after(err.response)
+                self.on_throttle(retry_after)
+                if retry_after is None:
+                    self._sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+                with self._lock:
+                    self.retries += 1
+                continue
+            self.on_success()
+            return result
+
+    def observe(self, syn: Synapse):
+        """Rate limits every HTTP request of a Synapse connection and
+        lowers the rate on its throttled responses.  A synapseclient
+        call can send several requests, such as the pages of a listing
+        or its own retries of throttled requests, and each of them
+        takes a token.  A connection is observed by one limiter, so
+        observing it again replaces the previous limiter.
+
+        Args:
+            syn: Synapse connection
+        """
+        session = syn._requests_session
+        self._observing = True
+        observed = session in _OBSERVERS
+        _OBSERVERS[session] = self
+        if observed:
+            return
+        send = session.send
+
+        def _send(request, **kwargs):
+            _OBSERVERS[session].acquire()
+            return send(request, **kwargs)
+
+        def _hook(response, *args, **kwargs):
+            if response.status_code in THROTTLE_STATUS_CODES:
+                _OBSERVERS[session].on_throttle(_retry_after(response))
+
+        session.send = _send
+        session.hooks['response'].append(_hook)
+
+
+class SharedRateLimiter(RateLimiter):
+    """RateLimiter whose token bucket is kept in a SQLite database, so
+    that processes on a machine share one rate budget.  Every process
+    opens the same database and throttles seen by any of them lower
+    the rate of all."""
+    def __init__(self, path: str, rate: float = 10.0,
+                 clock: Callable = time.time, **kwargs):
+        """
+        Args:
+            path: Path to the SQLite database. The bucket is created
+                  with the initial rate if it doesn't exist.
+            rate: Initial calls per second of all processes
+            clock: Clock shared by the processes
+            **kwargs: Arguments of RateLimiter
+        """
+        super().__init__(rate=rate, clock=clock, **kwargs)
+        self.path = path
+        # Transactions are begun explicitly to lock the database
+        self._db = sqlite3.connect(path, timeout=60, isolation_level=None,
+                                   check_same_thread=False)
+        # The bucket only lives for a run, so it isn't synced to disk,
+        # which would make every call wait for a write
+        self._db.execute("PRAGMA synchronous = OFF")
+        self._db.execute("PRAGMA journal_mode = MEMORY")
+        with self._lock:
+            self._db.execute("CREATE TABLE IF NOT EXISTS bucket ("
+                             "id INTEGER PRIMARY KEY, rate REAL, "
+                             "tokens REAL, updated REAL, "
+                             "blocked_until REAL)")
+            self._db.execute("INSERT OR IGNORE INTO bucket VALUES "
+                             "(0, ?, 1.0, ?, 0.0)", (rate, clock()))
+
+    @contextmanager
+    def _bucket(self):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT rate, tokens, updated, blocked_until "
+                    "FROM bucket WHERE id = 0"
+                ).fetchone()
+                bucket = dict(zip(("rate", "tokens", "updated",
+                                   "blocked_until"), row))
+                yield bucket
+                self._db.execute(
+                    "UPDATE bucket SET rate = :rate, tokens = :tokens, "
+                    "updated = :updated, blocked_until = :blocked_until "
+                    "WHERE id = 0", bucket
+                )
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            self.rate = bucket['rate']
+
+    def close(self):
+        """Closes the database"""
+        with self._lock:
+            self._db.close()
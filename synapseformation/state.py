@@ -0,0 +1,248 @@
+"""Local state of applied templates for incremental applies"""
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, List
+
+from synapseclient import Folder, Project, Team
+
+from . import planner
+from .create import SynapseCreation
+from .planner import ExecutionPlan, Operation
+
+# Operations that create a resource with an id
+TRACKED_KINDS = (planner.PROJECT, planner.FOLDER, planner.TEAM)
+# Keys of template nodes that are applied by operations of their own
+OWNED_KEYS = ('children', 'acl', 'challenge', 'evaluations', 'invitations')
+# Batched lookups of the headers of entities and of teams by id
+ENTITY_HEADERS_URI = "/entity/header"
+TEAM_LIST_URI = "/teamList"
+# Entities or teams looked up per request
+MAX_LOOKUP = 100
+
+
+def _strip_ids(config):
+    """Removes the ids that are written into a template during a run"""
+    if isinstance(config, dict):
+        return {key: _strip_ids(value) for key, value in config.items()
+                if key != 'id'}
+    if isinstance(config, list):
+        return [_strip_ids(value) for value in config]
+    return config
+
+
+def content_hash(config: dict) -> str:
+    """Hashes a template node without its children, ACL, challenge,
+    queues and invitations, which are applied by operations of their own
+
+    Args:
+        config: Synapse resource configuration
+
+    Returns:
+        Hex digest of the configuration
+    """
+    node = {key: value for key, value in config.items()
+            if key not in OWNED_KEYS}
+    content = json.dumps(_strip_ids(node), sort_keys=True, default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _version_key(operation: Operation) -> str:
+    """Key of the field that changes whenever the resource changes.
+    Entity headers have no etag, but a change to an entity, such as
+    moving or renaming it, updates its modifiedOn."""
+    return 'etag' if operation.kind == planner.TEAM else 'modifiedOn'
+
+
+def _lookup_versions(creation_cls: SynapseCreation,
+                     resources: List[tuple]) -> Dict[str, tuple]:
+    """Looks up the name and version of teams and entities by id, with
+    one request per batch of ids.  Deleted resources are left out.
+
+    Args:
+        creation_cls: SynapseCreation whose calls are used
+        resources: Operation kinds and ids of the resources
+
+    Returns:
+        Name and etag or modifiedOn of every resource that exists by id
+    """
+    entityids = [resourceid for kind, resourceid in resources
+                 if kind != planner.TEAM]
+    teamids = [int(resourceid) for kind, resourceid in resources
+               if kind == planner.TEAM]
+    versions = {}
+    for start in range(0, len(entityids), MAX_LOOKUP):
+        references = [{'targetId': entityid}
+                      for entityid in entityids[start:start + MAX_LOOKUP]]
+        response = creation_cls._call(
+            "restPOST", ENTITY_HEADERS_URI,
+            body=json.dumps({'references': references})
+        )
+        for header in response.get('results', []):
+            versions[header['id']] = (header['name'],
+                                      header.get('modifiedOn'))
+    for start in range(0, len(teamids), MAX_LOOKUP):
+        response = creation_cls._call(
+            "restPOST", TEAM_LIST_URI,
+            body=json.dumps({'list': teamids[start:start + MAX_LOOKUP]})
+        )
+        for team in response.get('list', []):
+            versions[str(team['id'])] = (team['name'], team.get('etag'))
+    return versions
+
+
+def _parent_id(operation: Operation) -> str:
+    """Synapse id of the container of a folder"""
+    if operation.parent is not None:
+        return operation.parent.result.id
+    return operation.parentid
+
+
+def _restore_result(operation: Operation, resourceid: str):
+    """Builds the result of an operation that was skipped"""
+    config = operation.config
+    config['id'] = resourceid
+    if operation.kind == planner.PROJECT:
+        return Project(name=config['name'], id=resourceid)
+    if operation.kind == planner.FOLDER:
+        return Folder(name=config['name'], id=resourceid,
+                      parentId=_parent_id(operation))
+    return Team(name=config['name'], id=resourceid)
+
+
+class ApplyState:
+    """Records the id, content hash and etag or modifiedOn of every
+    project, folder and team created from a template.  A resource whose
+    template node is unchanged since the last apply and that is
+    unchanged in Synapse is skipped.  The resources of a plan are
+    checked with one batched lookup of their versions.  ACLs,
+    invitations, challenges and queues are always applied; an
+    unchanged ACL only costs one read, which Synapse can't batch."""
+    def __init__(self, path: str, template_path: str):
+        """
+        Args:
+            path: Path to the JSON state file. It is created if it
+                  doesn't exist.
+            template_path: Path of the template the state is kept for
+        """
+        self.path = path
+        self.template_key = os.path.abspath(template_path)
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r") as state_f:
+                self._state = json.load(state_f)
+        else:
+            self._state = {}
+        self.records = self._state.setdefault(self.template_key, {})
+        # Records of resources returned without their version, which
+        # are looked up together when the state is saved
+        self._pending = {}
+        self._creation_cls = None
+        # Current versions of the recorded resources of the last plan
+        self._plan_lock = threading.Lock()
+        self._plan = None
+        self._versions = {}
+
+    def _fill_versions(self):
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        if not pending:
+            return
+        versions = _lookup_versions(
+            self._creation_cls,
+            [(kind, record['id']) for kind, record in pending]
+        )
+        with self._lock:
+            for kind, record in pending:
+                current = versions.get(str(record['id']))
+                if current is not None:
+                    record['version'] = current[1]
+
+    def save(self):
+        """Looks up the versions of resources recorded without one and
+        writes the state file"""
+        try:
+            self._fill_versions()
+        finally:
+            with self._lock:
+                content = json.dumps(self._state, indent=2, sort_keys=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w") as state_f:
+                state_f.write(content)
+            os.replace(temp_path, self.path)
+
+    def record(self, creation_cls: SynapseCreation, operation: Operation):
+        """Records a completed operation
+
+        Args:
+            creation_cls: SynapseCreation the operation was run with
+            operation: Completed operation
+        """
+        if operation.kind not in TRACKED_KINDS:
+            return
+        result = operation.result
+        record = {'id': result.id, 'hash': content_hash(operation.config)}
+        version = (result.get(_version_key(operation))
+                   if hasattr(result, 'get') else None)
+        with self._lock:
+            self.records[operation.key] = record
+            if version is not None:
+                record['version'] = version
+            else:
+                # Resources that were looked up may lack their version
+                self._creation_cls = creation_cls
+                self._pending[operation.key] = (operation.kind, record)
+
+    def _unchanged_record(self, operation: Operation) -> dict:
+        """Record of an operation whose template node is unchanged"""
+        record = self.records.get(operation.key)
+        if record is None or 'version' not in record or \
+                record['hash'] != content_hash(operation.config):
+            return None
+        return record
+
+    def _current_versions(self, creation_cls: SynapseCreation,
+                          plan: ExecutionPlan) -> Dict[str, tuple]:
+        """Versions of the recorded resources of a plan, looked up once
+        for all of them"""
+        with self._plan_lock:
+            if plan is not self._plan:
+                resources = []
+                for operation in plan:
+                    if operation.kind not in TRACKED_KINDS:
+                        continue
+                    record = self._unchanged_record(operation)
+                    if record is not None:
+                        resources.append((operation.kind, record['id']))
+                self._versions = _lookup_versions(creation_cls, resources)
+                self._plan = plan
+            return self._versions
+
+    def restore(self, creation_cls: SynapseCreation, plan: ExecutionPlan,
+                operation: Operation) -> bool:
+        """Skips an operation if its template node is unchanged since
+        the last apply and its resource is unchanged in Synapse
+
+        Args:
+            creation_cls: SynapseCreation the plan is run with
+            plan: Execution plan the operation belongs to
+            operation: Operation about to run
+
+        Returns:
+            True if the operation was skipped
+        """
+        if operation.kind not in TRACKED_KINDS:
+            return False
+        record = self._unchanged_record(operation)
+        if record is None:
+            return False
+        current = self._current_versions(creation_cls, plan).get(
+            str(record['id'])
+        )
+        if current != (operation.config['name'], record['version']):
+            return False
+        operation.skipped = True
+        operation.result = _restore_result(operation, record['id'])
+        return True
@@ -1,11 +1,37 @@
 """Utility functions"""
+import glob
+import os
+import queue
+import socket
+import threading
+from typing import Iterable, Iterator, List
+
 import yaml
+from yaml.composer import Composer
+from yaml.constructor import SafeConstructor
+from yaml.events import (MappingEndEvent, MappingStartEvent,
+                         SequenceEndEvent, SequenceStartEvent)
+from yaml.resolver import Resolver
 
+from requests.adapters import HTTPAdapter
 import synapseclient
 from synapseclient.core.exceptions import (
     SynapseNoCredentialsError,
     SynapseAuthenticationError,
 )
+from urllib3 import PoolManager
+
+from .expand import RESOURCES_KEY
+
+# Size of the default requests connection pool
+DEFAULT_POOL_SIZE = 10
+TEMPLATE_EXTENSIONS = (".yaml", ".yml", ".json")
+
+# Use the libyaml parser when it is installed
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 
 
 def read_config(template_path: str) -> dict:
@@ -20,22 +46,293 @@ def read_config(template_path: str) -> dict:
     # JSON is technically yaml but not the other way around.
     # yaml.safe_load can actually read in json files.
     with open(template_path, "r") as template_f:
-        config = yaml.safe_load(template_f)
+        config = yaml.load(template_f, Loader=SafeLoader)
     return config
 
 
-def synapse_login(synapse_config=synapseclient.client.CONFIG_FILE):
+def find_templates(paths: Iterable[str]) -> List[str]:
+    """Finds the templates of paths that are templates, directories of
+    templates or glob patterns
+
+    Args:
+        paths: Template paths, directories or glob patterns
+
+    Returns:
+        Paths of the templates without duplicates, in order
+    """
+    templates = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = sorted(os.path.join(path, name)
+                           for name in os.listdir(path)
+                           if name.endswith(TEMPLATE_EXTENSIONS))
+        elif glob.has_magic(path):
+            found = sorted(glob.glob(path))
+        else:
+            found = [path]
+        if not found:
+            raise ValueError(f"No templates found in '{path}'")
+        templates.extend(found)
+    # The same template could be matched twice
+    return list(dict.fromkeys(templates))
+
+
+class _EventLoader(Composer, SafeConstructor, Resolver):
+    """Composes and constructs yaml nodes from parser events.  This
+    lets the libyaml parser do the parsing while nodes are constructed
+    one at a time."""
+    def __init__(self, events: Iterator):
+        self._events = events
+        self._event = None
+        Composer.__init__(self)
+        SafeConstructor.__init__(self)
+        Resolver.__init__(self)
+
+    def peek_event(self):
+        if self._event is None:
+            self._event = next(self._events)
+        return self._event
+
+    def check_event(self, *choices):
+        try:
+            event = self.peek_event()
+        except StopIteration:
+            return False
+        return not choices or isinstance(event, choices)
+
+    def get_event(self):
+        event = self.peek_event()
+        self._event = None
+        return event
+
+
+def iter_config(template_path: str) -> Iterator[dict]:
+    """Read in yaml or json configuration one top level resource at a
+    time.  Resources are yielded as soon as they are parsed, so the
+    whole template is never held in memory.  Anchors can be referenced
+    by any later resource.
+
+    Args:
+        template_path: Path to yaml or json configuration that is a
+                       list of resources or a mapping with the list of
+                       resources under the Resources key
+
+    Yields:
+        Configuration of each top level resource
+    """
+    with open(template_path, "r") as template_f:
+        loader = _EventLoader(yaml.parse(template_f, Loader=SafeLoader))
+        # Stream and document start
+        loader.get_event()
+        loader.get_event()
+        if loader.check_event(MappingStartEvent):
+            loader.get_event()
+            while not loader.check_event(MappingEndEvent):
+                key = loader.construct_document(
+                    loader.compose_node(None, None)
+                )
+                if key == RESOURCES_KEY and \
+                        loader.check_event(SequenceStartEvent):
+                    break
+                # Other keys only hold anchors
+                loader.compose_node(None, None)
+            else:
+                raise ValueError(f"{template_path} has no "
+                                 f"'{RESOURCES_KEY}' key")
+        if not loader.check_event(SequenceStartEvent):
+            raise ValueError(f"{template_path} must be a list of "
+                             "resources to be streamed")
+        loader.get_event()
+        while not loader.check_event(SequenceEndEvent):
+            node = loader.compose_node(None, None)
+            yield loader.construct_document(node)
+
+
+def iter_prefetched(iterable: Iterable, size: int = 1) -> Iterator:
+    """Iterates over an iterable that is consumed ahead of time in a
+    background thread
+
+    Args:
+        iterable: Any iterable
+        size: Maximum number of items read ahead
+
+    Yields:
+        Items of the iterable
+    """
+    items = queue.Queue(maxsize=size)
+    done = object()
+
+    def _produce():
+        try:
+            for item in iterable:
+                items.put((item, None))
+        except Exception as err:
+            items.put((done, err))
+        else:
+            items.put((done, None))
+
+    threading.Thread(target=_produce, daemon=True).start()
+    while True:
+        item, err = items.get()
+        if err is not None:
+            raise err
+        if item is done:
+            return
+        yield item
+
+
+class _CountingPoolManager(PoolManager):
+    """Pool manager that counts the connections its pools open,
+    including reconnects of pooled connections that were dropped"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connects = 0
+        self._count_lock = threading.Lock()
+
+    def _count_connect(self):
+        with self._count_lock:
+            self.connects += 1
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        pool = super()._new_pool(scheme, host, port,
+                                 request_context=request_context)
+        new_conn = pool._new_conn
+
+        def _new_conn():
+            conn = new_conn()
+            connect = conn.connect
+
+            def _connect():
+                self._count_connect()
+                return connect()
+
+            conn.connect = _connect
+            return conn
+
+        pool._new_conn = _new_conn
+        return pool
+
+
+class PooledAdapter(HTTPAdapter):
+    """Transport adapter with one connection pool per host that is
+    shared by every thread of a Synapse connection.  Threads wait for a
+    free connection instead of opening throwaway ones, so connections
+    and their TLS sessions are reused."""
+    __attrs__ = HTTPAdapter.__attrs__ + ['keep_alive']
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE,
+                 keep_alive: bool = True):
+        """
+        Args:
+            pool_size: Maximum number of connections per host
+            keep_alive: Enable TCP keep-alive so idle connections in the
+                        pool aren't dropped by the network
+        """
+        self.keep_alive = keep_alive
+        self.requests = 0
+        self._count_lock = threading.Lock()
+        super().__init__(pool_connections=pool_size, pool_maxsize=pool_size,
+                         pool_block=True)
+
+    def init_poolmanager(self, connections, maxsize, block=False,
+                         **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        if self.keep_alive:
+            pool_kwargs['socket_options'] = [
+                (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            ]
+        self.poolmanager = _CountingPoolManager(
+            num_pools=connections, maxsize=maxsize, block=block,
+            **pool_kwargs
+        )
+
+    def __setstate__(self, state):
+        self.requests = 0
+        self._count_lock = threading.Lock()
+        super().__setstate__(state)
+
+    def send(self, request, *args, **kwargs):
+        with self._count_lock:
+            self.requests += 1
+        return super().send(request, *args, **kwargs)
+
+    def connection_stats(self) -> dict:
+        """Requests sent and connections opened through the adapter
+
+        Returns:
+            dict with the number of requests, connections and requests
+            that reused a connection
+        """
+        connections = self.poolmanager.connects
+        return {'requests': self.requests, 'connections': connections,
+                'reused': max(self.requests - connections, 0)}
+
+
+def mount_pool(syn: synapseclient.Synapse,
+               pool_size: int = DEFAULT_POOL_SIZE,
+               keep_alive: bool = True) -> PooledAdapter:
+    """Mounts a sized connection pool on a Synapse connection
+
+    Args:
+        syn: Synapse connection
+        pool_size: Maximum number of connections per host.  Should be
+                   at least the number of concurrent workers.
+        keep_alive: Reuse connections.  If False, every request opens
+                    a new connection.
+
+    Returns:
+        The mounted adapter
+    """
+    adapter = PooledAdapter(pool_size=pool_size, keep_alive=keep_alive)
+    session = syn._requests_session
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if not keep_alive:
+        session.headers['Connection'] = "close"
+    return adapter
+
+
+def connection_stats(syn: synapseclient.Synapse) -> dict:
+    """Connection reuse of a Synapse connection with a mounted pool
+
+    Args:
+        syn: Synapse connection
+
+    Returns:
+        See PooledAdapter.connection_stats.  None if no pool was
+        mounted.
+    """
+    session = getattr(syn, "_requests_session", None)
+    if session is None:
+        return None
+    adapter = session.get_adapter("https://")
+    if not isinstance(adapter, PooledAdapter):
+        return None
+    return adapter.connection_stats()
+
+
+def synapse_login(synapse_config=synapseclient.client.CONFIG_FILE,
+                  pool_size: int = None, keep_alive: bool = True):
     """Login to Synapse
 
     Args:
         synapse_config: Path to synapse configuration file.
                         Defaults to ~/.synapseConfig
+        pool_size: Maximum number of connections per host.  Default is
+                   the requests default of 10.  See mount_pool.
+        keep_alive: Reuse connections. See mount_pool.
 
     Returns:
         Synapse connection
     """
     try:
         syn = synapseclient.Synapse(configPath=synapse_config)
+        if pool_size is not None or not keep_alive:
+            mount_pool(syn, pool_size=pool_size or DEFAULT_POOL_SIZE,
+                       keep_alive=keep_alive)
         syn.login(silent=True)
     except (SynapseNoCredentialsError, SynapseAuthenticationError):
         raise ValueError(
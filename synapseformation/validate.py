@@ -0,0 +1,227 @@
+"""Validates templates before any Synapse call"""
+from typing import List
+
+# Keys of every resource type and the types of their values.  Required
+# keys map to True.
+SCHEMA = {
+    'Project': {'name': (str, True), 'type': (str, True),
+                'id': (str, False), 'acl': (list, False),
+                'children': (list, False), 'challenge': (dict, False),
+                'evaluations': (list, False)},
+    'Folder': {'name': (str, True), 'type': (str, True),
+               'id': (str, False), 'acl': (list, False),
+               'children': (list, False)},
+    'Team': {'name': (str, True), 'type': (str, True),
+             'id': ((str, int), False), 'description': (str, True),
+             'can_public_join': (bool, True),
+             'invitations': (list, False)}
+}
+# Keys of the evaluation queues of projects
+QUEUE_SCHEMA = {'name': (str, True), 'description': (str, False),
+                'submission_instructions': (str, False),
+                'submission_receipt': (str, False)}
+# Resource types that can be children of projects and folders
+CHILD_TYPES = ('Folder',)
+# Keys naming the principal of an ACL entry and of an invited member.
+# Names are resolved to ids before the template is applied.
+PRINCIPAL_KEYS = ('principal_id', 'user_name', 'team_name')
+MEMBER_KEYS = ('principal_id', 'user_name', 'email')
+# Number of errors listed by check_template
+MAX_REPORTED = 20
+
+
+def _compile(schema: dict) -> dict:
+    """Splits the schema of every type into its required keys and the
+    types of all of its keys"""
+    return {resource_type: ([key for key, (_, required) in keys.items()
+                             if required],
+                            {key: value_type
+                             for key, (value_type, _) in keys.items()})
+            for resource_type, keys in schema.items()}
+
+
+_COMPILED = _compile(SCHEMA)
+_QUEUE_REQUIRED, _QUEUE_TYPES = _compile({'queue': QUEUE_SCHEMA})['queue']
+
+
+def _type_name(value_type) -> str:
+    if isinstance(value_type, tuple):
+        return " or ".join(item.__name__ for item in value_type)
+    return value_type.__name__
+
+
+def _check_acl(acl: list, path: str, errors: List[str]):
+    for entry in acl:
+        if not isinstance(entry, dict):
+            errors.append(f"{path}: ACL entries must be mappings")
+            continue
+        principals = [key for key in PRINCIPAL_KEYS if key in entry]
+        if len(principals) != 1:
+            errors.append(f"{path}: ACL entries need one of "
+                          f"{', '.join(PRINCIPAL_KEYS)}")
+        elif principals == ['principal_id']:
+            principalid = entry['principal_id']
+            if isinstance(principalid, bool) or \
+                    not str(principalid).isdigit():
+                errors.append(f"{path}: ACL principal_id must be a "
+                              f"number, not {principalid!r}")
+        elif not isinstance(entry[principals[0]], str) or \
+                not entry[principals[0]]:
+            errors.append(f"{path}: ACL {principals[0]} must be a name")
+        access_type = entry.get('access_type')
+        if not isinstance(access_type, list) or not access_type or \
+                not all(isinstance(item, str) for item in access_type):
+            errors.append(f"{path}: ACL access_type must be a list of "
+                          "permissions")
+
+
+def _check_queues(queues: list, path: str, queue_names: set,
+                  errors: List[str]):
+    """Checks the evaluation queues of a project.  Queue names are
+    unique across Synapse, so they must be unique in the template."""
+    for index, queue in enumerate(queues):
+        if not isinstance(queue, dict):
+            errors.append(f"{path}: evaluations must be mappings")
+            continue
+        name = queue.get('name')
+        queue_path = f"{path}#evaluation:{name}" if isinstance(name, str) \
+            else f"{path}#evaluations[{index}]"
+        for key in _QUEUE_REQUIRED:
+            if key not in queue:
+                errors.append(f"{queue_path}: missing '{key}'")
+        for key, value in queue.items():
+            value_type = _QUEUE_TYPES.get(key)
+            if value_type is None:
+                errors.append(f"{queue_path}: unknown key '{key}'")
+            elif not isinstance(value, value_type):
+                errors.append(f"{queue_path}: '{key}' must be a "
+                              f"{_type_name(value_type)}")
+        if isinstance(name, str):
+            if name in queue_names:
+                errors.append(f"{queue_path}: duplicate evaluation name")
+            queue_names.add(name)
+
+
+def _check_invitations(invitations: list, path: str, errors: List[str]):
+    for invitation in invitations:
+        if not isinstance(invitation, dict) or \
+                not isinstance(invitation.get('message'), str) or \
+                not isinstance(invitation.get('members'), list):
+            errors.append(f"{path}: invitations need a message and a "
+                          "list of members")
+            continue
+        for member in invitation['members']:
+            if not isinstance(member, dict) or \
+                    sum(key in member for key in MEMBER_KEYS) != 1:
+                errors.append(f"{path}: invited members need one of "
+                              f"{', '.join(MEMBER_KEYS)}, not {member!r}")
+
+
+def validate_template(config_list: list,
+                      seen_names: dict = None) -> List[str]:
+    """Validates an expanded template in a single pass without any
+    Synapse call.  Resources are checked against the schema of their
+    type, and sibling names must be unique.
+
+    Args:
+        config_list: Expanded template
+        seen_names: Top level, team and queue names of the resources
+                    validated before, updated in place.  Templates
+                    validated one resource at a time share it so names
+                    are unique across all of them and challenges can
+                    use the teams before them.
+
+    Returns:
+        Errors, each starting with the path of the resource.  Empty if
+        the template is valid.
+    """
+    if not isinstance(config_list, list):
+        return ["Template must be a list of resources"]
+    errors = []
+    if seen_names is None:
+        seen_names = {}
+    top_names = seen_names.setdefault('resources', set())
+    team_names = seen_names.setdefault('teams', set())
+    queue_names = seen_names.setdefault('queues', set())
+    challenges = []
+    # Resources of a level, the path of their parent and whether they
+    # are children of a project or folder
+    stack = [(config_list, "", False)]
+    while stack:
+        resources, prefix, nested = stack.pop()
+        names = set() if nested else top_names
+        for index, config in enumerate(resources):
+            if not isinstance(config, dict):
+                errors.append(f"{prefix}[{index}]: resources must be "
+                              "mappings")
+                continue
+            name = config.get('name')
+            path = f"{prefix}{name}" if isinstance(name, str) and name \
+                else f"{prefix}[{index}]"
+            resource_type = config.get('type')
+            compiled = _COMPILED.get(resource_type)
+            if compiled is None:
+                errors.append(f"{path}: unknown type {resource_type!r}")
+                continue
+            if nested and resource_type not in CHILD_TYPES:
+                errors.append(f"{path}: a {resource_type} can't be a "
+                              "child")
+            required, key_types = compiled
+            for key in required:
+                if key not in config:
+                    errors.append(f"{path}: missing '{key}'")
+            for key, value in config.items():
+                value_type = key_types.get(key)
+                if value_type is None:
+                    errors.append(f"{path}: unknown key '{key}'")
+                elif not isinstance(value, value_type):
+                    errors.append(f"{path}: '{key}' must be a "
+                                  f"{_type_name(value_type)}")
+            if not isinstance(name, str) or not name:
+                continue
+            if resource_type == 'Team':
+                if name in team_names:
+                    errors.append(f"{path}: duplicate team name")
+                team_names.add(name)
+                if isinstance(config.get('invitations'), list):
+                    _check_invitations(config['invitations'], path, errors)
+                continue
+            if name in names:
+                errors.append(f"{path}: duplicate name")
+            names.add(name)
+            if isinstance(config.get('acl'), list):
+                _check_acl(config['acl'], path, errors)
+            if isinstance(config.get('evaluations'), list):
+                _check_queues(config['evaluations'], path, queue_names,
+                              errors)
+            if isinstance(config.get('challenge'), dict):
+                challenges.append((path, config['challenge']))
+            if isinstance(config.get('children'), list):
+                stack.append((config['children'], f"{path}/", True))
+    for path, challenge in challenges:
+        team_name = challenge.get('participant_team')
+        if not isinstance(team_name, str):
+            errors.append(f"{path}: challenge needs a participant_team")
+        elif team_name not in team_names:
+            errors.append(f"{path}: participant team '{team_name}' is not "
+                          "in the template")
+    return errors
+
+
+def check_template(config_list: list, seen_names: dict = None):
+    """Raises an error listing the problems of an invalid template.
+    See validate_template
+
+    Args:
+        config_list: Expanded template
+        seen_names: Names of the resources validated before
+    """
+    errors = validate_template(config_list, seen_names=seen_names)
+    if not errors:
+        return
+    listed = "\n".join(f"  {error}" for error in errors[:MAX_REPORTED])
+    more = len(errors) - MAX_REPORTED
+    if more > 0:
+        listed += f"\n  and {more} more"
+    raise ValueError(f"Invalid template with {len(errors)} errors:\n"
+                     f"{listed}")
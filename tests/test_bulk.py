@@ -0,0 +1,99 @@
+"""Test bulk folder creation"""
+import json
+from unittest import mock
+from unittest.mock import Mock, patch
+
+import pytest
+import synapseclient
+from synapseclient.core.exceptions import SynapseHTTPError
+
+from synapseformation import bulk, planner
+from synapseformation.create import SynapseCreation
+
+FOLDERS = [{'name': 'Genes', 'parentId': 'syn1'},
+           {'name': 'Data', 'parentId': 'syn1'},
+           {'name': 'Assays', 'parentId': 'syn1'}]
+
+
+def _batch_response(endpoint, body):
+    """Batch response where every folder is created"""
+    return {'list': [
+        {'entity': {'id': f"syn{index}", 'name': folder['name'],
+                    'parentId': folder['parentId'],
+                    'concreteType': folder['concreteType']},
+         'created': True}
+        for index, folder in enumerate(json.loads(body)['list'], 10)
+    ]}
+
+
+def test_batch_backend():
+    """Test folders are sent in batches"""
+    syn = mock.create_autospec(synapseclient.Synapse)
+    syn.restPOST.side_effect = _batch_response
+    backend = bulk.BatchFolderBackend(batch_size=2)
+    creation_cls = SynapseCreation(syn, folder_backend=backend)
+    folders = creation_cls.create_folders(FOLDERS)
+    assert [folder.name for folder in folders] == ["Genes", "Data",
+                                                   "Assays"]
+    assert isinstance(folders[0], synapseclient.Folder)
+    assert syn.restPOST.call_count == 2
+    assert backend.supported is True
+    # New folders are cached as empty containers
+    assert creation_cls._get_children(folders[0].id) == {}
+
+
+def test_batch_backend_fallback():
+    """Test servers without the batch endpoint fall back to stores"""
+    syn = mock.create_autospec(synapseclient.Synapse)
+    syn.restPOST.side_effect = SynapseHTTPError(
+        "Not Found", response=Mock(status_code=404)
+    )
+    backend = bulk.BatchFolderBackend(
+        batch_size=2, fallback=bulk.StoreFolderBackend(workers=1)
+    )
+    creation_cls = SynapseCreation(syn, folder_backend=backend)
+    returned = synapseclient.Folder(name="Genes", id="syn2",
+                                    parentId="syn1")
+    with patch.object(creation_cls, "get_or_create_folder",
+                      return_value=returned) as patch_folder:
+        folders = creation_cls.create_folders(FOLDERS)
+    assert folders == [returned] * 3
+    assert patch_folder.call_count == 3
+    syn.restPOST.assert_called_once()
+    assert backend.supported is False
+
+
+def test_batch_backend_conflict():
+    """Test an existing folder fails the batch unless only_get"""
+    syn = mock.create_autospec(synapseclient.Synapse)
+    syn.restPOST.side_effect = SynapseHTTPError(
+        "foo", response=Mock(status_code=409)
+    )
+    creation_cls = SynapseCreation(
+        syn, folder_backend=bulk.BatchFolderBackend()
+    )
+    with pytest.raises(ValueError, match="foo. To use existing entities"):
+        creation_cls.create_folders(FOLDERS)
+
+
+def test_execute_plan_folder_backend():
+    """Test the folders of every wave are created at once"""
+    config = [{'name': 'Test Project', 'type': 'Project',
+               'children': [{'name': 'Genes', 'type': 'Folder',
+                             'children': [{'name': 'testing',
+                                           'type': 'Folder'}]},
+                            {'name': 'Data', 'type': 'Folder'}]}]
+    syn = mock.create_autospec(synapseclient.Synapse)
+    syn.restPOST.side_effect = _batch_response
+    creation_cls = SynapseCreation(
+        syn, folder_backend=bulk.BatchFolderBackend()
+    )
+    plan = planner.compile_plan(config)
+    with patch.object(creation_cls, "get_or_create_project",
+                      return_value=synapseclient.Project(
+                          name="Test Project", id="syn1"
+                      )):
+        planner.execute_plan(plan, creation_cls, workers=2)
+    assert syn.restPOST.call_count == 2
+    assert config[0]['children'][0]['id'] == "syn10"
+    assert plan.get("Test Project/Genes/testing").result.parentId == "syn10"
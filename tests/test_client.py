@@ -1,66 +1,19 @@
 """
 Test client
 """
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import time
 from unittest import mock
 from unittest.mock import patch
 
+import pytest
 import synapseclient
-from synapseformation import client, create
+from synapseformation import client
 from synapseformation.create import SynapseCreation
 
 
-# def test_expand_config():
-#     test_config = {
-#         'TestRemove': "foo",
-#         'name': 'Test Configuration',
-#         'type': 'Project',
-#         'children': [
-#             {
-#                 'name': 'Genes',
-#                 'type': 'Folder',
-#                 'children': [
-#                     'testing',
-#                     'foobar',
-#                     'wow',
-#                     {
-#                         'name': "test",
-#                         'type': "Folder"
-#                     }
-#                 ]
-#             }
-#         ]
-#     }
-#     expected_config = {
-#         'name': 'Test Configuration',
-#         'type': 'Project',
-#         'children': [
-#             {
-#                 'name': 'Genes',
-#                 'type': 'Folder',
-#                 'children': [
-#                     {
-#                         'name': "testing",
-#                         'type': "Folder"
-#                     },
-#                     {
-#                         'name': "foobar",
-#                         'type': "Folder"
-#                     },
-#                     {
-#                         'name': "wow",
-#                         'type': "Folder"
-#                     },
-#                     {
-#                         'name': "test",
-#                         'type': "Folder"
-#                     }
-#                 ]
-#             }
-#         ]
-#     }
-#     full_config = client.expand_config(test_config)
-#     assert full_config == expected_config
-
 class TestCreateSynapseResources():
 
     def setup_method(self):
@@ -158,14 +111,13 @@ class TestCreateSynapseResources():
         project_ent = synapseclient.Project(id="syn12222")
         with patch.object(self.create_cls, "get_or_create_project",
                           return_value=project_ent) as patch_create,\
-             patch.object(create, "_set_acl") as patch_set:
+             patch.object(self.create_cls, "set_acl") as patch_set:
             client._create_synapse_resources(config_list=project_config,
                                              creation_cls=self.create_cls)
             patch_create.assert_called_once_with(name=project_name)
             assert project_config == expected_config
-            patch_set.assert_called_once_with(
-                syn=self.create_cls.syn, entity=project_ent,
-                acl_config=['fake'])
+            patch_set.assert_called_once_with(entity=project_ent,
+                                              acl_config=['fake'])
 
     def test__create_synapse_resources_recursive(self):
         """Test recursive calls are made"""
@@ -230,16 +182,227 @@ class TestCreateSynapseResources():
         }]
         team_ent = synapseclient.Team(id="11111")
         expected_calls = [
-            mock.call(team=team_ent, user=3426116, inviteeEmail=None,
+            mock.call("11111", inviteeId="3426116", inviteeEmail=None,
                       message='Welcome to the Test Team!'),
-            mock.call(team=team_ent, user=None,
+            mock.call("11111", inviteeId=None,
                       inviteeEmail="synapseformation-test-user@sagebase.org",
                       message='Welcome to the Test Team!')
         ]
         with patch.object(self.create_cls, "get_or_create_team",
                           return_value=team_ent) as patch_create,\
+             patch.object(self.create_cls.syn, "getTeamMembers",
+                          return_value=iter([])),\
+             patch.object(self.create_cls.syn, "get_team_open_invitations",
+                          return_value=iter([])),\
              patch.object(self.create_cls.syn,
-                          "invite_to_team") as patch_invite:
+                          "send_membership_invitation") as patch_invite:
             client._create_synapse_resources(config_list=team_config,
                                              creation_cls=self.create_cls)
-            patch_invite.assert_has_calls(expected_calls)
\ No newline at end of file
+            patch_invite.assert_has_calls(expected_calls)
+
+    def test__create_synapse_resources_team_not_entity(self):
+        """Test team ids are not overwritten by a preceding project"""
+        config = [
+            {'name': 'Test Configuration', 'type': 'Project'},
+            {'name': 'Test Team', 'type': 'Team', 'can_public_join': False,
+             'description': 'Test team description'}
+        ]
+        project_ent = synapseclient.Project(id="syn12222")
+        team_ent = synapseclient.Team(id="11111")
+        with patch.object(self.create_cls, "get_or_create_project",
+                          return_value=project_ent),\
+             patch.object(self.create_cls, "get_or_create_team",
+                          return_value=team_ent),\
+             patch.object(self.create_cls, "set_acl") as patch_set:
+            client._create_synapse_resources(config_list=config,
+                                             creation_cls=self.create_cls)
+            assert config[0]['id'] == "syn12222"
+            assert config[1]['id'] == "11111"
+            patch_set.assert_not_called()
+
+    def test__create_synapse_resources_concurrently(self):
+        """Test concurrent creation assigns the same ids as serial"""
+        def _project(name):
+            return synapseclient.Project(name=name, id=f"syn-{name}")
+
+        def _folder(name, parentId):
+            return synapseclient.Folder(name=name, parentId=parentId,
+                                        id=f"{parentId}/{name}")
+
+        serial_config = copy.deepcopy(self.config)
+        with patch.object(self.create_cls, "get_or_create_project",
+                          side_effect=_project),\
+             patch.object(self.create_cls, "get_or_create_folder",
+                          side_effect=_folder) as patch_create_folder:
+            client._create_synapse_resources(config_list=serial_config,
+                                             creation_cls=self.create_cls)
+            client._create_synapse_resources(config_list=self.config,
+                                             creation_cls=self.create_cls,
+                                             workers=4)
+            assert self.config == serial_config
+            assert self.config[0]['children'][0]['children'][0]['id'] == \
+                "syn-Test Configuration/Genes/testing"
+            patch_create_folder.assert_has_calls(
+                [mock.call(name="Genes", parentId="syn-Test Configuration"),
+                 mock.call(name="testing",
+                           parentId="syn-Test Configuration/Genes")]
+            )
+
+    def test_create_synapse_resources_workers(self):
+        """Test workers are passed to the plan executor"""
+        with patch.object(client.utils, "read_config",
+                          return_value=self.config),\
+             patch.object(client.planner, "execute_plan") as patch_execute:
+            client.create_synapse_resources(syn=self.syn,
+                                            template_path="foo.yaml",
+                                            workers=3)
+            patch_execute.assert_called_once_with(
+                plan=mock.ANY, creation_cls=mock.ANY, workers=3, state=None,
+                journal=None, manifest=None
+            )
+            assert len(patch_execute.call_args[1]['plan']) == 3
+
+    def test_create_synapse_resources_stream(self):
+        """Test each streamed resource is planned and executed"""
+        resources = [{'name': 'foo', 'type': 'Project'},
+                     {'name': 'bar', 'type': 'Project'}]
+        with patch.object(client.utils, "iter_config",
+                          return_value=iter(resources)),\
+             patch.object(client.utils, "read_config") as patch_read,\
+             patch.object(client.planner, "execute_plan") as patch_execute:
+            client.create_synapse_resources(syn=self.syn,
+                                            template_path="foo.yaml",
+                                            stream=True)
+            patch_read.assert_not_called()
+            plans = [call[1]['plan'] for call in patch_execute.call_args_list]
+            assert [[operation.key for operation in plan]
+                    for plan in plans] == [['foo'], ['bar']]
+
+    def test_create_synapse_resources_stream_duplicate(self):
+        """Test streamed resources with the same name fail before the
+        second one is created"""
+        resources = [{'name': 'Dup', 'type': 'Project'},
+                     {'name': 'Dup', 'type': 'Project'}]
+        with patch.object(client.utils, "iter_config",
+                          return_value=iter(resources)),\
+             patch.object(client.planner, "execute_plan") as patch_execute,\
+             pytest.raises(ValueError, match="Dup: duplicate name"):
+            client.create_synapse_resources(syn=self.syn,
+                                            template_path="foo.yaml",
+                                            stream=True)
+        patch_execute.assert_called_once()
+
+    def test_create_synapse_resources_rate_limit(self):
+        """Test a rate limiter observing the connection is shared"""
+        with patch.object(client.utils, "read_config",
+                          return_value=self.config),\
+             patch.object(client.RateLimiter, "observe") as patch_observe,\
+             patch.object(client.planner, "execute_plan") as patch_execute:
+            client.create_synapse_resources(syn=self.syn,
+                                            template_path="foo.yaml",
+                                            rate_limit=5)
+            patch_observe.assert_called_once_with(self.syn)
+            creation_cls = patch_execute.call_args[1]['creation_cls']
+            assert creation_cls.rate_limiter.rate == 5
+
+    def test_create_many_synapse_resources(self):
+        """Test every template gets its own files and failures are kept"""
+        def _create(syn, template_path, recorder, **kwargs):
+            recorder.record("store", 0.1)
+            if template_path == "b.yaml":
+                raise ValueError("foo")
+
+        with patch.object(client, "ProcessPoolExecutor",
+                          ThreadPoolExecutor),\
+             patch.object(client.utils, "synapse_login",
+                          return_value=self.syn),\
+             patch.object(client, "create_synapse_resources",
+                          side_effect=_create) as patch_create:
+            results = client.create_many_synapse_resources(
+                synapse_config="config", template_paths=["a.yaml", "b.yaml"],
+                processes=2, journal_path="run.journal", workers=3
+            )
+        assert [(result['template_path'], result['error'])
+                for result in results] == [("a.yaml", None),
+                                           ("b.yaml", "ValueError: foo")]
+        patch_create.assert_any_call(
+            syn=self.syn, template_path="a.yaml", recorder=mock.ANY,
+            workers=3, state_path=None, journal_path="run.a.journal",
+            output_path=None
+        )
+
+    def test_create_synapse_resources_invalid(self):
+        """Test invalid templates fail before any Synapse call"""
+        config = [{'name': 'Test Team', 'type': 'Team', 'description': 'foo'}]
+        with patch.object(client.utils, "read_config",
+                          return_value=config),\
+             patch.object(client.planner, "execute_plan") as patch_execute,\
+             pytest.raises(ValueError, match="missing 'can_public_join'"):
+            client.create_synapse_resources(syn=self.syn,
+                                            template_path="foo.yaml")
+        patch_execute.assert_not_called()
+
+    def test_create_synapse_resources_resume_conflict(self, tmp_path):
+        """Test a resumed run uses a folder the failed run stored without
+        journaling it"""
+        project = synapseclient.Project(name='Test Configuration',
+                                        id="syn1")
+        genes = {'id': "syn2", 'name': "Genes",
+                 'type': "org.sagebionetworks.repo.model.Folder"}
+        response = mock.Mock(status_code=409)
+        conflict = synapseclient.core.exceptions.SynapseHTTPError(
+            "409 Client Error: An entity with the name: Genes already "
+            "exists", response=response
+        )
+        config = [{'name': 'Test Configuration', 'type': 'Project',
+                   'children': [{'name': 'Genes', 'type': 'Folder'}]}]
+        journal_path = str(tmp_path / "run.journal")
+        # The folder is stored but its response is lost
+        self.syn.store.side_effect = [project, ConnectionError("Lost")]
+        with patch.object(client.utils, "read_config",
+                          side_effect=lambda path: copy.deepcopy(config)),\
+             pytest.raises(ConnectionError):
+            client.create_synapse_resources(syn=self.syn,
+                                            template_path="foo.yaml",
+                                            journal_path=journal_path)
+        self.syn.store.side_effect = [conflict]
+        self.syn.getChildren.side_effect = lambda parent, **kwargs: \
+            iter([genes])
+        self.syn.get.return_value = synapseclient.Folder(
+            name="Genes", id="syn2", parentId="syn1"
+        )
+        with patch.object(client.utils, "read_config",
+                          side_effect=lambda path: copy.deepcopy(config)):
+            client.create_synapse_resources(syn=self.syn,
+                                            template_path="foo.yaml",
+                                            journal_path=journal_path,
+                                            resume=True)
+        assert self.syn.store.call_count == 3
+
+    def test_create_synapse_resources_async(self):
+        """Test the async driver expands, validates and resolves the
+        template like the sync driver"""
+        config = {'Resources': [{
+            'name': 'Test Configuration', 'type': 'Project',
+            'acl': [{'user_name': 'jdoe', 'access_type': ['READ']}]
+        }]}
+
+        def _lookup(resolver, aliases):
+            resolver._principals['jdoe'] = {'id': 3426116,
+                                            'individual': True,
+                                            'resolved': time.time()}
+
+        with patch.object(client.utils, "read_config",
+                          return_value=config),\
+             patch.object(client.PrincipalResolver, "_lookup",
+                          autospec=True, side_effect=_lookup),\
+             patch.object(client.planner,
+                          "execute_plan_async") as patch_execute:
+            asyncio.run(client.create_synapse_resources_async(
+                syn=self.syn, template_path="foo.yaml"
+            ))
+        plan = list(patch_execute.call_args[1]['plan'])
+        assert [operation.kind for operation in plan] == ["project", "acl"]
+        assert plan[1].config['acl'] == [{'user_name': 'jdoe',
+                                          'access_type': ['READ'],
+                                          'principal_id': 3426116}]
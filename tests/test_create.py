@@ -3,17 +3,22 @@ Tests creation module
 Functions are named with the function name in create module along
 with what is tested
 """
+import asyncio
 import json
 from unittest import mock
 from unittest.mock import Mock, patch
+import threading
+import time
 import uuid
 
 import pytest
+import requests
 import synapseclient
 from synapseclient.core.exceptions import SynapseHTTPError
 
 from synapseformation import create
 from synapseformation.create import SynapseCreation
+from synapseformation.ratelimit import RateLimiter
 
 SYN = mock.create_autospec(synapseclient.Synapse)
 CREATE_CLS = SynapseCreation(SYN)
@@ -82,39 +87,131 @@ def test__find_by_obj_or_create__get():
 
 
 def test__find_entity_by_name__valid():
-    """Test getting entities by name"""
-    post_return = {'id': "syn11111"}
+    """Test getting entities by name with one listing of the parent"""
+    get_cls = SynapseCreation(SYN, only_get=True)
+    children = [{'id': "syn22222", 'name': "bar.txt",
+                 'type': "org.sagebionetworks.repo.model.FileEntity"},
+                {'id': "syn11111", 'name': "foo.txt",
+                 'type': "org.sagebionetworks.repo.model.FileEntity"}]
     obj = synapseclient.File(path="foo.txt", parentId="syn12345",
                              id="syn11111")
-    with patch.object(SYN, "findEntityId",
-                      return_value=post_return) as patch_find,\
+    with patch.object(SYN, "getChildren",
+                      return_value=iter(children)) as patch_children,\
+         patch.object(SYN, "findEntityId") as patch_find,\
          patch.object(SYN, "get", return_value=obj) as patch_get:
-        return_obj = GET_CLS._find_entity_by_name(
+        return_obj = get_cls._find_entity_by_name(
             parentid="syn12345",
             entity_name="foo.txt",
-            concrete_type=obj.properties.concreteType
+            concrete_type="org.sagebionetworks.repo.model.FileEntity"
         )
-        assert obj == return_obj
-        patch_find.assert_called_once_with("foo.txt", parent="syn12345")
+        assert return_obj == obj
+        patch_children.assert_called_once_with("syn12345")
+        patch_find.assert_not_called()
         patch_get.assert_called_once_with("syn11111", downloadFile=False)
 
 
+def test__find_entity_by_name__folder():
+    """Test folders are built from their header without being fetched"""
+    get_cls = SynapseCreation(SYN, only_get=True)
+    children = [{'id': "syn11111", 'name': "foo",
+                 'type': "org.sagebionetworks.repo.model.Folder"}]
+    with patch.object(SYN, "getChildren", return_value=iter(children)),\
+         patch.object(SYN, "get") as patch_get:
+        return_obj = get_cls._find_entity_by_name(
+            parentid="syn12345",
+            entity_name="foo",
+            concrete_type="org.sagebionetworks.repo.model.Folder"
+        )
+        assert isinstance(return_obj, synapseclient.Folder)
+        assert return_obj.id == "syn11111"
+        assert return_obj.parentId == "syn12345"
+        patch_get.assert_not_called()
+
+
+def test__find_entity_by_name__project():
+    """Test projects are found with a single lookup by name"""
+    with patch.object(SYN, "findEntityId",
+                      return_value="syn11111") as patch_find,\
+         patch.object(SYN, "getChildren") as patch_children:
+        return_obj = GET_CLS._find_entity_by_name(
+            parentid=None,
+            entity_name="foo",
+            concrete_type="org.sagebionetworks.repo.model.Project"
+        )
+        assert isinstance(return_obj, synapseclient.Project)
+        assert return_obj.id == "syn11111"
+        patch_find.assert_called_once_with("foo")
+        patch_children.assert_not_called()
+
+
+def test__find_entity_by_name__missing():
+    """Test None is returned when the entity doesn't exist"""
+    get_cls = SynapseCreation(SYN, only_get=True)
+    with patch.object(SYN, "getChildren", return_value=iter([])):
+        return_obj = get_cls._find_entity_by_name(
+            parentid="syn12345",
+            entity_name="foo.txt",
+            concrete_type="org.sagebionetworks.repo.model.FileEntity"
+        )
+        assert return_obj is None
+
+
 def test__find_entity_by_name__invalid():
     """Test getting entities by name"""
-    post_return = {'id': "syn11111"}
-    obj = synapseclient.File(path="foo.txt", parentId="syn12345",
-                             id="syn11111")
-    with patch.object(SYN, "findEntityId", return_value=post_return),\
-         patch.object(SYN, "get", return_value=obj),\
+    get_cls = SynapseCreation(SYN, only_get=True)
+    children = [{'id': "syn11111", 'name': "foo.txt",
+                 'type': "org.sagebionetworks.repo.model.FileEntity"}]
+    with patch.object(SYN, "getChildren", return_value=iter(children)),\
          pytest.raises(AssertionError,
                        match="Retrieved .* had type .* rather than .*"):
-        GET_CLS._find_entity_by_name(
+        get_cls._find_entity_by_name(
             parentid="syn12345",
             entity_name="foo.txt",
             concrete_type="Test"
         )
 
 
+def test__find_by_obj_or_create__existing_first():
+    """Tests existing entities are looked up before attempting a store"""
+    existing_cls = SynapseCreation(SYN, only_get=True, existing_first=True)
+    entity = synapseclient.Folder(name="foo", parentId="syn12345")
+    returned = synapseclient.Folder(name="foo", parentId="syn12345",
+                                    id="syn11111")
+    with patch.object(existing_cls, "_get_obj",
+                      return_value=returned) as patch_get,\
+         patch.object(SYN, "store") as patch_store:
+        get_ent = existing_cls._find_by_obj_or_create(entity)
+        assert get_ent == returned
+        patch_get.assert_called_once_with(entity)
+        patch_store.assert_not_called()
+
+
+def test__find_by_obj_or_create__existing_first_create():
+    """Tests entities are created when the lookup finds nothing"""
+    existing_cls = SynapseCreation(SYN, only_get=True, existing_first=True)
+    entity = synapseclient.Folder(name="foo", parentId="syn12345")
+    returned = synapseclient.Folder(name="foo", parentId="syn12345",
+                                    id="syn11111")
+    with patch.object(existing_cls, "_get_obj", return_value=None),\
+         patch.object(SYN, "store", return_value=returned) as patch_store:
+        created_ent = existing_cls._find_by_obj_or_create(entity)
+        assert created_ent == returned
+        patch_store.assert_called_once_with(entity, createOrUpdate=False)
+
+
+def test__find_by_obj_or_create__existing_first_raise():
+    """Tests existing entities raise an error when not only_get"""
+    existing_cls = SynapseCreation(SYN, existing_first=True)
+    entity = synapseclient.Folder(name="foo", parentId="syn12345")
+    returned = synapseclient.Folder(name="foo", parentId="syn12345",
+                                    id="syn11111")
+    with patch.object(existing_cls, "_get_obj", return_value=returned),\
+         pytest.raises(ValueError, match="foo already exists. To use "
+                                         "existing entities, set only_get "
+                                         "to True."):
+        existing_cls._find_by_obj_or_create(entity)
+
+
 @pytest.mark.parametrize(
     "obj", [synapseclient.Project(name="foo"),
             synapseclient.File(path="foo.txt", parentId="syn12345"),
@@ -407,22 +504,432 @@ def test_get_or_create_challenge__get_raise_missing_param():
         CREATE_CLS.get_or_create_challenge(participantTeamId=teamid)
 
 
-def test__set_acl():
+def test__set_acl__update():
+    """Tests all ACL entries are written with a single call"""
     syn = Mock()
-    entity = Mock()
+    entity = synapseclient.Project(id="syn12345")
     acl_config = [
         {"principal_id": "1111111",
          "access_type": ["READ", "DOWNLOAD"]},
         {"principal_id": "2222222",
          "access_type": ["READ", "DOWNLOAD", "UPDATE"]}
     ]
-    expected_calls = [
-        mock.call(entity=entity, principalId="1111111",
-                  accessType=["READ", "DOWNLOAD"]),
-        mock.call(entity=entity, principalId="2222222",
-                  accessType=["READ", "DOWNLOAD", "UPDATE"])
-    ]
-    with patch.object(syn, "setPermissions") as patch_set:
-        create._set_acl(syn=syn, entity=entity,
-                        acl_config=acl_config)
-        patch_set.assert_has_calls(expected_calls)
+    current = {'id': "syn12345", 'etag': "foo",
+               'resourceAccess': [{'principalId': 1111111,
+                                   'accessType': ["READ"]},
+                                  {'principalId': 3333333,
+                                   'accessType': ["READ"]}]}
+    expected = {'id': "syn12345", 'etag': "foo",
+                'resourceAccess': [{'principalId': 1111111,
+                                    'accessType': ["READ", "DOWNLOAD"]},
+                                   {'principalId': 3333333,
+                                    'accessType': ["READ"]},
+                                   {'principalId': 2222222,
+                                    'accessType': ["READ", "DOWNLOAD",
+                                                   "UPDATE"]}]}
+    with patch.object(syn, "restGET", return_value=current) as patch_get,\
+         patch.object(syn, "restPUT", return_value=expected) as patch_put:
+        acl = create._set_acl(syn=syn, entity=entity,
+                              acl_config=acl_config)
+        patch_get.assert_called_once_with("/entity/syn12345/acl")
+        patch_put.assert_called_once_with("/entity/syn12345/acl",
+                                          json.dumps(expected))
+        assert acl == expected
+        syn.setPermissions.assert_not_called()
+
+
+def test__set_acl__unchanged():
+    """Tests an unchanged ACL isn't written"""
+    syn = Mock()
+    entity = synapseclient.Project(id="syn12345")
+    acl_config = [{"principal_id": 1111111,
+                   "access_type": ["DOWNLOAD", "READ"]}]
+    current = {'id': "syn12345", 'etag': "foo",
+               'resourceAccess': [{'principalId': 1111111,
+                                   'accessType': ["READ", "DOWNLOAD"]}]}
+    with patch.object(syn, "restGET", return_value=current) as patch_get:
+        acl = create._set_acl(syn=syn, entity=entity,
+                              acl_config=acl_config)
+        patch_get.assert_called_once_with("/entity/syn12345/acl")
+        syn.restPUT.assert_not_called()
+        syn.restPOST.assert_not_called()
+        assert acl == current
+
+
+def test__set_acl__inherited():
+    """Tests an ACL is created from the benefactor's ACL"""
+    syn = Mock()
+    entity = synapseclient.Folder(id="syn22222", parentId="syn12345")
+    acl_config = [{"principal_id": 1111111, "access_type": ["READ"]}]
+    mocked_404 = SynapseHTTPError("Not Found",
+                                  response=Mock(status_code=404))
+    benefactor_acl = {'id': "syn12345", 'etag': "foo",
+                      'resourceAccess': [{'principalId': 3333333,
+                                          'accessType': ["READ"]}]}
+    expected = {'id': "syn22222",
+                'resourceAccess': [{'principalId': 3333333,
+                                    'accessType': ["READ"]},
+                                   {'principalId': 1111111,
+                                    'accessType': ["READ"]}]}
+    with patch.object(syn, "restGET",
+                      side_effect=[mocked_404, {'id': "syn12345"},
+                                   benefactor_acl]) as patch_get,\
+         patch.object(syn, "restPOST", return_value=expected) as patch_post:
+        create._set_acl(syn=syn, entity=entity, acl_config=acl_config)
+        patch_get.assert_has_calls([
+            mock.call("/entity/syn22222/acl"),
+            mock.call("/entity/syn22222/benefactor"),
+            mock.call("/entity/syn12345/acl")
+        ])
+        patch_post.assert_called_once_with("/entity/syn22222/acl",
+                                           json.dumps(expected))
+
+
+def test__set_acl__empty():
+    """Tests nothing is fetched without ACL entries"""
+    syn = Mock()
+    assert create._set_acl(syn=syn, entity=Mock(), acl_config=[]) is None
+    syn.restGET.assert_not_called()
+
+
+def _run_async(coroutine):
+    """Runs a coroutine in a new event loop"""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_async_get_or_create_folder__call():
+    """Tests async creation calls the synchronous method"""
+    async_cls = create.AsyncSynapseCreation(SYN, concurrency=2)
+    returned = synapseclient.Folder(name="foo", id="syn11111",
+                                    parentId="syn12345")
+    with patch.object(async_cls.creation_cls, "get_or_create_folder",
+                      return_value=returned) as patch_create:
+        new_folder = _run_async(
+            async_cls.get_or_create_folder(name="foo", parentId="syn12345")
+        )
+        assert new_folder == returned
+        patch_create.assert_called_once_with(name="foo", parentId="syn12345")
+    async_cls.close()
+
+
+def test_async_run__concurrency():
+    """Tests the number of calls in flight is bounded"""
+    async_cls = create.AsyncSynapseCreation(SYN, concurrency=3)
+    lock = threading.Lock()
+    in_flight = []
+    max_in_flight = []
+
+    def _call(index):
+        with lock:
+            in_flight.append(index)
+            max_in_flight.append(len(in_flight))
+        time.sleep(0.01)
+        with lock:
+            in_flight.remove(index)
+        return index
+
+    async def _main():
+        return await asyncio.gather(*(async_cls.run(_call, index)
+                                      for index in range(12)))
+
+    assert _run_async(_main()) == list(range(12))
+    assert max(max_in_flight) <= 3
+    async_cls.close()
+
+
+def test__get_children__cached():
+    """Tests a container is listed once for all of its children"""
+    get_cls = SynapseCreation(SYN, only_get=True)
+    children = [{'id': "syn11111", 'name': "foo",
+                 'type': "org.sagebionetworks.repo.model.Folder"},
+                {'id': "syn22222", 'name': "bar",
+                 'type': "org.sagebionetworks.repo.model.Folder"}]
+    with patch.object(SYN, "getChildren",
+                      return_value=iter(children)) as patch_children:
+        foo = get_cls._find_entity_by_name(
+            entity_name="foo", parentid="syn12345",
+            concrete_type="org.sagebionetworks.repo.model.Folder"
+        )
+        bar = get_cls._find_entity_by_name(
+            entity_name="bar", parentid="syn12345",
+            concrete_type="org.sagebionetworks.repo.model.Folder"
+        )
+        patch_children.assert_called_once_with("syn12345")
+    assert (foo.id, bar.id) == ("syn11111", "syn22222")
+    assert get_cls.cache_stats == {'hits': 1, 'misses': 1}
+
+
+def test__find_by_obj_or_create__cache_created():
+    """Tests created entities are added to the cache and new containers
+    are cached as empty"""
+    get_cls = SynapseCreation(SYN, only_get=True, existing_first=True)
+    parent = synapseclient.Folder(name="foo", parentId="syn12345")
+    stored_parent = synapseclient.Folder(name="foo", parentId="syn12345",
+                                         id="syn11111")
+    child = synapseclient.Folder(name="bar", parentId="syn11111")
+    stored_child = synapseclient.Folder(name="bar", parentId="syn11111",
+                                        id="syn22222")
+    with patch.object(SYN, "getChildren",
+                      return_value=iter([])) as patch_children,\
+         patch.object(SYN, "store",
+                      side_effect=[stored_parent, stored_child]):
+        get_cls._find_by_obj_or_create(parent)
+        get_cls._find_by_obj_or_create(child)
+        # Only the existing parent is listed
+        patch_children.assert_called_once_with("syn12345")
+    assert get_cls._get_children("syn12345")['foo']['id'] == "syn11111"
+    assert get_cls._get_children("syn11111")['bar']['id'] == "syn22222"
+
+
+def test__find_by_obj_or_create__conflict_refresh():
+    """Tests a name conflict refreshes the cached listing of the parent"""
+    get_cls = SynapseCreation(SYN, only_get=True)
+    get_cls._children_cache["syn12345"] = {}
+    entity = synapseclient.Folder(name="foo", parentId="syn12345")
+    children = [{'id': "syn11111", 'name': "foo",
+                 'type': "org.sagebionetworks.repo.model.Folder"}]
+    mocked_409 = SynapseHTTPError("foo", response=Mock(status_code=409))
+    with patch.object(SYN, "store", side_effect=mocked_409),\
+         patch.object(SYN, "getChildren",
+                      return_value=iter(children)) as patch_children:
+        get_ent = get_cls._find_by_obj_or_create(entity)
+        patch_children.assert_called_once_with("syn12345")
+    assert get_ent.id == "syn11111"
+
+
+def test_get_team_invitees():
+    """Tests members and open invitations are fetched once"""
+    members = [{'member': {'ownerId': 1111}}]
+    invitations = [{'inviteeId': "2222"}, {'inviteeEmail': "foo@bar.org"}]
+    with patch.object(SYN, "getTeamMembers",
+                      return_value=iter(members)) as patch_members,\
+         patch.object(SYN, "get_team_open_invitations",
+                      return_value=iter(invitations)) as patch_invitations:
+        invitees = CREATE_CLS.get_team_invitees("123")
+        patch_members.assert_called_once_with("123")
+        patch_invitations.assert_called_once_with("123")
+    assert invitees == {'members': {"1111"}, 'invited_ids': {"2222"},
+                        'invited_emails': {"foo@bar.org"}}
+
+
+@pytest.mark.parametrize("principalid,email", [(1111, None),
+                                               ("2222", None),
+                                               (None, "foo@bar.org")])
+def test_invite_to_team__skip(principalid, email):
+    """Tests members and invitees aren't invited again"""
+    invitees = {'members': {"1111"}, 'invited_ids': {"2222"},
+                'invited_emails': {"foo@bar.org"}}
+    with patch.object(SYN, "send_membership_invitation") as patch_send:
+        invitation = CREATE_CLS.invite_to_team(
+            team="123", invitees=invitees, principalId=principalid,
+            inviteeEmail=email, message="foo"
+        )
+        patch_send.assert_not_called()
+    assert invitation is None
+
+
+def test_invite_to_team__send():
+    """Tests new invitees are invited with a single call"""
+    invitees = {'members': set(), 'invited_ids': set(),
+                'invited_emails': set()}
+    team = synapseclient.Team(id="123")
+    with patch.object(SYN, "send_membership_invitation",
+                      return_value={'id': "9"}) as patch_send:
+        invitation = CREATE_CLS.invite_to_team(
+            team=team, invitees=invitees, principalId=1111, message="foo"
+        )
+        patch_send.assert_called_once_with("123", inviteeId="1111",
+                                           inviteeEmail=None,
+                                           message="foo")
+    assert invitation == {'id': "9"}
+
+
+def test__call__rate_limited():
+    """Test throttled Synapse calls are retried through the limiter"""
+    syn = mock.create_autospec(synapseclient.Synapse)
+    limiter = RateLimiter(sleep=lambda seconds: None)
+    create_cls = SynapseCreation(syn, rate_limiter=limiter)
+    throttled = SynapseHTTPError(
+        "throttled", response=Mock(status_code=429, headers={})
+    )
+    entity = synapseclient.Folder(name="foo", parentId="syn1")
+    returned = synapseclient.Folder(name="foo", parentId="syn1", id="syn2")
+    with patch.object(syn, "store",
+                      side_effect=[throttled, returned]) as patch_store:
+        assert create_cls._find_by_obj_or_create(entity) == returned
+        assert patch_store.call_count == 2
+    assert limiter.throttles == 1
+
+
+def test__call__paginated():
+    """Test paginated calls are read within the call"""
+    syn = mock.create_autospec(synapseclient.Synapse)
+    create_cls = SynapseCreation(syn)
+    with patch.object(syn, "getChildren",
+                      return_value=iter([{'name': 'foo'}])):
+        assert create_cls._call("getChildren", "syn1") == [{'name': 'foo'}]
+
+
+def test__call__recorded():
+    """Test calls are recorded with their status and retries"""
+    syn = mock.create_autospec(synapseclient.Synapse)
+    limiter = RateLimiter(sleep=lambda seconds: None)
+    create_cls = SynapseCreation(syn, rate_limiter=limiter)
+    throttled = SynapseHTTPError(
+        "throttled", response=Mock(status_code=429, headers={})
+    )
+    conflict = SynapseHTTPError("conflict", response=Mock(status_code=409))
+    with patch.object(syn, "findEntityId", side_effect=[throttled, "syn1"]),\
+         patch.object(syn, "restPOST", side_effect=conflict),\
+         create_cls.recorder.resource("project"):
+        create_cls._call("findEntityId", "foo")
+        with pytest.raises(SynapseHTTPError):
+            create_cls._call("restPOST", "/challenge", "{}")
+    report = create_cls.recorder.report()
+    assert report['methods']['findEntityId']['retries'] == 1
+    assert report['methods']['restPOST']['statuses'] == {'409': 1}
+    assert report['resources']['project']['count'] == 2
+
+
+def test__call__recorded_client_retries():
+    """Test requests synapseclient retries itself are recorded as
+    retries without a rate limiter"""
+    syn = Mock()
+    syn._requests_session = requests.Session()
+    create_cls = SynapseCreation(syn)
+
+    def _find(name):
+        for status_code in (503, 429, 200):
+            requests.hooks.dispatch_hook(
+                'response', syn._requests_session.hooks,
+                Mock(status_code=status_code)
+            )
+        return "syn1"
+
+    syn.findEntityId.side_effect = _find
+    assert create_cls._call("findEntityId", "foo") == "syn1"
+    # Connections are only counted once
+    SynapseCreation(syn, recorder=create_cls.recorder)._call(
+        "findEntityId", "foo"
+    )
+    report = create_cls.recorder.report()
+    assert report['methods']['findEntityId']['retries'] == 4
+
+
+def test__lookup__coalesced():
+    """Test concurrent lookups of a team are made with one call"""
+    syn = mock.create_autospec(synapseclient.Synapse)
+    create_cls = SynapseCreation(syn)
+    team = synapseclient.Team(name="foo", id="1")
+    started = threading.Event()
+    release = threading.Event()
+
+    def get_team(name):
+        started.set()
+        release.wait(5)
+        return team
+
+    results = []
+    with patch.object(syn, "getTeam", side_effect=get_team) as patch_get:
+        first = threading.Thread(target=lambda: results.append(
+            create_cls._get_obj(synapseclient.Team(name="foo"))
+        ))
+        first.start()
+        started.wait(5)
+        second = threading.Thread(target=lambda: results.append(
+            create_cls._get_obj(synapseclient.Team(name="foo"))
+        ))
+        second.start()
+        # The second lookup waits for the first
+        while create_cls.lookup_coalesced == 0:
+            time.sleep(0.001)
+        release.set()
+        first.join()
+        second.join()
+        assert create_cls._get_obj(synapseclient.Team(name="foo")) == team
+        patch_get.assert_called_once_with("foo")
+    assert results == [team, team]
+    assert create_cls.lookup_stats == {'hits': 1, 'negative_hits': 0,
+                                       'coalesced': 1, 'misses': 1}
+
+
+def test__lookup__negative_ttl():
+    """Test lookups that found nothing are cached until they expire"""
+    syn = mock.create_autospec(synapseclient.Synapse)
+    create_cls = SynapseCreation(syn, negative_ttl=5.0)
+    now = [100.0]
+    create_cls._clock = lambda: now[0]
+    missing = SynapseHTTPError("missing", response=Mock(status_code=404))
+    queue = synapseclient.Evaluation(name="foo", contentSource="syn1")
+    with patch.object(syn, "getEvaluationByName",
+                      side_effect=missing) as patch_get:
+        assert create_cls._get_obj(queue) is None
+        assert create_cls._get_obj(queue) is None
+        assert patch_get.call_count == 1
+        now[0] += 6
+        assert create_cls._get_obj(queue) is None
+        assert patch_get.call_count == 2
+    assert create_cls.lookup_negative_hits == 1
+
+
+def test__lookup__error():
+    """Test failed lookups aren't cached"""
+    syn = mock.create_autospec(synapseclient.Synapse)
+    create_cls = SynapseCreation(syn)
+    error = SynapseHTTPError("error", response=Mock(status_code=500))
+    with patch.object(syn, "findEntityId",
+                      side_effect=[error, "syn1"]) as patch_find:
+        with pytest.raises(SynapseHTTPError):
+            create_cls._find_child("foo", None)
+        assert create_cls._find_child("foo", None)['id'] == "syn1"
+        assert patch_find.call_count == 2
+
+
+def test__find_by_obj_or_create__forgets_lookup():
+    """Test a created project isn't reported missing by a cached
+    lookup"""
+    syn = mock.create_autospec(synapseclient.Synapse)
+    create_cls = SynapseCreation(syn, existing_first=True)
+    project = synapseclient.Project(name="foo", id="syn1")
+    with patch.object(syn, "findEntityId",
+                      side_effect=[None, "syn1"]) as patch_find,\
+         patch.object(syn, "store", return_value=project):
+        create_cls._find_by_obj_or_create(synapseclient.Project(name="foo"))
+        assert create_cls._find_child("foo", None)['id'] == "syn1"
+        assert patch_find.call_count == 2
+
+
+def test_get_or_create_queue__existing():
+    """Test queues in the listing of the project are used without being
+    looked up or stored"""
+    syn = mock.create_autospec(synapseclient.Synapse)
+    get_cls = SynapseCreation(syn, only_get=True)
+    queue = synapseclient.Evaluation(name="foo", id="1",
+                                     contentSource="syn1")
+    with patch.object(syn, "getEvaluationByContentSource",
+                      return_value=iter([queue])),\
+         patch.object(syn, "getEvaluationByName") as patch_get,\
+         patch.object(syn, "store") as patch_store:
+        queues = get_cls.get_project_queues("syn1")
+        assert queues == {'foo': queue}
+        assert get_cls.get_or_create_queue(existing=queues, name="foo",
+                                           contentSource="syn1") == queue
+        # The listing also answers lookups by name
+        assert get_cls._get_obj(synapseclient.Evaluation(
+            name="foo", contentSource="syn1"
+        )) == queue
+        patch_get.assert_not_called()
+        patch_store.assert_not_called()
+
+
+def test_get_or_create_queue__existing_raise():
+    """Test an existing queue fails without only_get"""
+    queue = synapseclient.Evaluation(name="foo", id="1",
+                                     contentSource="syn1")
+    with pytest.raises(ValueError, match="foo already exists"):
+        CREATE_CLS.get_or_create_queue(existing={'foo': queue}, name="foo",
+                                       contentSource="syn1")
@@ -0,0 +1,129 @@
+"""Test comparing templates with Synapse"""
+from unittest import mock
+from unittest.mock import Mock
+
+import synapseclient
+from synapseclient.core.exceptions import SynapseHTTPError
+
+from synapseformation import diff
+from synapseformation.create import SynapseCreation
+
+FOLDER_TYPE = "org.sagebionetworks.repo.model.Folder"
+CONFIG = [
+    {'name': 'Test Project', 'type': 'Project',
+     'acl': [{'principal_id': 1111111, 'access_type': ['READ']}],
+     'children': [{'name': 'Genes', 'type': 'Folder',
+                   'children': [{'name': 'testing', 'type': 'Folder'}]},
+                  {'name': 'Data', 'type': 'Folder'}]},
+    {'name': 'Test Team', 'type': 'Team', 'can_public_join': False,
+     'description': 'Test team description'}
+]
+CHILDREN = {
+    'syn1': [{'id': 'syn2', 'name': 'Genes', 'type': FOLDER_TYPE,
+              'benefactorId': 'syn1'},
+             {'id': 'syn3', 'name': 'Data', 'type': FOLDER_TYPE,
+              'benefactorId': 'syn1'}],
+    'syn2': [{'id': 'syn4', 'name': 'testing', 'type': FOLDER_TYPE,
+              'benefactorId': 'syn1'}]
+}
+ACL = {'id': 'syn1',
+       'resourceAccess': [{'principalId': 1111111, 'accessType': ['READ']},
+                          {'principalId': 2222, 'accessType': ['READ']}]}
+TEAM = synapseclient.Team(id="11111", name="Test Team",
+                          description="Test team description",
+                          canPublicJoin=False)
+
+
+def _syn(children=CHILDREN, acl=ACL, team=TEAM):
+    """Mocked Synapse with a project syn1"""
+    syn = mock.create_autospec(synapseclient.Synapse)
+    syn.findEntityId.return_value = "syn1"
+    syn.getChildren.side_effect = lambda parentid: iter(
+        children.get(parentid, [])
+    )
+    syn.restGET.return_value = acl
+    syn.getTeam.return_value = team
+    return syn
+
+
+def test_diff_template_unchanged():
+    """Test a template matching Synapse has no differences"""
+    syn = _syn()
+    assert diff.diff_template(SynapseCreation(syn), CONFIG) == []
+    # Containers without children in the template aren't listed
+    assert sorted(call[0][0] for call in syn.getChildren.call_args_list) \
+        == ["syn1", "syn2"]
+    syn.restGET.assert_called_once_with("/entity/syn1/acl")
+
+
+def test_diff_template_changes():
+    """Test missing, extra and drifted resources are reported"""
+    children = {
+        'syn1': [{'id': 'syn3', 'name': 'Data', 'type': FOLDER_TYPE,
+                  'benefactorId': 'syn3'},
+                 {'id': 'syn5', 'name': 'Stray', 'type': FOLDER_TYPE,
+                  'benefactorId': 'syn1'}]
+    }
+    acl = {'id': 'syn1',
+           'resourceAccess': [{'principalId': 1111111,
+                               'accessType': ['READ', 'UPDATE']}]}
+    team = synapseclient.Team(id="11111", name="Test Team",
+                              description="Other", canPublicJoin=False)
+    differences = diff.diff_template(
+        SynapseCreation(_syn(children=children, acl=acl, team=team)), CONFIG
+    )
+    assert [diff.format_difference(difference)
+            for difference in differences] == [
+        "drifted  acl     Test Project#acl: principal 1111111 has "
+        "['READ', 'UPDATE'], not ['READ']",
+        "extra    acl     Test Project/Data",
+        "missing  entity  Test Project/Genes",
+        "extra    entity  Test Project/Stray: " + FOLDER_TYPE,
+        "drifted  team    team:Test Team: description differs"
+    ]
+
+
+def test_diff_template_missing():
+    """Test missing projects, inherited ACLs and missing teams"""
+    syn = _syn()
+    syn.findEntityId.return_value = None
+    syn.getTeam.side_effect = ValueError("Can't find team")
+    differences = diff.diff_template(SynapseCreation(syn), CONFIG)
+    assert [(difference['change'], difference['path'])
+            for difference in differences] == [
+        ("missing", "Test Project"), ("missing", "team:Test Team")
+    ]
+    syn.getChildren.assert_not_called()
+
+
+def test_diff_template_inherited_acl():
+    """Test an ACL a project doesn't have is missing"""
+    syn = _syn()
+    syn.restGET.side_effect = SynapseHTTPError(
+        "Not Found", response=Mock(status_code=404)
+    )
+    differences = diff.diff_template(SynapseCreation(syn), CONFIG)
+    assert differences == [{'change': "missing", 'resource': "acl",
+                            'path': "Test Project#acl",
+                            'detail': "inherits its ACL"}]
+
+
+def test_diff_template_queues():
+    """Test evaluation queues are compared with one listing"""
+    syn = _syn()
+    syn.getEvaluationByContentSource.return_value = iter([
+        synapseclient.Evaluation(name="Round 1", id="1",
+                                 contentSource="syn1",
+                                 description="First round")
+    ])
+    config = [{'name': 'Test Project', 'type': 'Project',
+               'evaluations': [{'name': 'Round 1', 'description': 'Round'},
+                               {'name': 'Round 2'}]}]
+    differences = diff.diff_template(SynapseCreation(syn), config)
+    assert [diff.format_difference(difference)
+            for difference in differences] == [
+        "drifted  queue   Test Project#evaluation:Round 1: "
+        "description differs",
+        "missing  queue   Test Project#evaluation:Round 2"
+    ]
+    syn.getEvaluationByContentSource.assert_called_once_with("syn1")
@@ -0,0 +1,94 @@
+"""Test template expansion"""
+import pytest
+
+from synapseformation import expand
+
+
+def test_expand_config_shorthand():
+    """Test folders can be listed by name or without a type"""
+    test_config = {
+        'TestAnchor': "foo",
+        'Resources': [{
+            'name': 'Test Configuration',
+            'type': 'Project',
+            'children': [
+                {
+                    'name': 'Genes',
+                    'children': [
+                        'testing',
+                        'foobar',
+                        {'name': "test", 'type': "Folder"}
+                    ]
+                }
+            ]
+        }]
+    }
+    expected_config = [{
+        'name': 'Test Configuration',
+        'type': 'Project',
+        'children': [
+            {
+                'name': 'Genes',
+                'type': 'Folder',
+                'children': [
+                    {'name': "testing", 'type': "Folder"},
+                    {'name': "foobar", 'type': "Folder"},
+                    {'name': "test", 'type': "Folder"}
+                ]
+            }
+        ]
+    }]
+    assert list(expand.expand_config(test_config)) == expected_config
+
+
+def test_expand_config_full():
+    """Test the full template format is unchanged"""
+    test_config = [{'name': 'Test Team', 'type': 'Team',
+                    'can_public_join': False, 'description': 'foo'},
+                   {'name': 'Test Project', 'type': 'Project',
+                    'acl': [{'principal_id': 1, 'access_type': ['READ']}]}]
+    assert list(expand.expand_config(test_config)) == test_config
+
+
+def test_expand_config_for_each():
+    """Test resources are repeated for every parameter combination"""
+    test_config = [{
+        'name': 'Genes',
+        'children': [{
+            'name': '${gene}',
+            'for_each': {'gene': ['MSN', 'CD44']},
+            'children': [{'name': '${gene}_${core}',
+                          'for_each': {'core': ['Assay', 'MedChem']}}]
+        }]
+    }]
+    genes = next(expand.expand_config(test_config))['children']
+    assert [gene['name'] for gene in genes] == ['MSN', 'CD44']
+    assert [core['name'] for core in genes[1]['children']] == \
+        ['CD44_Assay', 'CD44_MedChem']
+
+
+def test_expand_config_aliases_copied():
+    """Test subtrees shared through yaml aliases are copied"""
+    shared = [{'name': 'Assay_Core', 'type': 'Folder'}]
+    test_config = [{'name': 'MSN', 'children': shared},
+                   {'name': 'CD44', 'children': shared}]
+    msn, cd44 = expand.expand_config(test_config)
+    msn['children'][0]['id'] = "syn1"
+    assert 'id' not in cd44['children'][0]
+    assert 'id' not in shared[0]
+
+
+def test_expand_config_lazy():
+    """Test top level resources are expanded as they are consumed"""
+    def _resources():
+        yield 'foo'
+        raise AssertionError("Read too far")
+
+    assert next(expand.expand_config(_resources())) == \
+        {'name': 'foo', 'type': 'Folder'}
+
+
+def test_expand_config_missing_resources():
+    """Test mappings must list resources under the Resources key"""
+    with pytest.raises(ValueError, match="have a 'Resources' key"):
+        list(expand.expand_config({'foo': []}))
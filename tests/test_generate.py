@@ -0,0 +1,76 @@
+"""Test template generation"""
+import io
+import json
+
+import pytest
+import yaml
+
+from synapseformation import generate, planner
+
+
+def _count(resources):
+    return sum(1 + _count(resource.get('children', []))
+               for resource in resources)
+
+
+@pytest.mark.parametrize("template_format,load", [("yaml", yaml.safe_load),
+                                                  ("json", json.loads)])
+def test_write_template(template_format, load):
+    """Test generated templates can be read back and planned"""
+    out = io.StringIO()
+    resources = generate.generate_template(projects=2, breadth=3, depth=2,
+                                           teams=1, invitations=2)
+    generate.write_template(out, resources, template_format=template_format)
+    config = load(out.getvalue())
+    assert [resource['name'] for resource in config] == [
+        'Team 1', 'Project 1', 'Project 2'
+    ]
+    assert config[2]['children'][2]['children'][0] == {
+        'name': 'folder_3_1', 'type': 'Folder'
+    }
+    assert len(config[0]['invitations'][0]['members']) == 2
+    # Two projects with 3 + 9 folders each and a team
+    assert _count(config) == 2 * 13 + 1
+    plan = planner.compile_plan(config)
+    assert plan.counts()['invite'] == 2
+
+
+def test_generate_template_acl_density():
+    """Test every resource has an ACL at full density"""
+    def _acls(resources):
+        return [('acl' in resource) for resource in resources] + [
+            acl for resource in resources
+            for acl in _acls(resource.get('children', []))
+        ]
+
+    out = io.StringIO()
+    generate.write_template(out, generate.generate_template(
+        breadth=2, depth=2, acl_density=1
+    ))
+    assert all(_acls(yaml.safe_load(out.getvalue())))
+    out = io.StringIO()
+    generate.write_template(out, generate.generate_template(
+        breadth=2, depth=2, acl_density=0
+    ))
+    assert not any(_acls(yaml.safe_load(out.getvalue())))
+
+
+def test_generate_template_lazy():
+    """Test children are generated as they are written"""
+    project = next(generate.generate_template(breadth=10 ** 6, depth=10))
+    assert next(project['children'])['name'] == "folder_1"
+
+
+def test_write_template_empty():
+    """Test templates without resources are empty lists"""
+    for template_format in ("yaml", "json"):
+        out = io.StringIO()
+        generate.write_template(out, iter([]),
+                                template_format=template_format)
+        assert yaml.safe_load(out.getvalue()) == []
+
+
+def test_write_template_unknown_format():
+    """Test only yaml and json can be written"""
+    with pytest.raises(ValueError, match="Unknown template format 'xml'"):
+        generate.write_template(io.StringIO(), [], template_format="xml")
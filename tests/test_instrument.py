@@ -0,0 +1,81 @@
+"""Test timing of Synapse calls"""
+import json
+import os
+import pickle
+import tempfile
+
+from synapseformation import instrument
+from synapseformation.instrument import CallRecorder
+
+
+def test_percentile():
+    """Test nearest-rank percentiles"""
+    values = list(range(1, 101))
+    assert instrument.percentile(values, 50) == 50
+    assert instrument.percentile(values, 99) == 99
+    assert instrument.percentile([3], 95) == 3
+    assert instrument.percentile([], 50) is None
+
+
+def test_call_recorder_report():
+    """Test calls are aggregated by method and resource type"""
+    recorder = CallRecorder()
+    with recorder.resource("folder"):
+        recorder.record("store", 0.1)
+        recorder.record("store", 0.3, status=409)
+        recorder.record("getChildren", 0.2, retries=2)
+    with recorder.resource("project"):
+        recorder.record("store", 0.2)
+    recorder.record("restGET", 0.05)
+    report = recorder.report()
+    assert report['calls'] == 5
+    assert list(report['methods']) == ['getChildren', 'restGET', 'store']
+    store = report['methods']['store']
+    assert store['count'] == 3
+    assert store['errors'] == 1
+    assert store['statuses'] == {'ok': 2, '409': 1}
+    assert (store['p50'], store['p99']) == (0.2, 0.3)
+    folder = report['resources']['folder']
+    assert folder['count'] == 3
+    assert folder['retries'] == 2
+    assert report['resources']['other']['count'] == 1
+
+
+def test_call_recorder_table():
+    """Test the table has a row per method and resource type"""
+    recorder = CallRecorder()
+    with recorder.resource("team"):
+        recorder.record("getTeam", 0.0123)
+    lines = recorder.table().splitlines()
+    assert lines[0].startswith("Method")
+    assert lines[1].split() == ['getTeam', '1', '0', '0',
+                                '12.3', '12.3', '12.3']
+    assert lines[3].startswith("Resource")
+    assert lines[4].split()[0] == "team"
+
+
+def test_call_recorder_write():
+    """Test the report is written as JSON with extra entries"""
+    recorder = CallRecorder()
+    recorder.record("store", 0.1)
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, "report.json")
+        recorder.write(path, wall_time=1.5)
+        with open(path) as report_f:
+            report = json.load(report_f)
+    assert report['calls'] == 1
+    assert report['wall_time'] == 1.5
+
+
+def test_call_recorder_merge():
+    """Test recorders sent back from processes are merged"""
+    recorder = CallRecorder()
+    with recorder.resource("folder"):
+        recorder.record("store", 0.1)
+    other = pickle.loads(pickle.dumps(recorder))
+    with other.resource("folder"):
+        other.record("store", 0.3, status=409)
+    recorder.merge(other)
+    report = recorder.report()
+    assert report['calls'] == 3
+    assert report['resources']['folder']['errors'] == 1
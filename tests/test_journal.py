@@ -0,0 +1,84 @@
+"""Test journal of completed operations"""
+import copy
+import json
+import os
+import tempfile
+from unittest import mock
+from unittest.mock import patch
+
+import pytest
+import synapseclient
+
+from synapseformation import planner
+from synapseformation.create import SynapseCreation
+from synapseformation.journal import Journal
+
+CONFIG = [{
+    'name': 'Test Project',
+    'type': 'Project',
+    'children': [{'name': 'Genes', 'type': 'Folder'},
+                 {'name': 'Assays', 'type': 'Folder'}]
+}]
+PROJECT = synapseclient.Project(name="Test Project", id="syn1", etag="a")
+GENES = synapseclient.Folder(name="Genes", id="syn2", parentId="syn1")
+ASSAYS = synapseclient.Folder(name="Assays", id="syn3", parentId="syn1")
+
+
+def _apply(creation_cls, journal, folders):
+    """Applies the template against mocked creation methods"""
+    plan = planner.compile_plan(copy.deepcopy(CONFIG))
+    with patch.object(creation_cls, "get_or_create_project",
+                      return_value=PROJECT) as patch_project,\
+         patch.object(creation_cls, "get_or_create_folder",
+                      side_effect=folders) as patch_folder:
+        try:
+            planner.execute_plan(plan, creation_cls, journal=journal)
+        finally:
+            journal.close()
+    return patch_project, patch_folder
+
+
+def test_journal_resume():
+    """Test a resumed run only runs the operations left by a failure"""
+    syn = mock.create_autospec(synapseclient.Synapse)
+    creation_cls = SynapseCreation(syn)
+    with tempfile.TemporaryDirectory() as tempdir:
+        journal_path = os.path.join(tempdir, "journal.jsonl")
+        journal = Journal(journal_path, "template.yaml")
+        with pytest.raises(ValueError, match="Failed"):
+            _apply(creation_cls, journal, [GENES, ValueError("Failed")])
+
+        journal = Journal(journal_path, "template.yaml", resume=True)
+        patch_project, patch_folder = _apply(creation_cls, journal,
+                                             [ASSAYS])
+        patch_project.assert_not_called()
+        patch_folder.assert_called_once_with(name="Assays",
+                                             parentId="syn1")
+        assert journal.resumed == 2
+        syn.restGET.assert_not_called()
+
+
+def test_journal_truncated_line():
+    """Test a line cut off by a failed run is ignored"""
+    with tempfile.TemporaryDirectory() as tempdir:
+        journal_path = os.path.join(tempdir, "journal.jsonl")
+        with open(journal_path, "w") as journal_f:
+            journal_f.write(json.dumps(
+                {'template': os.path.abspath("template.yaml")}
+            ) + "\n")
+            journal_f.write(json.dumps({'key': "Test Project",
+                                        'kind': "project",
+                                        'id': "syn1"}) + "\n")
+            journal_f.write('{"key": "Test Pro')
+        journal = Journal(journal_path, "template.yaml", resume=True)
+        journal.close()
+        assert list(journal.completed) == ["Test Project"]
+
+
+def test_journal_other_template():
+    """Test a journal of another template can't be resumed"""
+    with tempfile.TemporaryDirectory() as tempdir:
+        journal_path = os.path.join(tempdir, "journal.jsonl")
+        Journal(journal_path, "template.yaml").close()
+        with pytest.raises(ValueError, match="is for template"):
+            Journal(journal_path, "other.yaml", resume=True)
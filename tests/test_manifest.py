@@ -0,0 +1,70 @@
+"""Test manifest of Synapse ids"""
+import copy
+import json
+import os
+import tempfile
+from unittest import mock
+from unittest.mock import patch
+
+import pytest
+import synapseclient
+import yaml
+
+from synapseformation import planner
+from synapseformation.create import SynapseCreation
+from synapseformation.manifest import Manifest
+
+CONFIG = [{
+    'name': 'Test Project',
+    'type': 'Project',
+    'children': [{'name': 'Genes', 'type': 'Folder'}]
+}]
+
+
+def _apply(manifest):
+    """Applies the template against mocked creation methods"""
+    creation_cls = SynapseCreation(mock.create_autospec(synapseclient.Synapse))
+    # Ids written during the run don't leak into other tests
+    plan = planner.compile_plan(copy.deepcopy(CONFIG))
+    with patch.object(creation_cls, "get_or_create_project",
+                      return_value=synapseclient.Project(
+                          name="Test Project", id="syn1", etag="a"
+                      )),\
+         patch.object(creation_cls, "get_or_create_folder",
+                      return_value=synapseclient.Folder(
+                          name="Genes", id="syn2", parentId="syn1"
+                      )):
+        planner.execute_plan(plan, creation_cls, manifest=manifest)
+    manifest.close()
+
+
+def test_manifest_jsonl():
+    """Test ids are written as JSON lines"""
+    with tempfile.TemporaryDirectory() as tempdir:
+        manifest_path = os.path.join(tempdir, "ids.jsonl")
+        _apply(Manifest(manifest_path))
+        with open(manifest_path) as manifest_f:
+            entries = [json.loads(line) for line in manifest_f]
+    assert entries == [
+        {'path': "Test Project", 'kind': "project", 'id': "syn1",
+         'etag': "a"},
+        {'path': "Test Project/Genes", 'kind': "folder", 'id': "syn2"}
+    ]
+
+
+def test_manifest_yaml():
+    """Test ids are written as a YAML list"""
+    with tempfile.TemporaryDirectory() as tempdir:
+        manifest_path = os.path.join(tempdir, "ids.yaml")
+        manifest = Manifest(manifest_path)
+        _apply(manifest)
+        with open(manifest_path) as manifest_f:
+            entries = yaml.safe_load(manifest_f)
+    assert manifest.written == 2
+    assert [entry['id'] for entry in entries] == ["syn1", "syn2"]
+
+
+def test_manifest_unknown_format():
+    """Test unknown manifest formats are rejected"""
+    with pytest.raises(ValueError, match="Unknown manifest format 'csv'"):
+        Manifest("ids.csv", manifest_format="csv")
@@ -0,0 +1,289 @@
+"""Test execution planner"""
+import asyncio
+from unittest import mock
+from unittest.mock import patch
+
+import pytest
+import synapseclient
+
+from synapseformation import planner
+from synapseformation.create import AsyncSynapseCreation, SynapseCreation
+
+CONFIG = [
+    {
+        'name': 'Test Project',
+        'type': 'Project',
+        'acl': [{'principal_id': 1111111, 'access_type': ['READ']}],
+        'challenge': {'participant_team': 'Test Team'},
+        'children': [
+            {
+                'name': 'Genes',
+                'type': 'Folder',
+                'children': [
+                    {'name': 'testing', 'type': 'Folder'}
+                ]
+            },
+            {'name': 'Data', 'type': 'Folder'}
+        ]
+    },
+    {
+        'name': 'Test Team',
+        'type': 'Team',
+        'can_public_join': False,
+        'description': 'Test team description',
+        'invitations': [
+            {
+                'message': 'Welcome',
+                'members': [{'principal_id': 3426116},
+                            {'email': 'test@sagebase.org'}]
+            }
+        ]
+    }
+]
+
+
+def test_compile_plan_operations():
+    """Test every resource of the template becomes an operation"""
+    plan = planner.compile_plan(CONFIG)
+    assert [operation.key for operation in plan] == [
+        'Test Project', 'Test Project#acl', 'Test Project/Genes',
+        'Test Project/Genes/testing', 'Test Project/Data',
+        'team:Test Team', 'team:Test Team#invitees',
+        'team:Test Team#invite:3426116',
+        'team:Test Team#invite:test@sagebase.org',
+        'Test Project#challenge'
+    ]
+    assert plan.counts() == {'project': 1, 'acl': 1, 'folder': 3,
+                             'team': 1, 'invitees': 1, 'invite': 2,
+                             'challenge': 1}
+
+
+def test_compile_plan_dependencies():
+    """Test parent and id dependencies are edges of the plan"""
+    plan = planner.compile_plan(CONFIG)
+    project = plan.get('Test Project')
+    team = plan.get('team:Test Team')
+    assert plan.get('Test Project/Genes').depends_on == [project]
+    assert plan.get('Test Project#challenge').depends_on == [project, team]
+    assert plan.get('Test Project/Genes/testing').parent == \
+        plan.get('Test Project/Genes')
+
+
+def test_execution_plan_waves():
+    """Test independent operations are grouped into waves"""
+    plan = planner.compile_plan(CONFIG)
+    waves = [[operation.key for operation in wave]
+             for wave in plan.waves()]
+    assert waves == [
+        ['Test Project', 'team:Test Team'],
+        ['Test Project#acl', 'Test Project/Genes', 'Test Project/Data',
+         'team:Test Team#invitees', 'Test Project#challenge'],
+        ['Test Project/Genes/testing', 'team:Test Team#invite:3426116',
+         'team:Test Team#invite:test@sagebase.org']
+    ]
+    assert plan.depth == 3
+    assert plan.summary() == (
+        "Plan: 10 operations (project: 1, acl: 1, folder: 3, team: 1, "
+        "invitees: 1, invite: 2, challenge: 1), critical path depth 3"
+    )
+
+
+def test_compile_plan_parentid():
+    """Test top level folders are stored in the specified parent"""
+    plan = planner.compile_plan([{'name': 'foo', 'type': 'Folder'}],
+                                parentid="syn5555")
+    assert plan.get('foo').parentid == "syn5555"
+
+
+def test_compile_plan_missing_team():
+    """Test challenge participant teams must be in the template"""
+    config = [{'name': 'Test Project', 'type': 'Project',
+               'challenge': {'participant_team': 'Unknown'}}]
+    with pytest.raises(ValueError,
+                       match="Participant team 'Unknown' of project "
+                             "'Test Project' is not in the template"):
+        planner.compile_plan(config)
+
+
+def test_compile_plan_duplicate():
+    """Test duplicate sibling names are rejected"""
+    config = [{'name': 'foo', 'type': 'Folder'},
+              {'name': 'foo', 'type': 'Folder'}]
+    with pytest.raises(ValueError, match="Duplicate resource 'foo'"):
+        planner.compile_plan(config)
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_execute_plan(workers):
+    """Test ids of dependencies are passed to dependent operations"""
+    syn = mock.create_autospec(synapseclient.Synapse)
+    creation_cls = SynapseCreation(syn)
+    config = [{'name': 'Test Project', 'type': 'Project',
+               'challenge': {'participant_team': 'Test Team'},
+               'children': [{'name': 'Genes', 'type': 'Folder'}]},
+              {'name': 'Test Team', 'type': 'Team',
+               'can_public_join': True, 'description': 'foo'}]
+    plan = planner.compile_plan(config)
+    project_ent = synapseclient.Project(id="syn12222")
+    folder_ent = synapseclient.Folder(id="syn33333", parentId="syn12222")
+    team_ent = synapseclient.Team(id="11111")
+    with patch.object(creation_cls, "get_or_create_project",
+                      return_value=project_ent),\
+         patch.object(creation_cls, "get_or_create_folder",
+                      return_value=folder_ent) as patch_folder,\
+         patch.object(creation_cls, "get_or_create_team",
+                      return_value=team_ent),\
+         patch.object(creation_cls, "get_or_create_challenge",
+                      return_value={'id': '9'}) as patch_challenge:
+        planner.execute_plan(plan, creation_cls, workers=workers)
+        patch_folder.assert_called_once_with(name="Genes",
+                                             parentId="syn12222")
+        patch_challenge.assert_called_once_with(projectId="syn12222",
+                                                participantTeamId="11111")
+    assert config[0]['id'] == "syn12222"
+    assert config[0]['children'][0]['id'] == "syn33333"
+    assert config[0]['challenge']['id'] == "9"
+    assert config[1]['id'] == "11111"
+
+
+def test_execute_plan_async():
+    """Test operations run once their dependencies complete"""
+    syn = mock.create_autospec(synapseclient.Synapse)
+    creation_cls = AsyncSynapseCreation(syn, concurrency=4)
+    config = [{'name': 'Test Project', 'type': 'Project',
+               'children': [{'name': 'Genes', 'type': 'Folder',
+                             'children': [{'name': 'testing',
+                                           'type': 'Folder'}]}]}]
+    plan = planner.compile_plan(config)
+
+    def _folder(name, parentId):
+        return synapseclient.Folder(name=name, parentId=parentId,
+                                    id=f"{parentId}/{name}")
+
+    loop = asyncio.new_event_loop()
+    with patch.object(creation_cls.creation_cls, "get_or_create_project",
+                      return_value=synapseclient.Project(id="syn1")),\
+         patch.object(creation_cls.creation_cls, "get_or_create_folder",
+                      side_effect=_folder):
+        loop.run_until_complete(planner.execute_plan_async(plan,
+                                                           creation_cls))
+    loop.close()
+    creation_cls.close()
+    assert config[0]['children'][0]['children'][0]['id'] == \
+        "syn1/Genes/testing"
+
+
+def test_estimate_plan():
+    """Test calls of a fresh apply are estimated by type"""
+    plan = planner.compile_plan(CONFIG)
+    estimate = planner.estimate_plan(plan, latency=0.5, workers=2)
+    assert estimate['calls'] == {'store': 6, 'acl_read': 1, 'acl_write': 1,
+                                 'lookup': 2, 'invitation': 2}
+    assert estimate['total'] == 12
+    # Waves of 2, 7 and 3 calls on 2 workers
+    assert estimate['wall_time'] == (1 + 4 + 2) * 0.5
+
+
+def test_estimate_plan_existing():
+    """Test folders of a container share one listing when re-applied"""
+    plan = planner.compile_plan(CONFIG)
+    estimate = planner.estimate_plan(plan, latency=1, existing=True)
+    # Genes and Data share a listing of the project
+    assert estimate['calls'] == {'lookup': 7, 'acl_read': 1, 'store': 1}
+
+
+def test_estimate_plan_bulk_folders():
+    """Test the folders of a wave are estimated as one batch"""
+    plan = planner.compile_plan(CONFIG)
+    estimate = planner.estimate_plan(plan, latency=1, bulk_folders=True)
+    # Genes and Data, then testing
+    assert estimate['calls']['batch'] == 2
+    assert estimate['calls']['store'] == 3
+
+
+def test_compile_plan_shared_teams():
+    """Test challenges can refer to teams completed by an earlier plan"""
+    teams = {}
+    team_plan = planner.compile_plan([CONFIG[1]], teams=teams)
+    team_plan.get('team:Test Team').result = synapseclient.Team(id="11111")
+    project_config = [{'name': 'Test Project', 'type': 'Project',
+                       'challenge': {'participant_team': 'Test Team'}}]
+    plan = planner.compile_plan(project_config, teams=teams)
+    assert [[operation.key for operation in wave]
+            for wave in plan.waves()] == [['Test Project'],
+                                          ['Test Project#challenge']]
+
+
+def test_compile_plan_duplicate_invitees():
+    """Test members listed in several invitations are invited once"""
+    config = [{'name': 'Test Team', 'type': 'Team',
+               'can_public_join': False, 'description': 'foo',
+               'invitations': [{'message': 'foo',
+                                'members': [{'principal_id': 1}]},
+                               {'message': 'bar',
+                                'members': [{'principal_id': 1},
+                                            {'principal_id': 2}]}]}]
+    plan = planner.compile_plan(config)
+    assert plan.counts() == {'team': 1, 'invitees': 1, 'invite': 2}
+    assert plan.get('team:Test Team#invite:1').config['message'] == 'foo'
+
+
+def test_execute_plan_recorded():
+    """Test Synapse calls are attributed to the kind of operation"""
+    syn = mock.create_autospec(synapseclient.Synapse)
+    creation_cls = SynapseCreation(syn)
+    config = [{'name': 'Test Project', 'type': 'Project',
+               'children': [{'name': 'Genes', 'type': 'Folder'}]}]
+    plan = planner.compile_plan(config)
+    with patch.object(syn, "store",
+                      side_effect=[
+                          synapseclient.Project(name="Test Project",
+                                                id="syn1"),
+                          synapseclient.Folder(name="Genes", id="syn2",
+                                               parentId="syn1")
+                      ]):
+        planner.execute_plan(plan, creation_cls)
+    resources = creation_cls.recorder.report()['resources']
+    assert resources['project']['count'] == 1
+    assert resources['folder']['count'] == 1
+
+
+def test_execute_plan_queues():
+    """Test the queues of a project are listed once and only missing
+    queues are created"""
+    syn = mock.create_autospec(synapseclient.Synapse)
+    creation_cls = SynapseCreation(syn, only_get=True)
+    config = [{'name': 'Test Project', 'type': 'Project',
+               'evaluations': [{'name': 'Round 1'},
+                               {'name': 'Round 2',
+                                'submission_instructions': 'Submit'}]}]
+    plan = planner.compile_plan(config)
+    assert plan.counts() == {'project': 1, 'evaluations': 1,
+                             'evaluation': 2}
+    existing = synapseclient.Evaluation(name="Round 1", id="1",
+                                        contentSource="syn1")
+    created = synapseclient.Evaluation(name="Round 2", id="2",
+                                       contentSource="syn1")
+    with patch.object(creation_cls, "get_or_create_project",
+                      return_value=synapseclient.Project(id="syn1")),\
+         patch.object(syn, "getEvaluationByContentSource",
+                      return_value=iter([existing])) as patch_list,\
+         patch.object(syn, "store", return_value=created) as patch_store:
+        planner.execute_plan(plan, creation_cls, workers=4)
+        patch_list.assert_called_once_with("syn1")
+        stored = patch_store.call_args[0][0]
+        assert stored.name == "Round 2"
+        assert stored.submissionInstructionsMessage == "Submit"
+    assert [queue['id'] for queue in config[0]['evaluations']] == ["1", "2"]
+
+
+def test_estimate_plan_queues():
+    """Test queues are estimated as one listing and a store each"""
+    config = [{'name': 'Test Project', 'type': 'Project',
+               'evaluations': [{'name': f"Round {index}"}
+                               for index in range(10)]}]
+    plan = planner.compile_plan(config)
+    estimate = planner.estimate_plan(plan, latency=1, workers=10)
+    assert estimate['calls'] == {'store': 11, 'lookup': 1}
+    # The queues are created in one wave
+    assert estimate['wall_time'] == 3
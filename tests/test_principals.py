@@ -0,0 +1,115 @@
+"""Test resolution of user and team names to principal ids"""
+import json
+import os
+import tempfile
+from unittest import mock
+from unittest.mock import patch
+
+import pytest
+import synapseclient
+
+from synapseformation import planner, principals
+from synapseformation.create import SynapseCreation
+from synapseformation.principals import PrincipalResolver
+
+HEADERS = {'jdoe': {'ownerId': '3426116', 'userName': 'jdoe',
+                    'isIndividual': True},
+           'testers': {'ownerId': '3400001', 'userName': 'Testers',
+                       'isIndividual': False}}
+SYN = mock.create_autospec(synapseclient.Synapse)
+CREATE_CLS = SynapseCreation(SYN)
+
+
+def _aliases(method, uri, body):
+    """Answers alias lookups with the known headers"""
+    return {'list': [HEADERS[alias.lower()]
+                     for alias in json.loads(body)['list']
+                     if alias.lower() in HEADERS]}
+
+
+def _template(folders: int = 3) -> list:
+    acl = [{'team_name': 'Testers', 'access_type': ['READ']},
+           {'user_name': 'jdoe', 'access_type': ['READ']}]
+    return [
+        {'name': 'Test Team', 'type': 'Team', 'description': 'Test',
+         'can_public_join': False,
+         'invitations': [{'message': 'Welcome',
+                          'members': [{'user_name': 'jdoe'}]}]},
+        {'name': 'Test', 'type': 'Project', 'acl': list(acl),
+         'children': [{'name': f"Folder {index}", 'type': 'Folder',
+                       'acl': [dict(entry) for entry in acl]}
+                      for index in range(folders)]}
+    ]
+
+
+def test_resolve_template():
+    """Test every name is set to its id with a single lookup"""
+    config = _template()
+    resolver = PrincipalResolver(CREATE_CLS)
+    with patch.object(CREATE_CLS, "_call",
+                      side_effect=_aliases) as patch_call:
+        resolver.resolve_template(config)
+    patch_call.assert_called_once_with(
+        "restPOST", principals.ALIASES_URI,
+        body=json.dumps({'list': ['Testers', 'jdoe']})
+    )
+    assert config[0]['invitations'][0]['members'] == [
+        {'user_name': 'jdoe', 'principal_id': 3426116}
+    ]
+    for folder in config[1]['children']:
+        assert [entry['principal_id'] for entry in folder['acl']] == \
+            [3400001, 3426116]
+    assert resolver.lookups == 2
+    assert resolver.requests == 1
+
+
+def test_resolve_template_batches():
+    """Test names are looked up in batches"""
+    config = [{'name': 'Test', 'type': 'Project',
+               'acl': [{'user_name': f"user{index}",
+                        'access_type': ['READ']} for index in range(250)]}]
+    resolver = PrincipalResolver(CREATE_CLS)
+    with patch.object(CREATE_CLS, "_call",
+                      return_value={'list': []}) as patch_call,\
+            pytest.raises(ValueError, match="Unknown user_name 'user0'"):
+        resolver.resolve_template(config)
+    assert patch_call.call_count == 3
+
+
+def test_resolve_template_type():
+    """Test a team can't be named as a user"""
+    config = [{'name': 'Test', 'type': 'Project',
+               'acl': [{'user_name': 'Testers', 'access_type': ['READ']}]}]
+    with patch.object(CREATE_CLS, "_call", side_effect=_aliases),\
+            pytest.raises(ValueError, match="'Testers' is not a user"):
+        PrincipalResolver(CREATE_CLS).resolve_template(config)
+    assert 'principal_id' not in config[0]['acl'][0]
+
+
+def test_resolve_template_cache():
+    """Test resolved names are cached on disk until they expire"""
+    now = [1000.0]
+    with tempfile.TemporaryDirectory() as tempdir:
+        cache_path = os.path.join(tempdir, "cache", "principals.json")
+        with patch.object(CREATE_CLS, "_call",
+                          side_effect=_aliases) as patch_call:
+            PrincipalResolver(CREATE_CLS, cache_path=cache_path,
+                              clock=lambda: now[0]).resolve_template(
+                                  _template())
+            config = _template()
+            resolver = PrincipalResolver(CREATE_CLS, cache_path=cache_path,
+                                         max_age=60, clock=lambda: now[0])
+            resolver.resolve_template(config)
+            assert patch_call.call_count == 1
+            assert resolver.lookups == 0
+            assert config[1]['acl'][1]['principal_id'] == 3426116
+            now[0] += 61
+            resolver.resolve_template(_template())
+            assert patch_call.call_count == 2
+
+
+def test_estimate_plan_principals():
+    """Test the names of a plan are estimated as one lookup"""
+    plan = planner.compile_plan(_template(folders=500))
+    estimate = planner.estimate_plan(plan)
+    assert estimate['calls']['principals'] == 1
@@ -0,0 +1,177 @@
+"""Test adaptive rate limiting"""
+import os
+import tempfile
+from unittest.mock import Mock
+
+import pytest
+from synapseclient.core.exceptions import SynapseHTTPError
+
+from synapseformation.ratelimit import RateLimiter, SharedRateLimiter
+
+
+class FakeClock:
+    """Clock that only moves when sleeping"""
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _limiter(**kwargs):
+    clock = FakeClock()
+    return RateLimiter(clock=clock, sleep=clock.sleep, **kwargs), clock
+
+
+def _throttle(status_code=429, retry_after=None):
+    headers = {} if retry_after is None else {'Retry-After': retry_after}
+    response = Mock(status_code=status_code, headers=headers)
+    return SynapseHTTPError("throttled", response=response)
+
+
+def test_acquire_rate():
+    """Test calls are spaced by the rate"""
+    limiter, clock = _limiter(rate=2, increase=0)
+    for _ in range(5):
+        limiter.acquire()
+    assert clock.now == pytest.approx(2)
+
+
+def test_call_increases_rate():
+    """Test the rate grows additively after successful calls"""
+    limiter, _ = _limiter(rate=2, increase=0.5, max_rate=3)
+    assert limiter.call(lambda value: value, 1) == 1
+    assert limiter.rate == 2.5
+    limiter.call(lambda: None)
+    limiter.call(lambda: None)
+    assert limiter.rate == 3
+
+
+def test_call_retry_after():
+    """Test throttled calls are retried after Retry-After"""
+    limiter, clock = _limiter(rate=8, increase=0)
+    func = Mock(side_effect=[_throttle(retry_after="3"), "done"])
+    assert limiter.call(func) == "done"
+    assert func.call_count == 2
+    assert limiter.rate == 4
+    assert limiter.throttles == 1
+    assert limiter.retries == 1
+    assert clock.now >= 3
+
+
+def test_call_backoff():
+    """Test retries back off exponentially without Retry-After"""
+    limiter, clock = _limiter(rate=100, min_rate=10, increase=0,
+                              backoff=1)
+    func = Mock(side_effect=[_throttle(503), _throttle(503), "done"])
+    assert limiter.call(func) == "done"
+    assert 1 in clock.sleeps and 2 in clock.sleeps
+    assert limiter.rate == 25
+
+
+def test_call_gives_up():
+    """Test throttled calls fail after max_retries"""
+    limiter, _ = _limiter(max_retries=2, backoff=0)
+    func = Mock(side_effect=_throttle())
+    with pytest.raises(SynapseHTTPError):
+        limiter.call(func)
+    assert func.call_count == 3
+    assert limiter.rate == 2.5
+
+
+def test_call_other_errors():
+    """Test errors other than throttling are raised immediately"""
+    limiter, _ = _limiter()
+    func = Mock(side_effect=_throttle(status_code=409))
+    with pytest.raises(SynapseHTTPError):
+        limiter.call(func)
+    func.assert_called_once()
+    assert limiter.throttles == 0
+
+
+def _session_syn():
+    syn = Mock()
+    syn._requests_session.hooks = {'response': []}
+    syn._requests_session.send.return_value = Mock(status_code=200)
+    return syn
+
+
+def test_observe():
+    """Test throttled responses of a connection lower the rate"""
+    limiter, _ = _limiter(rate=4)
+    syn = _session_syn()
+    limiter.observe(syn)
+    hook = syn._requests_session.hooks['response'][0]
+    hook(Mock(status_code=200, headers={}))
+    assert limiter.rate == 4
+    hook(Mock(status_code=429, headers={'Retry-After': "1"}))
+    assert limiter.rate == 2
+
+
+def test_observe_requests():
+    """Test every request of an observed connection takes a token"""
+    limiter, clock = _limiter(rate=2, increase=0)
+    syn = _session_syn()
+    send = syn._requests_session.send
+    limiter.observe(syn)
+
+    def _listing():
+        # A call sending five requests
+        for _ in range(5):
+            syn._requests_session.send(Mock())
+
+    limiter.call(_listing)
+    assert send.call_count == 5
+    assert clock.now == pytest.approx(2)
+
+
+def test_observe_call_throttled():
+    """Test throttled calls of an observed connection are neither
+    retried nor counted again"""
+    limiter, _ = _limiter(rate=4)
+    limiter.observe(_session_syn())
+    func = Mock(side_effect=_throttle())
+    with pytest.raises(SynapseHTTPError):
+        limiter.call(func)
+    func.assert_called_once()
+    assert limiter.throttles == 0
+    assert limiter.rate == 4
+
+
+def test_observe_again():
+    """Test observing a connection again replaces the limiter"""
+    first, _ = _limiter(rate=4)
+    second, _ = _limiter(rate=4)
+    syn = _session_syn()
+    first.observe(syn)
+    second.observe(syn)
+    hooks = syn._requests_session.hooks['response']
+    assert len(hooks) == 1
+    hooks[0](Mock(status_code=429, headers={}))
+    assert first.rate == 4
+    assert second.rate == 2
+
+
+def test_shared_rate_limiter():
+    """Test limiters on one database share the bucket and the rate"""
+    clock = FakeClock()
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, "rate.db")
+        first = SharedRateLimiter(path, rate=2, increase=0, clock=clock,
+                                  sleep=clock.sleep)
+        second = SharedRateLimiter(path, rate=100, increase=0, clock=clock,
+                                   sleep=clock.sleep)
+        # The second limiter uses the bucket created by the first
+        for limiter in (first, second, first, second, first):
+            limiter.acquire()
+        assert clock.now == pytest.approx(2)
+        first.on_throttle()
+        second.acquire()
+        assert second.rate == 1
+        first.close()
+        second.close()
@@ -0,0 +1,216 @@
+"""Test state of applied templates"""
+import copy
+import json
+import os
+import tempfile
+from unittest import mock
+from unittest.mock import patch
+
+import synapseclient
+
+from synapseformation import planner, state
+from synapseformation.create import SynapseCreation
+
+CONFIG = [{
+    'name': 'Test Project',
+    'type': 'Project',
+    'children': [{'name': 'Genes', 'type': 'Folder'}]
+}]
+
+
+def _apply(creation_cls, apply_state, config, project=None):
+    """Applies a template against mocked creation methods"""
+    plan = planner.compile_plan(config)
+    if project is None:
+        project = synapseclient.Project(name="Test Project", id="syn1",
+                                        modifiedOn="a")
+    with patch.object(creation_cls, "get_or_create_project",
+                      return_value=project) as patch_project,\
+         patch.object(creation_cls, "get_or_create_folder",
+                      return_value=synapseclient.Folder(
+                          name="Genes", id="syn2", parentId="syn1",
+                          modifiedOn="b"
+                      )) as patch_folder:
+        planner.execute_plan(plan, creation_cls, state=apply_state)
+    apply_state.save()
+    return patch_project, patch_folder
+
+
+def test_content_hash_ignores_ids():
+    """Test ids written during a run don't change the hash"""
+    config = copy.deepcopy(CONFIG[0])
+    config['id'] = "syn1"
+    config['children'][0]['id'] = "syn2"
+    assert state.content_hash(config) == state.content_hash(CONFIG[0])
+
+
+def _syn(headers):
+    """Mocked Synapse answering batched lookups of entity headers with
+    the name and modifiedOn of the entities by id"""
+    syn = mock.create_autospec(synapseclient.Synapse)
+
+    def _post(uri, body):
+        references = json.loads(body)['references']
+        return {'results': [
+            {'id': reference['targetId'],
+             'name': headers[reference['targetId']][0],
+             'modifiedOn': headers[reference['targetId']][1]}
+            for reference in references if reference['targetId'] in headers
+        ]}
+
+    syn.restPOST.side_effect = _post
+    return syn
+
+
+def _headers():
+    return {'syn1': ("Test Project", "a"), 'syn2': ("Genes", "b")}
+
+
+def test_apply_state_skips_unchanged():
+    """Test unchanged resources are skipped on the next apply"""
+    syn = _syn(_headers())
+    creation_cls = SynapseCreation(syn)
+    with tempfile.TemporaryDirectory() as tempdir:
+        state_path = os.path.join(tempdir, "state.json")
+        first_state = state.ApplyState(state_path, "template.yaml")
+        _apply(creation_cls, first_state, copy.deepcopy(CONFIG))
+        with open(state_path) as state_f:
+            records = json.load(state_f)[os.path.abspath("template.yaml")]
+        assert records['Test Project'] == {
+            'id': "syn1", 'version': "a",
+            'hash': state.content_hash(CONFIG[0])
+        }
+        assert records['Test Project/Genes']['version'] == "b"
+        syn.restPOST.assert_not_called()
+
+        config = copy.deepcopy(CONFIG)
+        second_state = state.ApplyState(state_path, "template.yaml")
+        patch_project, patch_folder = _apply(creation_cls, second_state,
+                                             config)
+        patch_project.assert_not_called()
+        patch_folder.assert_not_called()
+        # Every resource is checked with one batched lookup
+        syn.restPOST.assert_called_once_with(
+            state.ENTITY_HEADERS_URI,
+            body=json.dumps({'references': [{'targetId': "syn1"},
+                                            {'targetId': "syn2"}]})
+        )
+        syn.restGET.assert_not_called()
+        syn.getChildren.assert_not_called()
+        assert config[0]['id'] == "syn1"
+        assert config[0]['children'][0]['id'] == "syn2"
+
+
+def test_apply_state_missing_version():
+    """Test resources returned without their version are looked up
+    together when the state is saved"""
+    syn = _syn(_headers())
+    creation_cls = SynapseCreation(syn)
+    with tempfile.TemporaryDirectory() as tempdir:
+        state_path = os.path.join(tempdir, "state.json")
+        _apply(creation_cls, state.ApplyState(state_path, "template.yaml"),
+               copy.deepcopy(CONFIG),
+               project=synapseclient.Project(name="Test Project",
+                                             id="syn1"))
+        syn.restPOST.assert_called_once()
+        with open(state_path) as state_f:
+            records = json.load(state_f)[os.path.abspath("template.yaml")]
+        assert records['Test Project']['version'] == "a"
+
+
+def test_apply_state_changed_template():
+    """Test changed template nodes are applied again"""
+    creation_cls = SynapseCreation(_syn(_headers()))
+    with tempfile.TemporaryDirectory() as tempdir:
+        state_path = os.path.join(tempdir, "state.json")
+        _apply(creation_cls, state.ApplyState(state_path, "template.yaml"),
+               copy.deepcopy(CONFIG))
+        config = copy.deepcopy(CONFIG)
+        config[0]['children'][0]['name'] = "Assays"
+        patch_project, patch_folder = _apply(
+            creation_cls, state.ApplyState(state_path, "template.yaml"),
+            config
+        )
+        # The folder changed but its project didn't
+        patch_project.assert_not_called()
+        patch_folder.assert_called_once_with(name="Assays",
+                                             parentId="syn1")
+
+
+def test_apply_state_deleted_child():
+    """Test a folder deleted in Synapse is created again although its
+    project is unchanged"""
+    headers = _headers()
+    creation_cls = SynapseCreation(_syn(headers))
+    with tempfile.TemporaryDirectory() as tempdir:
+        state_path = os.path.join(tempdir, "state.json")
+        _apply(creation_cls, state.ApplyState(state_path, "template.yaml"),
+               copy.deepcopy(CONFIG))
+        del headers['syn2']
+        patch_project, patch_folder = _apply(
+            creation_cls, state.ApplyState(state_path, "template.yaml"),
+            copy.deepcopy(CONFIG)
+        )
+        patch_project.assert_not_called()
+        patch_folder.assert_called_once()
+
+
+def test_apply_state_acl_applied():
+    """Test ACLs are applied even when their entity is skipped"""
+    creation_cls = SynapseCreation(_syn(_headers()))
+    config = copy.deepcopy(CONFIG)
+    config[0]['children'][0]['acl'] = [{'principal_id': 1,
+                                        'access_type': ['READ']}]
+    with tempfile.TemporaryDirectory() as tempdir, \
+            patch.object(creation_cls, "set_acl") as patch_acl:
+        state_path = os.path.join(tempdir, "state.json")
+        _apply(creation_cls, state.ApplyState(state_path, "template.yaml"),
+               copy.deepcopy(config))
+        _, patch_folder = _apply(
+            creation_cls, state.ApplyState(state_path, "template.yaml"),
+            copy.deepcopy(config)
+        )
+        patch_folder.assert_not_called()
+        assert patch_acl.call_count == 2
+
+
+def test_apply_state_modified():
+    """Test resources modified in Synapse are applied again"""
+    headers = _headers()
+    creation_cls = SynapseCreation(_syn(headers))
+    with tempfile.TemporaryDirectory() as tempdir:
+        state_path = os.path.join(tempdir, "state.json")
+        _apply(creation_cls, state.ApplyState(state_path, "template.yaml"),
+               copy.deepcopy(CONFIG))
+        headers['syn1'] = ("Test Project", "modified")
+        headers['syn2'] = ("Renamed", "b")
+        patch_project, patch_folder = _apply(
+            creation_cls, state.ApplyState(state_path, "template.yaml"),
+            copy.deepcopy(CONFIG)
+        )
+        patch_project.assert_called_once()
+        patch_folder.assert_called_once()
+
+
+def test_apply_state_team():
+    """Test teams are checked with a batched lookup of their etags"""
+    syn = mock.create_autospec(synapseclient.Synapse)
+    syn.restPOST.return_value = {'list': [{'id': 3, 'name': "Test Team",
+                                           'etag': "c"}]}
+    creation_cls = SynapseCreation(syn)
+    config = [{'name': 'Test Team', 'type': 'Team', 'description': 'foo',
+               'can_public_join': False}]
+    team = synapseclient.Team(name="Test Team", id=3, etag="c")
+    with tempfile.TemporaryDirectory() as tempdir, \
+            patch.object(creation_cls, "get_or_create_team",
+                         return_value=team) as patch_team:
+        state_path = os.path.join(tempdir, "state.json")
+        for _ in range(2):
+            apply_state = state.ApplyState(state_path, "template.yaml")
+            planner.execute_plan(planner.compile_plan(copy.deepcopy(config)),
+                                 creation_cls, state=apply_state)
+            apply_state.save()
+        patch_team.assert_called_once()
+        syn.restPOST.assert_called_once_with(
+            state.TEAM_LIST_URI, body=json.dumps({'list': [3]})
+        )
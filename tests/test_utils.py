@@ -1,15 +1,21 @@
 """Test utility functions"""
+from http.server import BaseHTTPRequestHandler, HTTPServer
 import json
+import os
+from socketserver import ThreadingMixIn
 import tempfile
+import threading
 from unittest import mock
 from unittest.mock import patch, Mock
 
 import pytest
+import requests
 import synapseclient
 from synapseclient.core.exceptions import (
     SynapseAuthenticationError,
     SynapseNoCredentialsError,
 )
+import yaml
 
 from synapseformation import utils
 
@@ -33,6 +39,20 @@ def test_read_config_json():
         assert json_dict == expected
 
 
+def test_find_templates():
+    """Test templates are found in directories and by glob patterns"""
+    with tempfile.TemporaryDirectory() as tempdir:
+        for name in ("b.yaml", "a.json", "notes.txt"):
+            open(os.path.join(tempdir, name), "w").close()
+        pattern = os.path.join(tempdir, "*.yaml")
+        assert utils.find_templates([tempdir, pattern, "other.yaml"]) == [
+            os.path.join(tempdir, "a.json"), os.path.join(tempdir, "b.yaml"),
+            "other.yaml"
+        ]
+        with pytest.raises(ValueError, match="No templates found"):
+            utils.find_templates([os.path.join(tempdir, "*.yml")])
+
+
 def test_synapse_login_default():
     """Test default synapse login config path"""
     syn = Mock()
@@ -71,3 +91,141 @@ def test_synapse_login_error(error):
          pytest.raises(ValueError,
                        match=r"Login error: please make sure you .*"):
         utils.synapse_login()
+
+
+def test_read_config_c_loader():
+    """Test the libyaml loader is used when it is available"""
+    if yaml.__with_libyaml__:
+        assert utils.SafeLoader is yaml.CSafeLoader
+
+
+def test_iter_config():
+    """Test top level resources are yielded one at a time"""
+    test_yaml = ("- &folder\n"
+                 "  name: foo\n"
+                 "  type: Folder\n"
+                 "- name: bar\n"
+                 "  type: Project\n"
+                 "  children:\n"
+                 "  - *folder\n"
+                 "  - <<: *folder\n"
+                 "    name: baz\n")
+    mock_open = mock.mock_open(read_data=test_yaml)
+    with mock.patch("builtins.open", mock_open):
+        resources = utils.iter_config('file')
+        assert next(resources) == {'name': 'foo', 'type': 'Folder'}
+        assert list(resources) == [
+            {'name': 'bar', 'type': 'Project',
+             'children': [{'name': 'foo', 'type': 'Folder'},
+                          {'name': 'baz', 'type': 'Folder'}]}
+        ]
+
+
+def test_iter_config_matches_read_config():
+    """Test streamed resources match the fully loaded template"""
+    expected = [{'name': 'foo', 'type': 'Project', 'children': []},
+                {'name': 'bar', 'type': 'Team'}]
+    mock_open = mock.mock_open(read_data=json.dumps(expected))
+    with mock.patch("builtins.open", mock_open):
+        assert list(utils.iter_config('file')) == utils.read_config('file')
+
+
+def test_iter_config_not_list():
+    """Test only lists of resources can be streamed"""
+    mock_open = mock.mock_open(read_data="foo")
+    with mock.patch("builtins.open", mock_open),\
+         pytest.raises(ValueError, match="file must be a list of resources"):
+        list(utils.iter_config('file'))
+
+
+def test_iter_config_no_resources():
+    """Test mappings must list resources under the Resources key"""
+    mock_open = mock.mock_open(read_data="Test:\n  name: foo")
+    with mock.patch("builtins.open", mock_open),\
+         pytest.raises(ValueError, match="file has no 'Resources' key"):
+        list(utils.iter_config('file'))
+
+
+def test_iter_prefetched():
+    """Test items and errors are passed through from the thread"""
+    assert list(utils.iter_prefetched(range(5), size=2)) == list(range(5))
+
+    def _fail():
+        yield 1
+        raise KeyError("foo")
+
+    items = utils.iter_prefetched(_fail())
+    assert next(items) == 1
+    with pytest.raises(KeyError, match="foo"):
+        next(items)
+
+
+def test_iter_config_resources_key():
+    """Test resources under the Resources key can refer to anchors"""
+    test_yaml = ("Anchors:\n"
+                 "  folder: &folder\n"
+                 "    name: foo\n"
+                 "Resources:\n"
+                 "- name: bar\n"
+                 "  children:\n"
+                 "  - *folder\n")
+    mock_open = mock.mock_open(read_data=test_yaml)
+    with mock.patch("builtins.open", mock_open):
+        assert list(utils.iter_config('file')) == [
+            {'name': 'bar', 'children': [{'name': 'foo'}]}
+        ]
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.mark.parametrize("keep_alive,connections", [(True, 1), (False, 4)])
+def test_mount_pool(keep_alive, connections):
+    """Test connections of the mounted pool are reused"""
+    server = _Server(("127.0.0.1", 0), _KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    syn = Mock()
+    syn._requests_session = requests.Session()
+    adapter = utils.mount_pool(syn, pool_size=2, keep_alive=keep_alive)
+    assert syn._requests_session.get_adapter("https://") is adapter
+    url = "http://127.0.0.1:{}/".format(server.server_address[1])
+    for _ in range(4):
+        syn._requests_session.get(url)
+    server.shutdown()
+    server.server_close()
+    assert utils.connection_stats(syn) == {
+        'requests': 4, 'connections': connections,
+        'reused': 4 - connections
+    }
+
+
+def test_connection_stats_no_pool():
+    """Test there are no stats without a mounted pool"""
+    syn = Mock()
+    syn._requests_session = requests.Session()
+    assert utils.connection_stats(syn) is None
+
+
+def test_synapse_login_pool_size():
+    """Test a pool is mounted before logging in"""
+    syn = Mock()
+    with patch.object(synapseclient, "Synapse", return_value=syn),\
+         patch.object(utils, "mount_pool") as patch_mount:
+        utils.synapse_login(pool_size=32)
+        patch_mount.assert_called_once_with(syn, pool_size=32,
+                                            keep_alive=True)
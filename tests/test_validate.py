@@ -0,0 +1,131 @@
+"""Test template validation"""
+import pytest
+
+from synapseformation import validate
+
+TEAM = {'name': 'Test Team', 'type': 'Team', 'can_public_join': False,
+        'description': 'Test team description',
+        'invitations': [{'message': 'Welcome',
+                         'members': [{'principal_id': 3426116},
+                                     {'email': 'test@sagebase.org'}]}]}
+PROJECT = {'name': 'Test Project', 'type': 'Project',
+           'acl': [{'principal_id': 1111111, 'access_type': ['READ']}],
+           'challenge': {'participant_team': 'Test Team'},
+           'children': [{'name': 'Genes', 'type': 'Folder',
+                         'children': [{'name': 'testing',
+                                       'type': 'Folder'}]},
+                        {'name': 'Data', 'type': 'Folder'}]}
+
+
+def test_validate_template_valid():
+    """Test a valid template has no errors"""
+    assert validate.validate_template([PROJECT, TEAM]) == []
+
+
+@pytest.mark.parametrize("config,error", [
+    ({'name': 'Test Team', 'type': 'Team', 'description': 'foo'},
+     "Test Team: missing 'can_public_join'"),
+    ({'name': 'Test', 'type': 'Projet'}, "Test: unknown type 'Projet'"),
+    ({'name': 'Test', 'type': 'Project', 'childern': []},
+     "Test: unknown key 'childern'"),
+    ({'name': 'Test', 'type': 'Project', 'acl': {'principal_id': 1}},
+     "Test: 'acl' must be a list"),
+    ({'name': 'Test', 'type': 'Project',
+      'acl': [{'principal_id': 'everyone', 'access_type': ['READ']}]},
+     "Test: ACL principal_id must be a number, not 'everyone'"),
+    ({'name': 'Test', 'type': 'Project',
+      'acl': [{'user_name': 'jdoe', 'team_name': 'Testers',
+               'access_type': ['READ']}]},
+     "Test: ACL entries need one of principal_id, user_name, team_name"),
+    ({'name': 'Test', 'type': 'Project',
+      'acl': [{'team_name': '', 'access_type': ['READ']}]},
+     "Test: ACL team_name must be a name"),
+    ({'name': 'Test', 'type': 'Project',
+      'children': [{'name': 'Genes', 'type': 'Folder'},
+                   {'name': 'Genes', 'type': 'Folder'}]},
+     "Test/Genes: duplicate name"),
+    ({'name': 'Test', 'type': 'Project',
+      'children': [{'name': 'Other', 'type': 'Project'}]},
+     "Test/Other: a Project can't be a child"),
+    ({'name': 'Test', 'type': 'Project',
+      'challenge': {'participant_team': 'Missing'}},
+     "Test: participant team 'Missing' is not in the template"),
+    ({'type': 'Folder'}, "[0]: missing 'name'"),
+    ({'name': 'Test', 'type': 'Project',
+      'evaluations': [{'name': 'Round 1', 'descripton': 'foo'}]},
+     "Test#evaluation:Round 1: unknown key 'descripton'"),
+    ({'name': 'Test', 'type': 'Project',
+      'evaluations': [{'description': 'foo'}]},
+     "Test#evaluations[0]: missing 'name'")
+])
+def test_validate_template_errors(config, error):
+    """Test errors are reported with the path of the resource"""
+    assert validate.validate_template([config]) == [error]
+
+
+def test_validate_template_invitations():
+    """Test invited members need a principal id, user name or email"""
+    team = dict(TEAM, invitations=[{'message': 'Welcome',
+                                    'members': [{}]}])
+    errors = validate.validate_template([team])
+    assert errors == ["Test Team: invited members need one of "
+                      "principal_id, user_name, email, not {}"]
+
+
+def test_validate_template_names():
+    """Test principals can be named instead of given by id"""
+    team = dict(TEAM, invitations=[{'message': 'Welcome',
+                                    'members': [{'user_name': 'jdoe'}]}])
+    project = {'name': 'Test', 'type': 'Project',
+               'acl': [{'team_name': 'Testers', 'access_type': ['READ']},
+                       {'user_name': 'jdoe', 'access_type': ['READ']}]}
+    assert validate.validate_template([team, project]) == []
+
+
+def test_check_template():
+    """Test the errors of an invalid template are raised together"""
+    config = [{'name': f"Test {index}", 'type': 'Projet'}
+              for index in range(25)]
+    with pytest.raises(ValueError, match="Invalid template with 25 "
+                       "errors:\n  Test 0: unknown type 'Projet'") as err:
+        validate.check_template(config)
+    assert str(err.value).endswith("and 5 more")
+
+
+def test_validate_template_queue_names():
+    """Test queue names are unique across the template"""
+    config = [{'name': f"Test {index}", 'type': 'Project',
+               'evaluations': [{'name': 'Round 1'}]} for index in range(2)]
+    assert validate.validate_template(config) == [
+        "Test 1#evaluation:Round 1: duplicate evaluation name"
+    ]
+
+
+def test_validate_template_seen_names():
+    """Test names are unique across resources validated one at a time"""
+    seen_names = {}
+    assert validate.validate_template(
+        [{'name': 'Dup', 'type': 'Project'}, TEAM], seen_names=seen_names
+    ) == []
+    assert validate.validate_template(
+        [{'name': 'Dup', 'type': 'Project'}], seen_names=seen_names
+    ) == ["Dup: duplicate name"]
+    assert validate.validate_template(
+        [TEAM], seen_names=seen_names
+    ) == [f"{TEAM['name']}: duplicate team name"]
+
+
+def test_validate_template_seen_teams():
+    """Test challenges validated one resource at a time can only use the
+    teams before them"""
+    project = {'name': 'Test', 'type': 'Project',
+               'challenge': {'participant_team': TEAM['name']}}
+    seen_names = {}
+    assert validate.validate_template([project], seen_names=seen_names) == [
+        f"Test: participant team '{TEAM['name']}' is not in the template"
+    ]
+    seen_names = {}
+    assert validate.validate_template([TEAM], seen_names=seen_names) == []
+    assert validate.validate_template(
+        [dict(project, name='Other')], seen_names=seen_names
+    ) == []